@@ -0,0 +1,206 @@
+import argparse
+import logging
+import os
+import random
+import shutil
+import tempfile
+from dataclasses import dataclass
+from glob import glob
+from os.path import basename, dirname, join, splitext
+
+from baselines import task1, task2
+from scorer import gold_cache, result_cache
+from scorer import task1 as scorer_task1
+from scorer import task2 as scorer_task2
+from scorer.pool import pool_map
+"""
+Leave-one-debate-out cross-validation of the baselines.
+
+Each debate of a task and a language is the test debate of a fold, and the baseline is trained on all other debates.
+The folds of all tasks, languages and baselines are run in a pool of worker processes and scored with the scorer
+of the task. The metrics are reported for each fold and as their means over the folds.
+
+The folds do not pickle the data of the debates to the workers. Each debate is parsed into the gold cache
+and its term counts for the ngram baseline are stored in the feature store once, before the folds are run.
+The workers memory-map the parsed columns and the stored counts, so all folds using a debate share its data
+through the page cache. Without a cache directory (see gold_cache.set_cache_dir) a temporary one is used.
+"""
+
+logger = logging.getLogger(__name__)
+
+TASKS = [1, 2]
+LANGUAGES = ['English', 'Arabic']
+BASELINES = ['random', 'ngram', 'hashing']
+_TASK_MODULES = {1: task1, 2: task2}
+_SCORER_MODULES = {1: scorer_task1, 2: scorer_task2}
+
+
+@dataclass
+class FoldResult:
+    """
+    Metrics of a fold, i.e. of a baseline trained on all debates but test_debate.
+    pred_file is the file with its predictions, None if it was not kept.
+    metrics is a {metric:value} dict of the MAIN_METRICS of the scorer of the task.
+    """
+    __slots__ = ('test_debate', 'pred_file', 'metrics')
+    test_debate: str
+    pred_file: str
+    metrics: dict
+
+
+@dataclass
+class CrossValidationResult:
+    """
+    Results of the folds of a baseline for a task and a language.
+    folds holds the FoldResult of each debate, in the order of the debates, and mean - the {metric:value} dict
+    of the means of their metrics over the folds.
+    """
+    __slots__ = ('task', 'language', 'baseline', 'folds', 'mean')
+    task: int
+    language: str
+    baseline: str
+    folds: list
+    mean: dict
+
+
+def debate_fpaths(task, lang, data_dir=None):
+    """ :return: sorted list with the gold files of the debates of a task and a language. """
+    data_dir = join(dirname(dirname(__file__)), 'data') if data_dir is None else data_dir
+    return sorted(glob(join(data_dir, 'task{}'.format(task), lang, 'Task{}-{}-*.txt'.format(task, lang))))
+
+
+def _init_worker(cache_dir, store_path, max_entries):
+    gold_cache.set_cache_dir(cache_dir)
+    result_cache.set_store(store_path, max_entries)
+
+
+def _prepare_debate(task, debate_fpath, ngram):
+    """ Parses a debate into the gold cache and stores its term counts, if the ngram baseline is run. """
+    gold_cache.load_gold(debate_fpath, task)
+    if ngram:
+        _TASK_MODULES[task].store_ngram_counts(debate_fpath)
+
+
+def _run_fold(task, baseline, train_debates, test_debate, pred_fpath):
+    """ Runs a baseline on a fold and scores its predictions. :return: {metric:value} dict. """
+    module = _TASK_MODULES[task]
+    if baseline == 'random':
+        # Each fold is seeded, so that the predictions do not depend on the worker running it.
+        random.seed(0)
+        module.run_random_baseline(test_debate, pred_fpath)
+    elif baseline == 'ngram':
+        module.run_ngram_baseline(train_debates, test_debate, pred_fpath)
+    else:
+        module.run_hashing_baseline(train_debates, test_debate, pred_fpath)
+
+    if task == 1:
+        metrics = scorer_task1.score([test_debate], [pred_fpath]).debates[0]
+        values = [metrics.avg_precision, metrics.reciprocal_rank, metrics.r_precision] + \
+                 [metrics.precision_at[th] for th in scorer_task1.MAIN_THRESHOLDS]
+        return dict(zip(scorer_task1.MAIN_METRICS, values))
+    metrics = scorer_task2.score([test_debate], [pred_fpath]).metrics
+    return {metric: getattr(metrics, metric) for metric in scorer_task2.MAIN_METRICS}
+
+
+def cross_validate(tasks=TASKS, languages=LANGUAGES, baselines=BASELINES, workers=1, results_dir=None,
+                   data_dir=None):
+    """
+    Runs the leave-one-debate-out folds of the baselines and scores them.
+    :param tasks: list of the tasks (1 and/or 2).
+    :param languages: list of the languages.
+    :param baselines: list of the baselines, out of BASELINES.
+    :param workers: number of worker processes, which run the folds. The results do not depend on it.
+    :param results_dir: directory for the pred files of the folds; a temporary directory, which is removed, if None.
+    :param data_dir: directory with the task1 and task2 gold data; the data directory of the repository by default.
+    :return: list with the CrossValidationResult of each (task, language, baseline), in the order of the arguments.
+    :raises ValueError: on an unknown baseline or if a task and a language have less than two debates.
+    """
+    for baseline in baselines:
+        if baseline not in BASELINES:
+            raise ValueError('Unknown baseline {}, use one of: {}'.format(baseline, ', '.join(BASELINES)))
+    debates = {}
+    for task in tasks:
+        for lang in languages:
+            debates[task, lang] = debate_fpaths(task, lang, data_dir)
+            if len(debates[task, lang]) < 2:
+                raise ValueError('Task {} has less than two debates in {}'.format(task, lang))
+
+    cache_dir = previous_cache_dir = gold_cache.get_cache_dir()
+    tmp_cache_dir = tmp_results_dir = None
+    if cache_dir is None:
+        cache_dir = tmp_cache_dir = tempfile.mkdtemp(prefix='clef2018-cv-cache-')
+    if results_dir is None:
+        results_dir = tmp_results_dir = tempfile.mkdtemp(prefix='clef2018-cv-')
+    elif not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    initargs = (cache_dir,) + tuple(result_cache.get_store())
+
+    try:
+        # Each debate is parsed and vectorized once, before its data is shared by the folds.
+        prepared = [(task, debate_fpath) for (task, _), fpaths in debates.items() for debate_fpath in fpaths]
+        pool_map(_prepare_debate, [task for task, _ in prepared], [fpath for _, fpath in prepared],
+                 ['ngram' in baselines] * len(prepared), workers=workers, initializer=_init_worker, initargs=initargs)
+
+        groups = []
+        folds = []
+        for task in tasks:
+            for lang in languages:
+                for baseline in baselines:
+                    groups.append((task, lang, baseline))
+                    for test_debate in debates[task, lang]:
+                        train_debates = [fpath for fpath in debates[task, lang] if fpath != test_debate]
+                        pred_fpath = join(results_dir, 'task{}_{}_baseline_{}.txt'.format(
+                            task, baseline, splitext(basename(test_debate))[0]))
+                        folds.append((task, baseline, train_debates, test_debate, pred_fpath))
+        fold_metrics = pool_map(_run_fold, *zip(*folds), workers=workers, initializer=_init_worker,
+                                initargs=initargs)
+    finally:
+        gold_cache.set_cache_dir(previous_cache_dir)
+        if tmp_cache_dir is not None:
+            shutil.rmtree(tmp_cache_dir, ignore_errors=True)
+        if tmp_results_dir is not None:
+            shutil.rmtree(tmp_results_dir, ignore_errors=True)
+
+    results = []
+    fold_idx = 0
+    for task, lang, baseline in groups:
+        fold_results = []
+        for test_debate in debates[task, lang]:
+            pred_fpath = folds[fold_idx][4] if tmp_results_dir is None else None
+            fold_results.append(FoldResult(test_debate, pred_fpath, fold_metrics[fold_idx]))
+            fold_idx += 1
+        metric_names = _SCORER_MODULES[task].MAIN_METRICS
+        mean = {metric: sum([fold.metrics[metric] for fold in fold_results]) / len(fold_results)
+                for metric in metric_names}
+        results.append(CrossValidationResult(task, lang, baseline, fold_results, mean))
+    return results
+
+
+def print_results(results):
+    for result in results:
+        metric_names = _SCORER_MODULES[result.task].MAIN_METRICS
+        names = [splitext(basename(fold.test_debate))[0] for fold in result.folds]
+        name_width = max([len(name) for name in names] + [len('MEAN')])
+        row_format = '{:<' + str(name_width) + '}' + '{:>16}' * len(metric_names)
+
+        logger.info('{:=^120}'.format(' TASK {} - {} - {} BASELINE '.format(
+            result.task, result.language.upper(), result.baseline.upper())))
+        logger.info(row_format.format('TEST DEBATE', *[metric.upper() for metric in metric_names]))
+        for name, fold in zip(names, result.folds):
+            logger.info(row_format.format(name, *['{:.4f}'.format(fold.metrics[metric]) for metric in metric_names]))
+        logger.info(row_format.format('MEAN', *['{:.4f}'.format(result.mean[metric]) for metric in metric_names]))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Leave-one-debate-out cross-validation of the baselines.')
+    parser.add_argument("--tasks", help="Tasks to run.", type=int, nargs='+', choices=TASKS, default=TASKS)
+    parser.add_argument("--languages", help="Languages to run.", nargs='+', choices=LANGUAGES, default=LANGUAGES)
+    parser.add_argument("--baselines", help="Baselines to run.", nargs='+', choices=BASELINES, default=BASELINES)
+    parser.add_argument("--workers", help="Number of worker processes, which run the folds in parallel.", type=int,
+                        default=os.cpu_count() or 1)
+    parser.add_argument("--results_dir", help="Directory for the pred files of the folds, which are not kept "
+                                              "by default.", type=str, default=None)
+    args = parser.parse_args()
+
+    print_results(cross_validate(args.tasks, args.languages, args.baselines, args.workers, args.results_dir))
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from numbers import Integral
+from os.path import isdir, join
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+
+from scorer import gold_cache
+"""
+Store of the term counts of the debates, from which the TF-IDF features of the baselines are built.
+
+The texts of each debate are analyzed into terms (e.g. n-grams) only once: the term counts are saved as the .npy
+arrays of a sparse CSR matrix with the vocabulary of the debate, under the hash of the texts and the parameters
+of the analysis. The arrays are memory-mapped when loaded, so processes using the counts of the same debate,
+e.g. the folds of a cross-validation, share them instead of each holding a copy.
+The TF-IDF features of a split are then assembled from the counts of its debates, so later runs, other splits and
+sweeps over the weighting (norm, sublinear_tf, ...) or over the classifier do not analyze any text again.
+The features equal those of TfidfVectorizer fitted on the concatenated training texts: the vocabulary is built and
+pruned from the stored counts as the vectorizer does, and the counts are weighted by a TfidfTransformer.
+
+The store is in the features directory of the gold cache (see gold_cache.set_cache_dir), nothing is stored
+when the cache is disabled.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Changing the stored counts requires a new version, so that old entries are not used.
+_STORE_VERSION = 2
+# Arrays of the stored CSR matrix of the counts.
+_COUNTS_ARRAYS = ['data', 'indices', 'indptr']
+# Parameters of TfidfVectorizer, which turn a text into terms.
+_ANALYSIS_PARAMS = ['input', 'encoding', 'decode_error', 'strip_accents', 'lowercase', 'preprocessor', 'tokenizer',
+                    'analyzer', 'stop_words', 'token_pattern', 'ngram_range']
+
+
+def _map_counts(debate_counts, vocabulary, dtype):
+    """ Maps the columns of the counts of a debate to the terms of a vocabulary, dropping the other terms. """
+    counts, terms = debate_counts
+    term_ids = np.array([vocabulary.get(term, -1) for term in terms], dtype=np.int64)
+    counts = counts.tocoo()
+    columns = term_ids[counts.col]
+    known = columns >= 0
+    mapped = sp.csr_matrix((counts.data[known].astype(dtype), (counts.row[known], columns[known])),
+                           shape=(counts.shape[0], len(vocabulary)), dtype=dtype)
+    mapped.sort_indices()
+    return mapped
+
+
+def _build_vocabulary(train_counts):
+    """ :return: {term:column} dict of the terms of the training debates, in the order of their first occurrence. """
+    vocabulary = {}
+    for _, terms in train_counts:
+        for term in terms:
+            vocabulary.setdefault(term, len(vocabulary))
+    if not vocabulary:
+        raise ValueError('empty vocabulary; perhaps the documents only contain stop words')
+    return vocabulary
+
+
+def _sort_features(counts, vocabulary):
+    """
+    Renumbers the columns in the order of the names of the terms, as the vectorizer does: the entries of each row
+    keep their order, so the features are summed in the same order as by the vectorizer.
+    :return: (counts, vocabulary) tuple.
+    """
+    new_columns = np.empty(len(vocabulary), dtype=counts.indices.dtype)
+    sorted_vocabulary = {}
+    for new_column, term in enumerate(sorted(vocabulary)):
+        sorted_vocabulary[term] = new_column
+        new_columns[vocabulary[term]] = new_column
+    counts.indices = new_columns.take(counts.indices)
+    return counts, sorted_vocabulary
+
+
+def _limit_features(counts, vocabulary, max_df, min_df, max_features):
+    """
+    Removes the terms, which are in more documents than max_df or in less than min_df, and keeps at most the
+    max_features most frequent ones, as the vectorizer does.
+    :return: (counts, vocabulary) tuple with the kept columns and terms.
+    """
+    num_docs = counts.shape[0]
+    max_doc_count = max_df if isinstance(max_df, Integral) else max_df * num_docs
+    min_doc_count = min_df if isinstance(min_df, Integral) else min_df * num_docs
+    if max_doc_count < min_doc_count:
+        raise ValueError('max_df corresponds to < documents than min_df')
+
+    doc_freqs = np.bincount(counts.indices, minlength=counts.shape[1])
+    mask = (doc_freqs <= max_doc_count) & (doc_freqs >= min_doc_count)
+    if max_features is not None and mask.sum() > max_features:
+        term_freqs = np.asarray(counts.sum(axis=0)).ravel()
+        # The same sort as the vectorizer, so that the terms with equal frequencies are kept alike.
+        kept = (-term_freqs[mask]).argsort()[:max_features]
+        new_mask = np.zeros(len(doc_freqs), dtype=bool)
+        new_mask[np.where(mask)[0][kept]] = True
+        mask = new_mask
+
+    kept_columns = np.where(mask)[0]
+    if not len(kept_columns):
+        raise ValueError('After pruning, no terms remain. Try a lower min_df or a higher max_df.')
+    new_columns = np.cumsum(mask) - 1
+    vocabulary = dict((term, int(new_columns[column])) for term, column in vocabulary.items() if mask[column])
+    return counts[:, kept_columns], vocabulary
+
+
+def _texts_hash(texts):
+    sha1 = hashlib.sha1()
+    for text in texts:
+        encoded = text.encode('utf-8')
+        sha1.update('{}:'.format(len(encoded)).encode('ascii'))
+        sha1.update(encoded)
+    return sha1.hexdigest()
+
+
+def _analysis_key(vectorizer):
+    """ :return: the key of the analysis parameters of the vectorizer; None if they cannot be stored (callables). """
+    params = vectorizer.get_params()
+    values = []
+    for name in _ANALYSIS_PARAMS:
+        value = params.get(name)
+        if callable(value):
+            return None
+        values.append([name, repr(value)])
+    return values
+
+
+def _count_terms(texts, analyze):
+    """
+    Counts the terms of the texts, as the counting step of the vectorizer.
+    :return: (counts, terms) tuple, where the counts are a CSR matrix with a column for each term.
+    """
+    vocabulary = {}
+    values = []
+    columns = []
+    indptr = [0]
+    for text in texts:
+        text_counts = {}
+        for term in analyze(text):
+            term_id = vocabulary.setdefault(term, len(vocabulary))
+            text_counts[term_id] = text_counts.get(term_id, 0) + 1
+        columns.extend(text_counts.keys())
+        values.extend(text_counts.values())
+        indptr.append(len(columns))
+    counts = sp.csr_matrix((np.array(values, dtype=np.int64), np.array(columns, dtype=np.int64),
+                            np.array(indptr, dtype=np.int64)), shape=(len(texts), len(vocabulary)))
+    counts.sort_indices()
+    return counts, sorted(vocabulary, key=vocabulary.get)
+
+
+def debate_counts(texts, vectorizer):
+    """
+    Returns the term counts of the texts of a debate, from the store if they were counted before.
+    :param texts: list of the texts (documents) of the debate.
+    :param vectorizer: TfidfVectorizer with the parameters of the analysis.
+    :return: (counts, terms) tuple, where the counts are a CSR matrix with a row for each text
+    and a column for each term, in the order of the first occurrence of the terms.
+    The arrays of stored counts are memory-mapped (read-only).
+    """
+    analysis_key = _analysis_key(vectorizer)
+    cache_dir = gold_cache.get_cache_dir()
+    if analysis_key is None or cache_dir is None:
+        return _count_terms(texts, vectorizer.build_analyzer())
+
+    key = json.dumps([_STORE_VERSION, analysis_key, _texts_hash(texts)])
+    entry_dir = join(cache_dir, 'features', hashlib.sha1(key.encode('utf-8')).hexdigest())
+    if isdir(entry_dir):
+        with open(join(entry_dir, 'terms.json'), encoding='utf-8') as terms_f:
+            terms = json.load(terms_f)
+        data, indices, indptr = [np.load(join(entry_dir, name + '.npy'), mmap_mode='r') for name in _COUNTS_ARRAYS]
+        return sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(terms))), terms
+
+    counts, terms = _count_terms(texts, vectorizer.build_analyzer())
+    try:
+        _write_entry(entry_dir, counts, terms)
+    except OSError as e:
+        logger.warning('Cannot store the term counts in {}: {}'.format(entry_dir, e))
+    return counts, terms
+
+
+def _write_entry(entry_dir, counts, terms):
+    """ Writes the counts and the terms into a temporary directory, which is then renamed atomically. """
+    parent_dir = os.path.dirname(entry_dir)
+    if not isdir(parent_dir):
+        os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+        for name in _COUNTS_ARRAYS:
+            np.save(join(tmp_dir, name + '.npy'), getattr(counts, name))
+        with open(join(tmp_dir, 'terms.json'), 'w', encoding='utf-8') as terms_f:
+            json.dump(terms, terms_f, ensure_ascii=False)
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Another process may have stored the same counts in the meantime.
+        if not isdir(entry_dir):
+            raise
+
+
+def tfidf_features(train_texts, test_texts, **params):
+    """
+    Computes the TF-IDF features of a split from the stored term counts of its debates.
+    :param train_texts: list with the list of the texts of each training debate.
+    :param test_texts: list of the texts of the test debate.
+    :param params: parameters of TfidfVectorizer.
+    :return: (train features, test features, vocabulary) tuple, where the features equal
+    TfidfVectorizer(**params).fit_transform of the concatenated training texts and its transform of the test texts,
+    and the vocabulary is its vocabulary_.
+    """
+    vectorizer = TfidfVectorizer(**params)
+    train_counts = [debate_counts(texts, vectorizer) for texts in train_texts]
+    test_counts = debate_counts(test_texts, vectorizer)
+
+    vocabulary = _build_vocabulary(train_counts)
+    train_matrix = sp.vstack([_map_counts(counts, vocabulary, vectorizer.dtype) for counts in train_counts],
+                             format='csr')
+    train_matrix.sort_indices()
+    if vectorizer.binary:
+        train_matrix.data.fill(1)
+    train_matrix, vocabulary = _sort_features(train_matrix, vocabulary)
+    train_matrix, vocabulary = _limit_features(train_matrix, vocabulary, vectorizer.max_df, vectorizer.min_df,
+                                               vectorizer.max_features)
+    test_matrix = _map_counts(test_counts, vocabulary, vectorizer.dtype)
+    if vectorizer.binary:
+        test_matrix.data.fill(1)
+
+    transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                   smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+    train_features = transformer.fit_transform(train_matrix)
+    return train_features, transformer.transform(test_matrix), vocabulary
@@ -0,0 +1,103 @@
+import logging
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import PassiveAggressiveClassifier, SGDClassifier
+"""
+Out-of-core training of the linear baselines, for training sets which do not fit in memory.
+
+The debates are read one at a time and streamed in chunks of lines through a HashingVectorizer, which is stateless
+and so needs no pass over the training data to build a vocabulary. A linear model is trained with partial_fit
+on each chunk, so only the features of a single chunk are in memory, and the training time is linear in the number
+of lines. The test debate is streamed in chunks too.
+"""
+
+logger = logging.getLogger(__name__)
+
+MODELS = ['sgd', 'pa']
+# Number of lines, which are vectorized and learned from at once.
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_N_FEATURES = 2 ** 20
+DEFAULT_EPOCHS = 5
+
+# Whether SGDClassifier has the passive-aggressive learning rates, detected once by _sgd_has_pa.
+_sgd_pa = None
+
+
+def make_vectorizer(ngram_range=(1, 1), n_features=DEFAULT_N_FEATURES):
+    return HashingVectorizer(ngram_range=ngram_range, n_features=n_features, alternate_sign=False)
+
+
+def _sgd_has_pa():
+    """
+    Detects the passive-aggressive learning rates of SGDClassifier, which older versions of scikit-learn reject
+    either on construction or on fitting.
+    """
+    global _sgd_pa
+    if _sgd_pa is None:
+        try:
+            SGDClassifier(loss='hinge', penalty=None, learning_rate='pa1', eta0=1.0).partial_fit(
+                np.zeros((1, 1)), [0], classes=[0, 1])
+            _sgd_pa = True
+        except (ValueError, TypeError):
+            _sgd_pa = False
+    return _sgd_pa
+
+
+def make_model(model='sgd', class_weight=None):
+    """
+    :param model: 'sgd' for a linear SVM trained with stochastic gradient descent or 'pa' for passive-aggressive.
+    :param class_weight: {class:weight} dict, e.g. from balanced_class_weight.
+    """
+    if model == 'sgd':
+        return SGDClassifier(loss='hinge', alpha=1e-4, class_weight=class_weight, random_state=0)
+    if model == 'pa':
+        # PassiveAggressiveClassifier is deprecated for this learning rate of SGDClassifier since scikit-learn 1.8.
+        if _sgd_has_pa():
+            return SGDClassifier(loss='hinge', penalty=None, learning_rate='pa1', eta0=1.0,
+                                 class_weight=class_weight, random_state=0)
+        return PassiveAggressiveClassifier(class_weight=class_weight, random_state=0)
+    raise ValueError('Unknown model {}, use one of: {}'.format(model, ', '.join(MODELS)))
+
+
+def iter_chunks(debate_fpaths, read_debate, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams the lines of the debates in chunks, reading a debate at a time.
+    :param read_debate: function, which reads a debate into (ids, texts, labels) sequences of its lines.
+    :return: generator of (ids, texts, labels) tuples with at most chunk_size lines each.
+    """
+    for debate_fpath in debate_fpaths:
+        ids, texts, labels = read_debate(debate_fpath)
+        for start in range(0, len(texts), chunk_size):
+            yield ids[start:start + chunk_size], texts[start:start + chunk_size], labels[start:start + chunk_size]
+
+
+def balanced_class_weight(debate_fpaths, read_debate, classes):
+    """ Weights the classes inversely to their frequency in the debates, as class_weight='balanced'. """
+    counts = dict((label, 0) for label in classes)
+    for debate_fpath in debate_fpaths:
+        for label in read_debate(debate_fpath)[2]:
+            counts[label] += 1
+    total = sum(counts.values())
+    return dict((label, total / (len(classes) * count) if count else 1.0) for label, count in counts.items())
+
+
+def fit(train_debates, read_debate, classes, vectorizer, model='sgd', chunk_size=DEFAULT_CHUNK_SIZE,
+        epochs=DEFAULT_EPOCHS, balanced=False):
+    """
+    Trains a linear model on the streamed debates.
+    :param classes: all labels of the task, as chunks may lack some of them.
+    :param vectorizer: stateless vectorizer, e.g. from make_vectorizer.
+    :param epochs: number of passes over the debates.
+    :param balanced: whether to weight the classes inversely to their frequency (one more pass over the labels).
+    :return: the trained model.
+    """
+    class_weight = balanced_class_weight(train_debates, read_debate, classes) if balanced else None
+    clf = make_model(model, class_weight)
+    for epoch in range(epochs):
+        num_lines = 0
+        for _, texts, labels in iter_chunks(train_debates, read_debate, chunk_size):
+            clf.partial_fit(vectorizer.transform(texts), np.asarray(labels), classes=classes)
+            num_lines += len(texts)
+        logger.info('Epoch {} of {}: trained on {} lines'.format(epoch + 1, epochs, num_lines))
+    return clf
@@ -1,46 +1,75 @@
+import logging
 import pandas as pd
 import random
 from os.path import join, dirname
 
-from sklearn.pipeline import Pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.svm import SVC
 
+from baselines import feature_store, streaming
+from scorer import gold_cache
 from scorer.task1 import evaluate
 from format_checker.task1 import check_format
 
 random.seed(0)
-_COL_NAMES = ['line_number', 'speaker', 'text', 'label']
+_COL_NAMES = gold_cache.TASK1_COLUMNS
+# Parameters of the TF-IDF features of the ngram baseline.
+_TFIDF_PARAMS = {'ngram_range': (1, 1)}
+
+
+def _read_debate(debate_fpath):
+    return pd.DataFrame(gold_cache.load_gold(debate_fpath, 1), columns=_COL_NAMES)
 
 
 def run_random_baseline(gold_fpath, results_fpath):
-    gold_df = pd.read_csv(gold_fpath, names=_COL_NAMES, sep='\t')
+    gold_df = _read_debate(gold_fpath)
     with open(results_fpath, "w") as results_file:
         for i, line in gold_df.iterrows():
             results_file.write('{}\t{}\n'.format(line['line_number'], random.random()))
 
 
 def run_ngram_baseline(train_debates, test_debate, results_fpath):
-    test_df = pd.read_csv(test_debate, names=_COL_NAMES, sep='\t')
+    test_df = _read_debate(test_debate)
 
-    train_list = []
-    for train_debate in train_debates:
-        df = pd.read_csv(train_debate, index_col=None, header=None, names=_COL_NAMES, sep='\t')
-        train_list.append(df)
-    train_df = pd.concat(train_list)
+    train_dfs = [_read_debate(train_debate) for train_debate in train_debates]
+    train_df = pd.concat(train_dfs)
 
-    pipeline = Pipeline([
-        ('ngrams', TfidfVectorizer(ngram_range=(1, 1))),
-        ('clf', SVC(C=10, gamma=0.1, kernel='rbf', random_state=0))
-    ])
-    pipeline.fit(train_df['text'], train_df['label'])
+    # The TF-IDF features are assembled from the term counts of each debate, which are counted only once.
+    train_features, test_features, _ = feature_store.tfidf_features(
+        [list(df['text']) for df in train_dfs], list(test_df['text']), **_TFIDF_PARAMS)
+    clf = SVC(C=10, gamma=0.1, kernel='rbf', random_state=0)
+    clf.fit(train_features, train_df['label'])
 
     with open(results_fpath, "w") as results_file:
-        predicted_distance = pipeline.decision_function(test_df['text'])
+        predicted_distance = clf.decision_function(test_features)
         for line_num, dist in zip(test_df['line_number'], predicted_distance):
             results_file.write("{}\t{}\n".format(line_num, dist))
 
 
+def store_ngram_counts(debate_fpath):
+    """ Stores the term counts of a debate for the ngram baseline, e.g. once before many splits are run. """
+    feature_store.debate_counts(list(_read_debate(debate_fpath)['text']), TfidfVectorizer(**_TFIDF_PARAMS))
+
+
+def _read_lines(debate_fpath):
+    gold = gold_cache.load_gold(debate_fpath, 1, ['line_number', 'text', 'label'])
+    return gold['line_number'], gold['text'], gold['label']
+
+
+def run_hashing_baseline(train_debates, test_debate, results_fpath, model='sgd',
+                         chunk_size=streaming.DEFAULT_CHUNK_SIZE, epochs=streaming.DEFAULT_EPOCHS):
+    """ Out-of-core variant of the ngram baseline: hashed features and a linear model trained on streamed chunks. """
+    vectorizer = streaming.make_vectorizer(ngram_range=(1, 1))
+    # Few lines are check-worthy, so the classes are balanced.
+    clf = streaming.fit(train_debates, _read_lines, [0, 1], vectorizer, model, chunk_size, epochs, balanced=True)
+
+    with open(results_fpath, "w") as results_file:
+        for line_numbers, texts, _ in streaming.iter_chunks([test_debate], _read_lines, chunk_size):
+            predicted_distance = clf.decision_function(vectorizer.transform(texts))
+            for line_num, dist in zip(line_numbers, predicted_distance):
+                results_file.write("{}\t{}\n".format(line_num, dist))
+
+
 def run_baselines(lang='English'):
     ROOT_DIR = dirname(dirname(__file__))
 
@@ -60,8 +89,14 @@ def run_baselines(lang='English'):
     if check_format(ngram_baseline_fpath):
         evaluate(test_debate, ngram_baseline_fpath)
 
+    hashing_baseline_fpath = join(ROOT_DIR, 'baselines/data/task1_hashing_baseline_{}.txt'.format(lang))
+    run_hashing_baseline(train_debates, test_debate, hashing_baseline_fpath)
+    if check_format(hashing_baseline_fpath):
+        evaluate(test_debate, hashing_baseline_fpath)
+
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     run_baselines('English')
     run_baselines('Arabic')
 
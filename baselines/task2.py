@@ -1,26 +1,34 @@
+import logging
 import pandas as pd
 import random
 from os.path import dirname, join
 
-from sklearn.pipeline import Pipeline
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.svm import SVC
 
+from baselines import feature_store, streaming
 from format_checker.task2 import check_format
-from scorer.task2 import evaluate
+from scorer import gold_cache
+from scorer.task2 import _read_gold_and_pred, evaluate
 random.seed(0)
 
 _LABELS = ['TRUE', 'FALSE', 'HALF-TRUE']
 
-_COL_NAMES = ['line_number', 'speaker', 'text', 'claim_number', 'normalized_claim', 'label']
+_COL_NAMES = gold_cache.TASK2_COLUMNS
+# Parameters of the TF-IDF features of the ngram baseline.
+_TFIDF_PARAMS = {'ngram_range': (1, 2)}
 
 
-def run_random_baseline(test_debate, random_baseline_fpath):
-    gold = pd.read_csv(test_debate, sep='\t', names=_COL_NAMES)
+def _read_claims(debate_fpath):
+    """ Reads the claims of a debate, each once. """
+    debate_df = pd.DataFrame(gold_cache.load_gold(debate_fpath, 2), columns=_COL_NAMES)
+    # Lines, which are not claims, have a claim_number of -1.
+    debate_df = debate_df[debate_df['claim_number'] >= 0]
+    return debate_df.drop_duplicates(subset=['claim_number', 'label'])
+
 
-    gold = gold[gold['claim_number'].notna()]
-    gold.drop_duplicates(subset=['claim_number', 'label'], inplace=True)
-    gold['claim_number'] = gold['claim_number'].astype(int)
+def run_random_baseline(test_debate, random_baseline_fpath):
+    gold = _read_claims(test_debate)
 
     gold['rand_label'] = [random.sample(_LABELS, 1)[0] for _ in range(len(gold))]
 
@@ -29,32 +37,46 @@ def run_random_baseline(test_debate, random_baseline_fpath):
 
 
 def run_ngram_baseline(train_debates, test_debate, results_fpath):
-    test_df = pd.read_csv(test_debate, sep='\t', names=_COL_NAMES)
-    test_df = test_df[test_df['claim_number'].notna()]
-    test_df.drop_duplicates(subset=['claim_number', 'label'], inplace=True)
-    test_df['claim_number'] = test_df['claim_number'].astype(int)
-
-    train_list = []
-    for train_debate in train_debates:
-        df = pd.read_csv(train_debate, index_col=None, header=None, names=_COL_NAMES, sep='\t')
-        df = df[df['claim_number'].notna()]
-        df.drop_duplicates(subset=['claim_number', 'label'], inplace=True)
-        train_list.append(df)
-    train_df = pd.concat(train_list)
-    train_df['claim_number'] = train_df['claim_number'].astype(int)
-
-    pipeline = Pipeline([
-        ('ngrams', TfidfVectorizer(ngram_range=(1, 2))),
-        ('clf', SVC(random_state=0, C=10, gamma=0.1, kernel='rbf'))
-    ])
-    pipeline.fit(train_df['normalized_claim'], train_df['label'])
+    test_df = _read_claims(test_debate)
+    train_dfs = [_read_claims(train_debate) for train_debate in train_debates]
+    train_df = pd.concat(train_dfs)
+
+    # The TF-IDF features are assembled from the term counts of each debate, which are counted only once.
+    train_features, test_features, _ = feature_store.tfidf_features(
+        [list(df['normalized_claim']) for df in train_dfs], list(test_df['normalized_claim']), **_TFIDF_PARAMS)
+    clf = SVC(random_state=0, C=10, gamma=0.1, kernel='rbf')
+    clf.fit(train_features, train_df['label'])
 
     with open(results_fpath, "w") as results_file:
-        predicted_labels = pipeline.predict(test_df['normalized_claim'])
+        predicted_labels = clf.predict(test_features)
         for claim_num, label in zip(test_df['claim_number'], predicted_labels):
             results_file.write("{}\t{}\n".format(claim_num, label))
 
 
+def store_ngram_counts(debate_fpath):
+    """ Stores the term counts of a debate for the ngram baseline, e.g. once before many splits are run. """
+    feature_store.debate_counts(list(_read_claims(debate_fpath)['normalized_claim']),
+                                TfidfVectorizer(**_TFIDF_PARAMS))
+
+
+def _read_claim_lines(debate_fpath):
+    claims = _read_claims(debate_fpath)
+    return list(claims['claim_number']), list(claims['normalized_claim']), list(claims['label'])
+
+
+def run_hashing_baseline(train_debates, test_debate, results_fpath, model='sgd',
+                         chunk_size=streaming.DEFAULT_CHUNK_SIZE, epochs=streaming.DEFAULT_EPOCHS):
+    """ Out-of-core variant of the ngram baseline: hashed features and a linear model trained on streamed chunks. """
+    vectorizer = streaming.make_vectorizer(ngram_range=(1, 2))
+    clf = streaming.fit(train_debates, _read_claim_lines, _LABELS, vectorizer, model, chunk_size, epochs)
+
+    with open(results_fpath, "w") as results_file:
+        for claim_numbers, claims, _ in streaming.iter_chunks([test_debate], _read_claim_lines, chunk_size):
+            predicted_labels = clf.predict(vectorizer.transform(claims))
+            for claim_num, label in zip(claim_numbers, predicted_labels):
+                results_file.write("{}\t{}\n".format(claim_num, label))
+
+
 def run_baselines(lang='English'):
     ROOT_DIR = dirname(dirname(__file__))
     gold_data_folder = join(ROOT_DIR, 'data/task2/{}'.format(lang))
@@ -66,15 +88,21 @@ def run_baselines(lang='English'):
     random_baseline_fpath = join(ROOT_DIR, 'baselines/data/task2_random_baseline_{}.txt'.format(lang))
     run_random_baseline(test_debate, random_baseline_fpath)
     if check_format(random_baseline_fpath):
-        evaluate(test_debate, random_baseline_fpath)
+        evaluate(*_read_gold_and_pred(test_debate, random_baseline_fpath))
 
     ngram_baseline_fpath = join(ROOT_DIR, 'baselines/data/task2_ngram_baseline_{}.txt'.format(lang))
     run_ngram_baseline(train_debates, test_debate, ngram_baseline_fpath)
 
     if check_format(ngram_baseline_fpath):
-        evaluate(test_debate, ngram_baseline_fpath)
+        evaluate(*_read_gold_and_pred(test_debate, ngram_baseline_fpath))
+
+    hashing_baseline_fpath = join(ROOT_DIR, 'baselines/data/task2_hashing_baseline_{}.txt'.format(lang))
+    run_hashing_baseline(train_debates, test_debate, hashing_baseline_fpath)
+    if check_format(hashing_baseline_fpath):
+        evaluate(*_read_gold_and_pred(test_debate, hashing_baseline_fpath))
 
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     run_baselines('English')
     run_baselines('Arabic')
\ No newline at end of file
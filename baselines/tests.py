@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+import warnings
+from unittest import TestCase, mock
+from os.path import dirname, isdir, join
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import PassiveAggressiveClassifier, SGDClassifier
+
+from baselines import cross_validation, feature_store, streaming, task1, task2
+from format_checker import task1 as format_checker_task1
+from format_checker import task2 as format_checker_task2
+from scorer import gold_cache
+
+_ROOT_DIR = dirname(dirname(__file__))
+_DEBATE_FOLDER = join(_ROOT_DIR, 'data/task1/English')
+_TRAIN_DEBATES = [join(_DEBATE_FOLDER, 'Task1-English-1st-Presidential.txt'),
+                  join(_DEBATE_FOLDER, 'Task1-English-Vice-Presidential.txt')]
+_TEST_DEBATE = join(_DEBATE_FOLDER, 'Task1-English-2nd-Presidential.txt')
+_TASK2_DEBATE_FOLDER = join(_ROOT_DIR, 'data/task2/English')
+_TASK2_TRAIN_DEBATES = [join(_TASK2_DEBATE_FOLDER, 'Task2-English-1st-Presidential.txt'),
+                        join(_TASK2_DEBATE_FOLDER, 'Task2-English-Vice-Presidential.txt')]
+_TASK2_TEST_DEBATE = join(_TASK2_DEBATE_FOLDER, 'Task2-English-2nd-Presidential.txt')
+
+_cache_dir = None
+
+
+def setUpModule():
+    # The gold files and the features are cached in a temporary directory, not in the cache of the user.
+    global _cache_dir
+    _cache_dir = tempfile.mkdtemp()
+    gold_cache.set_cache_dir(_cache_dir)
+
+
+def tearDownModule():
+    gold_cache.set_cache_dir(None)
+    shutil.rmtree(_cache_dir)
+
+
+class BaselinesFeatureStore(TestCase):
+    _PARAMS = [{}, {'ngram_range': (1, 2)}, {'min_df': 2}, {'max_df': 0.5, 'sublinear_tf': True},
+               {'max_features': 500}, {'binary': True, 'norm': None}, {'lowercase': False, 'use_idf': False}]
+
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        gold_cache.set_cache_dir(self.store_dir)
+        self.train_texts = [list(task1._read_debate(debate)['text']) for debate in _TRAIN_DEBATES]
+        self.test_texts = list(task1._read_debate(_TEST_DEBATE)['text'])
+
+    def tearDown(self):
+        gold_cache.set_cache_dir(_cache_dir)
+        shutil.rmtree(self.store_dir)
+
+    def _assert_direct_fit(self, params):
+        train_features, test_features, vocabulary = feature_store.tfidf_features(self.train_texts, self.test_texts,
+                                                                                 **params)
+        direct = TfidfVectorizer(**params)
+        direct_train_features = direct.fit_transform([text for texts in self.train_texts for text in texts])
+        self.assertEqual(vocabulary, direct.vocabulary_, params)
+        self.assertEqual(train_features.dtype, direct_train_features.dtype, params)
+        self.assertEqual((train_features != direct_train_features).nnz, 0, params)
+        self.assertEqual((test_features != direct.transform(self.test_texts)).nnz, 0, params)
+
+    def test_direct_fit(self):
+        for params in self._PARAMS:
+            # Once counting the terms, once from the store.
+            self._assert_direct_fit(params)
+            self._assert_direct_fit(params)
+        gold_cache.set_cache_dir(None)
+        for params in self._PARAMS[:3]:
+            self._assert_direct_fit(params)
+
+    def test_store(self):
+        vectorizer = TfidfVectorizer(ngram_range=(1, 2))
+        counts, terms = feature_store.debate_counts(self.test_texts, vectorizer)
+        entries = os.listdir(join(self.store_dir, 'features'))
+        self.assertEqual(len(entries), 1)
+
+        with mock.patch.object(feature_store, '_count_terms', side_effect=AssertionError('counted again')):
+            stored_counts, stored_terms = feature_store.debate_counts(self.test_texts, vectorizer)
+        self.assertEqual(stored_terms, terms)
+        self.assertEqual((stored_counts != counts).nnz, 0)
+        # The stored counts are memory-mapped, read-only.
+        self.assertFalse(stored_counts.data.flags.writeable)
+
+        # Other texts or other analysis parameters are other entries.
+        feature_store.debate_counts(self.test_texts[1:], vectorizer)
+        feature_store.debate_counts(self.test_texts, TfidfVectorizer())
+        self.assertEqual(len(os.listdir(join(self.store_dir, 'features'))), 3)
+        # Weighting parameters do not change the counts.
+        feature_store.debate_counts(self.test_texts, TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True))
+        self.assertEqual(len(os.listdir(join(self.store_dir, 'features'))), 3)
+
+    def test_not_stored(self):
+        feature_store.debate_counts(self.test_texts, TfidfVectorizer(tokenizer=str.split))
+        self.assertFalse(isdir(join(self.store_dir, 'features')))
+
+    def test_atomic_write(self):
+        vectorizer = TfidfVectorizer()
+        counts, terms = feature_store._count_terms(self.test_texts, vectorizer.build_analyzer())
+        entry_dir = join(self.store_dir, 'features', 'entry')
+        feature_store._write_entry(entry_dir, counts, terms)
+        self.assertEqual(sorted(os.listdir(entry_dir)), ['data.npy', 'indices.npy', 'indptr.npy', 'terms.json'])
+        # Another process stored the same entry in the meantime: the temporary directory is removed.
+        feature_store._write_entry(entry_dir, counts, terms)
+        self.assertEqual(os.listdir(join(self.store_dir, 'features')), ['entry'])
+
+        # A failed write leaves no entry, and is not fatal for the features.
+        with mock.patch.object(feature_store.np, 'save', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                feature_store._write_entry(join(self.store_dir, 'features', 'failed'), counts, terms)
+            self.assertEqual(os.listdir(join(self.store_dir, 'features')), ['entry'])
+            with self.assertLogs(feature_store.logger, 'WARNING'):
+                failed_counts, _ = feature_store.debate_counts(self.test_texts[:10], vectorizer)
+        self.assertEqual(failed_counts.shape[0], 10)
+        self.assertEqual(os.listdir(join(self.store_dir, 'features')), ['entry'])
+
+
+class BaselinesStreaming(TestCase):
+    # Debates of (ids, texts, labels), read by _read_debate.
+    _DEBATES = {
+        'a': ([1, 2, 3, 4, 5], ['good good', 'bad', 'good news', 'bad bad news', 'good'], [1, 0, 1, 0, 1]),
+        'b': ([1, 2, 3], ['bad', 'bad day', 'good day'], [0, 0, 1]),
+    }
+
+    def setUp(self):
+        self.reads = []
+
+    def _read_debate(self, debate):
+        self.reads.append(debate)
+        return self._DEBATES[debate]
+
+    def test_iter_chunks(self):
+        chunks = list(streaming.iter_chunks(['a', 'b'], self._read_debate, chunk_size=2))
+        # A chunk holds the lines of a single debate.
+        self.assertEqual([ids for ids, _, _ in chunks], [[1, 2], [3, 4], [5], [1, 2], [3]])
+        self.assertEqual([text for _, texts, _ in chunks for text in texts],
+                         self._DEBATES['a'][1] + self._DEBATES['b'][1])
+        self.assertEqual([label for _, _, labels in chunks for label in labels],
+                         self._DEBATES['a'][2] + self._DEBATES['b'][2])
+        self.assertEqual(self.reads, ['a', 'b'])
+        self.assertEqual(list(streaming.iter_chunks([], self._read_debate)), [])
+
+    def test_balanced_class_weight(self):
+        # 4 of the 8 lines are in class 0 and 4 in class 1.
+        weights = streaming.balanced_class_weight(['a', 'b'], self._read_debate, [0, 1])
+        self.assertEqual(weights, {0: 1.0, 1: 1.0})
+        # A class without lines gets the weight 1.
+        weights = streaming.balanced_class_weight(['b'], self._read_debate, [0, 1, 2])
+        self.assertAlmostEqual(weights[0], 3 / (3 * 2))
+        self.assertAlmostEqual(weights[1], 3 / (3 * 1))
+        self.assertEqual(weights[2], 1.0)
+
+    def test_fit(self):
+        vectorizer = streaming.make_vectorizer(n_features=2 ** 10)
+        clf = streaming.fit(['a', 'b'], self._read_debate, [0, 1], vectorizer, chunk_size=2, epochs=3,
+                            balanced=True)
+        # A pass over the labels for the weights, then a pass over the lines for each epoch.
+        self.assertEqual(self.reads, ['a', 'b'] * 4)
+        self.assertEqual(clf.predict(vectorizer.transform(['good', 'bad'])).tolist(), [1, 0])
+        # The first chunk has a single class, the classes are given to partial_fit.
+        self.assertEqual(clf.classes_.tolist(), [0, 1])
+
+        other_clf = streaming.fit(['a', 'b'], self._read_debate, [0, 1], vectorizer, chunk_size=2, epochs=3,
+                                  balanced=True)
+        np.testing.assert_array_equal(clf.coef_, other_clf.coef_)
+        for model in streaming.MODELS:
+            clf = streaming.fit(['a', 'b'], self._read_debate, [0, 1], vectorizer, model, chunk_size=3, epochs=5)
+            self.assertEqual(clf.predict(vectorizer.transform(['good', 'bad'])).tolist(), [1, 0], model)
+
+    def test_make_model(self):
+        self.assertEqual(streaming.make_model('sgd').loss, 'hinge')
+        with mock.patch.object(streaming, '_sgd_pa', False), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            self.assertIsInstance(streaming.make_model('pa', {0: 1.0, 1: 2.0}), PassiveAggressiveClassifier)
+        with mock.patch.object(streaming, '_sgd_pa', True):
+            clf = streaming.make_model('pa')
+            self.assertIsInstance(clf, SGDClassifier)
+            self.assertEqual(clf.learning_rate, 'pa1')
+        # The detection matches the installed version and does not depend on its version string.
+        with mock.patch.object(streaming, '_sgd_pa', None):
+            expected = SGDClassifier if streaming._sgd_has_pa() else PassiveAggressiveClassifier
+            self.assertIsInstance(streaming.make_model('pa'), expected)
+        with self.assertRaises(ValueError):
+            streaming.make_model('svm')
+
+    def test_run_hashing_baseline(self):
+        results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, results_dir)
+        for model in streaming.MODELS:
+            results_fpath = join(results_dir, 'task1_{}.txt'.format(model))
+            task1.run_hashing_baseline(_TRAIN_DEBATES, _TEST_DEBATE, results_fpath, model, chunk_size=100, epochs=1)
+            self.assertTrue(format_checker_task1.check_format(results_fpath))
+            with open(results_fpath) as results_file:
+                line_numbers = [int(line.split('\t')[0]) for line in results_file]
+            self.assertEqual(line_numbers, list(task1._read_debate(_TEST_DEBATE)['line_number']))
+
+            results_fpath = join(results_dir, 'task2_{}.txt'.format(model))
+            task2.run_hashing_baseline(_TASK2_TRAIN_DEBATES, _TASK2_TEST_DEBATE, results_fpath, model, chunk_size=10,
+                                       epochs=1)
+            self.assertTrue(format_checker_task2.check_format(results_fpath))
+            with open(results_fpath) as results_file:
+                claim_numbers = [int(line.split('\t')[0]) for line in results_file]
+            self.assertEqual(claim_numbers, list(task2._read_claims(_TASK2_TEST_DEBATE)['claim_number']))
+
+
+class BaselinesCrossValidation(TestCase):
+    def setUp(self):
+        # The temporary directories of cross_validate are created here, to check that they are removed.
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch.object(tempfile, 'tempdir', self.tmp_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cross_validate(self):
+        debates = cross_validation.debate_fpaths(1, 'English')
+        self.assertEqual(debates, sorted(_TRAIN_DEBATES + [_TEST_DEBATE]))
+
+        results = []
+        for workers, cache_dir in [(1, _cache_dir), (2, None)]:
+            gold_cache.set_cache_dir(cache_dir)
+            try:
+                results.append(cross_validation.cross_validate([1], ['English'], ['random'], workers=workers))
+                self.assertEqual(gold_cache.get_cache_dir(), cache_dir)
+            finally:
+                gold_cache.set_cache_dir(_cache_dir)
+            self.assertEqual(os.listdir(self.tmp_dir), [])
+
+        for result in results:
+            self.assertEqual(len(result), 1)
+            self.assertEqual((result[0].task, result[0].language, result[0].baseline), (1, 'English', 'random'))
+            self.assertEqual([fold.test_debate for fold in result[0].folds], debates)
+            self.assertEqual([fold.pred_file for fold in result[0].folds], [None] * len(debates))
+            for metric, mean in result[0].mean.items():
+                self.assertAlmostEqual(mean, sum([fold.metrics[metric] for fold in result[0].folds]) / len(debates))
+            self.assertEqual(sorted(result[0].mean), sorted(cross_validation.scorer_task1.MAIN_METRICS))
+        self.assertEqual([fold.metrics for fold in results[0][0].folds], [fold.metrics for fold in results[1][0].folds])
+        self.assertEqual(results[0][0].mean, results[1][0].mean)
+
+    def test_results_dir(self):
+        results_dir = join(self.tmp_dir, 'results')
+        result = cross_validation.cross_validate([2], ['English'], ['random'], results_dir=results_dir)[0]
+        self.assertEqual([fold.pred_file for fold in result.folds],
+                         [join(results_dir, 'task2_random_baseline_{}.txt'.format(name)) for name in
+                          ['Task2-English-1st-Presidential', 'Task2-English-2nd-Presidential',
+                           'Task2-English-Vice-Presidential']])
+        for fold in result.folds:
+            self.assertTrue(format_checker_task2.check_format(fold.pred_file))
+        self.assertEqual(os.listdir(self.tmp_dir), ['results'])
+
+        with self.assertRaises(ValueError):
+            cross_validation.cross_validate([1], ['English'], ['svm'])
+        with self.assertRaises(ValueError):
+            cross_validation.cross_validate([1], ['English'], data_dir=self.tmp_dir)
@@ -0,0 +1,90 @@
+import json
+import logging
+"""
+Helpers for the streaming format checkers, which read a file line by line and report all format violations.
+
+A report is a dict with the keys:
+  'file_path': the checked file.
+  'valid': whether the format is correct.
+  'num_lines': number of lines read from the file.
+  'num_errors': number of all found violations.
+  'errors': list with the first max_errors violations, each a dict with the keys
+            'line' (the line in the file, None for violations of the whole file), 'type' and 'message'.
+  'errors_truncated': whether there are more violations than listed in 'errors'.
+  'warnings': list with warnings of the same shape as the errors.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Types of the violations in the report.
+ERROR_EMPTY = 'empty'
+ERROR_FORMAT = 'format'
+ERROR_LINE_NUMBER = 'line_number'
+ERROR_DUPLICATE = 'duplicate'
+ERROR_MISSING = 'missing'
+WARNING_MISSING_LABEL = 'missing_label'
+
+DEFAULT_MAX_ERRORS = 100
+
+
+def iter_stripped_lines(lines):
+    """
+    Streams the stripped lines of a file with their (1-based) line in the file.
+    As the whole file content is stripped in check_format, blank lines at the start and at the end of the file
+    are skipped. Blank lines between other lines are yielded (as empty strings) and fail the line format check.
+    """
+    started = False
+    blank_start, num_blank = 0, 0
+    for line_idx, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if not stripped:
+            if started:
+                if not num_blank:
+                    blank_start = line_idx
+                num_blank += 1
+            continue
+
+        for blank_idx in range(blank_start, blank_start + num_blank):
+            yield blank_idx, ''
+        started = True
+        num_blank = 0
+        yield line_idx, stripped
+
+
+def new_report(file_path):
+    return {
+        'file_path': file_path,
+        'valid': True,
+        'num_lines': 0,
+        'num_errors': 0,
+        'errors': [],
+        'errors_truncated': False,
+        'warnings': [],
+    }
+
+
+def add_error(report, line, error_type, message, max_errors=DEFAULT_MAX_ERRORS):
+    """ Records a violation, keeping at most max_errors of them, so that memory stays bounded. """
+    report['valid'] = False
+    report['num_errors'] += 1
+    if len(report['errors']) < max_errors:
+        report['errors'].append({'line': line, 'type': error_type, 'message': message})
+    else:
+        report['errors_truncated'] = True
+
+
+def add_warning(report, line, warning_type, message):
+    report['warnings'].append({'line': line, 'type': warning_type, 'message': message})
+
+
+def log_report(report):
+    for error in report['errors']:
+        logger.error('Line {}: {}'.format(error['line'], error['message']) if error['line'] else error['message'])
+    if report['errors_truncated']:
+        logger.error('... and {} more errors.'.format(report['num_errors'] - len(report['errors'])))
+    for warning in report['warnings']:
+        logger.warning(warning['message'])
+
+
+def dumps_report(report):
+    return json.dumps(report, indent=2)
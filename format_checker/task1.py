@@ -2,6 +2,11 @@ import argparse
 import re
 import logging
 
+import numpy as np
+
+from format_checker import report as fc_report
+from format_checker import tsv
+
 
 """
 This script checks whether the results format for Task 1 is correct. 
@@ -15,16 +20,32 @@ and <score> indicates the degree of 'check-worthiness' of the given line.
 """
 
 _LINE_PATTERN_A = re.compile('^[1-9][0-9]{0,3}\t([-+]?\d*\.\d+|\d+)$')
-logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+# The same format for a whole file, matched at once when the file is parsed with NumPy.
+_FILE_PATTERN_A = tsv.file_pattern('[1-9][0-9]{0,3}\t(?:[-+]?[0-9]*\\.[0-9]+|[0-9]+)')
+logger = logging.getLogger(__name__)
+
 
+def check_format(file_path, return_parsed=False):
+    """
+    Checks the format of a Task 1 results file.
+    :param file_path: path to the results file.
+    :param return_parsed: whether to return the parsed file, so that it does not have to be read again for scoring.
+    :return: whether the format is correct. With return_parsed - a (line_numbers, scores) tuple of arrays
+    instead of True.
+    """
+    parsed = _parse_valid_file(file_path)
+    if parsed is not None:
+        return parsed if return_parsed else True
 
-def check_format(file_path):
+    # The file is checked line by line to find and report the problem.
+    line_numbers = []
+    scores = []
     with open(file_path, encoding='UTF-8') as out:
         file_content = out.read().strip()
         for i, line in enumerate(file_content.split('\n')):
             if not _LINE_PATTERN_A.match(line.strip()):
                 # 1. Check line format.
-                logging.error("Wrong line format: {}".format(line))
+                logger.error("Wrong line format: {}".format(line))
                 return False
 
             line_number, score = line.split('\t')
@@ -32,14 +53,79 @@ def check_format(file_path):
             score = float(score.strip())
 
             if line_number != i + 1:
-                logging.error('Problem with line_number: {}. They should be consecutive and starting from 1.'.format(line_number))
+                logger.error('Problem with line_number: {}. They should be consecutive and starting from 1.'.format(line_number))
                 return False
+
+            line_numbers.append(line_number)
+            scores.append(score)
+
+    if return_parsed:
+        return np.array(line_numbers, dtype=np.int64), np.array(scores, dtype=np.float64)
     return True
 
 
+def _parse_valid_file(file_path):
+    """
+    Parses a results file in the correct format with NumPy, without checking it line by line.
+    :return: (line_numbers, scores) tuple of arrays; None if the format may be wrong.
+    """
+    columns = tsv.read_columns(file_path, 2, _FILE_PATTERN_A)
+    if columns is None:
+        return None
+    line_numbers = tsv.to_ints(columns[0])
+    if line_numbers is None or not np.array_equal(line_numbers, np.arange(1, len(line_numbers) + 1)):
+        return None
+    scores = tsv.to_floats(columns[1])
+    if scores is None:
+        return None
+    return line_numbers, scores
+
+
+def check_format_stream(file_path, max_errors=fc_report.DEFAULT_MAX_ERRORS):
+    """
+    Checks the format of a Task 1 results file line by line in constant memory and collects all violations,
+    instead of stopping at the first one.
+    The line_numbers are checked with a running counter, which restarts after each wrong line_number,
+    so that a single missing or duplicate line_number is reported only once.
+    :param file_path: path to the results file.
+    :param max_errors: maximum number of violations listed in the report (all of them are counted).
+    :return: the report dict, described in format_checker.report.
+    """
+    report = fc_report.new_report(file_path)
+    expected_line_number = 1
+    with open(file_path, encoding='UTF-8') as out:
+        for line_idx, line in fc_report.iter_stripped_lines(out):
+            report['num_lines'] = line_idx
+            if not _LINE_PATTERN_A.match(line):
+                fc_report.add_error(report, line_idx, fc_report.ERROR_FORMAT,
+                                    "Wrong line format: {}".format(line), max_errors)
+                # The badly formatted line still takes the place of the expected line_number.
+                expected_line_number += 1
+                continue
+
+            line_number = int(line.split('\t')[0])
+            if line_number != expected_line_number:
+                fc_report.add_error(report, line_idx, fc_report.ERROR_LINE_NUMBER,
+                                    'Problem with line_number: {}. They should be consecutive and starting from 1.'
+                                    .format(line_number), max_errors)
+            expected_line_number = line_number + 1
+
+    if not report['num_lines']:
+        fc_report.add_error(report, None, fc_report.ERROR_EMPTY, 'The file is empty.', max_errors)
+    return report
+
+
 if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("--pred_file_path", help="The absolute path to the file you want to check.", type=str)
+    parser.add_argument("--max_errors", help="Stream the file and report up to this number of errors (as JSON), "
+                                             "instead of stopping at the first one.", type=int)
     args = parser.parse_args()
-    logging.info("Task 1: Checking file: {}".format(args.pred_file_path))
-    check_format(args.pred_file_path)
\ No newline at end of file
+    logger.info("Task 1: Checking file: {}".format(args.pred_file_path))
+    if args.max_errors is None:
+        check_format(args.pred_file_path)
+    else:
+        format_report = check_format_stream(args.pred_file_path, args.max_errors)
+        fc_report.log_report(format_report)
+        print(fc_report.dumps_report(format_report))
\ No newline at end of file
@@ -2,6 +2,11 @@ import argparse
 import re
 import logging
 
+import numpy as np
+
+from format_checker import report as fc_report
+from format_checker import tsv
+
 """
 This script checks whether the results format for Task 2 is correct. 
 It also provides some warnings about possible errors.
@@ -12,10 +17,26 @@ where claim_number is only the number of the claims, which are fact-checked (Not
 """
 
 _LINE_PATTERN_B = re.compile('^[1-9][0-9]{0,3}\t(TRUE|FALSE|HALF-TRUE)$', re.IGNORECASE)
-logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+# The same format for a whole file, matched at once when the file is parsed with NumPy.
+_FILE_PATTERN_B = tsv.file_pattern('[1-9][0-9]{0,3}\t(?:TRUE|FALSE|HALF-TRUE)', re.IGNORECASE)
+# The claim_numbers have at most 4 digits, as enforced by _LINE_PATTERN_B.
+_MAX_CLAIM_NUMBER = 9999
+logger = logging.getLogger(__name__)
+
 
+def check_format(file_path, return_parsed=False):
+    """
+    Checks the format of a Task 2 results file.
+    :param file_path: path to the results file.
+    :param return_parsed: whether to return the parsed file, so that it does not have to be read again for scoring.
+    :return: whether the format is correct. With return_parsed - a (claim_numbers, labels) tuple of arrays
+    (with a single entry for each claim_number) instead of True.
+    """
+    parsed = _parse_valid_file(file_path)
+    if parsed is not None:
+        return parsed if return_parsed else True
 
-def check_format(file_path):
+    # The file is checked line by line to find and report the problem.
     with open(file_path, encoding='UTF-8') as out:
         file_content = out.read().strip()
 
@@ -23,7 +44,7 @@ def check_format(file_path):
         for line in file_content.split('\n'):
             if not _LINE_PATTERN_B.match(line.strip()):
                 # 1. Check line format
-                logging.error("Wrong line format: {}".format(line))
+                logger.error("Wrong line format: {}".format(line))
                 return False
 
             _cols = line.split('\t')
@@ -31,7 +52,7 @@ def check_format(file_path):
             label = _cols[1].strip()
 
             if claim_number in id_label and id_label[claim_number] != label:
-                logging.error(
+                logger.error(
                     'There is an already predicted label for claim_number {} and it is different!'.format(claim_number))
                 return False
 
@@ -42,19 +63,110 @@ def check_format(file_path):
 
         # 2. Check if some ids are missing
         if sorted(ids) != list(range(1, max(ids) + 1)):
-            logging.error("You seem to have missing claim_numbers in the provided list.")
+            logger.error("You seem to have missing claim_numbers in the provided list.")
             return False
 
-        # 3. Check if some labels are missing
-        if len(set(labels)) < 3:
-            logging.warning("It seems you have missed a class in the predicted labels.")
+        # 3. Check if some labels are missing (the labels are case-insensitive)
+        if len(set([label.lower() for label in labels])) < 3:
+            logger.warning("It seems you have missed a class in the predicted labels.")
 
+    if return_parsed:
+        return np.array(ids, dtype=np.int64), np.array(labels)
     return True
 
 
+def _parse_valid_file(file_path):
+    """
+    Parses a results file in the correct format with NumPy, without checking it line by line.
+    Repeated claim_numbers with the same label are kept once, at their first position, as in check_format.
+    :return: (claim_numbers, labels) tuple of arrays; None if the format may be wrong.
+    """
+    columns = tsv.read_columns(file_path, 2, _FILE_PATTERN_B)
+    if columns is None:
+        return None
+    claim_numbers = tsv.to_ints(columns[0])
+    labels = tsv.to_strings(columns[1])
+    if claim_numbers is None or labels is None:
+        return None
+
+    order = np.argsort(claim_numbers, kind='mergesort')
+    sorted_claim_numbers, sorted_labels = claim_numbers[order], labels[order]
+    repeated = sorted_claim_numbers[1:] == sorted_claim_numbers[:-1]
+    if (sorted_labels[1:][repeated] != sorted_labels[:-1][repeated]).any():
+        return None
+    is_first = np.concatenate([[True], ~repeated])
+    if not np.array_equal(sorted_claim_numbers[is_first], np.arange(1, np.count_nonzero(is_first) + 1)):
+        return None
+
+    if len(np.unique(np.char.lower(labels))) < 3:
+        logger.warning("It seems you have missed a class in the predicted labels.")
+    first_positions = np.sort(order[is_first])
+    return claim_numbers[first_positions], labels[first_positions]
+
+
+def check_format_stream(file_path, max_errors=fc_report.DEFAULT_MAX_ERRORS):
+    """
+    Checks the format of a Task 2 results file line by line in constant memory and collects all violations,
+    instead of stopping at the first one.
+    The label of each claim_number is kept in a fixed-size table indexed by claim_number, which is used both for
+    duplicate claim_numbers and for finding the missing ones, without sorting the ids.
+    :param file_path: path to the results file.
+    :param max_errors: maximum number of violations listed in the report (all of them are counted).
+    :return: the report dict, described in format_checker.report.
+    """
+    report = fc_report.new_report(file_path)
+    claim_labels = [None] * (_MAX_CLAIM_NUMBER + 1)
+    max_claim_number = 0
+    seen_labels = set()
+
+    with open(file_path, encoding='UTF-8') as out:
+        for line_idx, line in fc_report.iter_stripped_lines(out):
+            report['num_lines'] = line_idx
+            if not _LINE_PATTERN_B.match(line):
+                fc_report.add_error(report, line_idx, fc_report.ERROR_FORMAT,
+                                    "Wrong line format: {}".format(line), max_errors)
+                continue
+
+            _cols = line.split('\t')
+            claim_number = int(_cols[0].strip())
+            label = _cols[1].strip()
+
+            if claim_labels[claim_number] is not None and claim_labels[claim_number] != label:
+                fc_report.add_error(report, line_idx, fc_report.ERROR_DUPLICATE,
+                                    'There is an already predicted label for claim_number {} and it is different!'
+                                    .format(claim_number), max_errors)
+                continue
+
+            claim_labels[claim_number] = label
+            max_claim_number = max(max_claim_number, claim_number)
+            seen_labels.add(label.lower())
+
+    if not report['num_lines']:
+        fc_report.add_error(report, None, fc_report.ERROR_EMPTY, 'The file is empty.', max_errors)
+        return report
+
+    for claim_number in range(1, max_claim_number + 1):
+        if claim_labels[claim_number] is None:
+            fc_report.add_error(report, None, fc_report.ERROR_MISSING,
+                                'Missing claim_number {} in the provided list.'.format(claim_number), max_errors)
+
+    if len(seen_labels) < 3:
+        fc_report.add_warning(report, None, fc_report.WARNING_MISSING_LABEL,
+                              'It seems you have missed a class in the predicted labels.')
+    return report
+
+
 if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("--pred_file_path", help="The absolute path to the file you want to check.", type=str)
+    parser.add_argument("--max_errors", help="Stream the file and report up to this number of errors (as JSON), "
+                                             "instead of stopping at the first one.", type=int)
     args = parser.parse_args()
-    logging.info("Task 2: Checking file: {}".format(args.pred_file_path))
-    check_format(args.pred_file_path)
+    logger.info("Task 2: Checking file: {}".format(args.pred_file_path))
+    if args.max_errors is None:
+        check_format(args.pred_file_path)
+    else:
+        format_report = check_format_stream(args.pred_file_path, args.max_errors)
+        fc_report.log_report(format_report)
+        print(fc_report.dumps_report(format_report))
@@ -1,7 +1,11 @@
-from unittest import TestCase
+import os
+import tempfile
+from unittest import TestCase, mock
 from os.path import join, dirname
 
-from format_checker import task1, task2
+import numpy as np
+
+from format_checker import report, task1, task2, tsv
 
 _ROOT_DIR = dirname(dirname(__file__))
 _TEST_DATA_FOLDER = join(_ROOT_DIR, 'format_checker/data')
@@ -18,6 +22,37 @@ class FormatCheckerTask1(TestCase):
     def test_not_ok(self):
         for _file in self._NOT_OK_FILES:
             self.assertFalse(task1.check_format(join(_TEST_DATA_FOLDER, _file)))
+            self.assertFalse(task1.check_format(join(_TEST_DATA_FOLDER, _file), return_parsed=True))
+
+    def test_parsed(self):
+        line_numbers, scores = task1.check_format(join(_TEST_DATA_FOLDER, 'task1_OK.txt'), return_parsed=True)
+        with open(join(_TEST_DATA_FOLDER, 'task1_OK.txt')) as f:
+            lines = [line.strip().split('\t') for line in f if line.strip()]
+        self.assertEqual(line_numbers.tolist(), [int(line[0]) for line in lines])
+        self.assertEqual(scores.tolist(), [float(line[1]) for line in lines])
+
+    def test_stream(self):
+        for _file in self._OK_FILES:
+            self.assertTrue(task1.check_format_stream(join(_TEST_DATA_FOLDER, _file))['valid'])
+        for _file in self._NOT_OK_FILES:
+            self.assertFalse(task1.check_format_stream(join(_TEST_DATA_FOLDER, _file))['valid'])
+
+    def test_stream_all_errors(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('1\t0.5\n2\tx\n3\t0.1\n5\t0.2\n6\t0.3\n6\t0.3\n')
+        try:
+            format_report = task1.check_format_stream(path)
+            self.assertEqual(format_report['num_lines'], 6)
+            self.assertEqual([(error['line'], error['type']) for error in format_report['errors']],
+                             [(2, report.ERROR_FORMAT), (4, report.ERROR_LINE_NUMBER), (6, report.ERROR_LINE_NUMBER)])
+
+            format_report = task1.check_format_stream(path, max_errors=1)
+            self.assertEqual(format_report['num_errors'], 3)
+            self.assertEqual(len(format_report['errors']), 1)
+            self.assertTrue(format_report['errors_truncated'])
+        finally:
+            os.remove(path)
 
 
 class FormatCheckerTask2(TestCase):
@@ -31,3 +66,100 @@ class FormatCheckerTask2(TestCase):
     def test_not_ok(self):
         for _file in self._NOT_OK_FILES:
             self.assertFalse(task2.check_format(join(_TEST_DATA_FOLDER, _file)))
+            self.assertFalse(task2.check_format(join(_TEST_DATA_FOLDER, _file), return_parsed=True))
+
+    def test_parsed(self):
+        claim_numbers, labels = task2.check_format(join(_TEST_DATA_FOLDER, 'task2_OK_LOWER.txt'), return_parsed=True)
+        with open(join(_TEST_DATA_FOLDER, 'task2_OK_LOWER.txt')) as f:
+            lines = dict([line.strip().split('\t') for line in f if line.strip()])
+        self.assertEqual(dict(zip(map(str, claim_numbers.tolist()), labels.tolist())), lines)
+
+    def test_stream(self):
+        for _file in self._OK_FILES:
+            self.assertTrue(task2.check_format_stream(join(_TEST_DATA_FOLDER, _file))['valid'])
+        for _file in self._NOT_OK_FILES:
+            self.assertFalse(task2.check_format_stream(join(_TEST_DATA_FOLDER, _file))['valid'])
+
+        format_report = task2.check_format_stream(join(_TEST_DATA_FOLDER, 'task2_WARN_MISSING_LABEL.txt'))
+        self.assertEqual([warning['type'] for warning in format_report['warnings']], [report.WARNING_MISSING_LABEL])
+
+    def test_missing_label_warning(self):
+        # The labels are case-insensitive, so all checkers count the classes alike.
+        for content, warns in [('1\tTRUE\n2\ttrue\n3\tFALSE\n', True), ('1\tTRUE\n2\tfalse\n3\tHalf-True\n', False)]:
+            fd, path = tempfile.mkstemp()
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            try:
+                for parse_valid_file in [task2._parse_valid_file, lambda file_path: None]:
+                    assert_logs = self.assertLogs if warns else self.assertNoLogs
+                    with mock.patch.object(task2, '_parse_valid_file', parse_valid_file), \
+                            assert_logs(task2.logger, 'WARNING'):
+                        self.assertTrue(task2.check_format(path))
+                format_report = task2.check_format_stream(path)
+                self.assertEqual(len(format_report['warnings']), int(warns), content)
+            finally:
+                os.remove(path)
+
+    def test_stream_all_errors(self):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('1\tTRUE\n3\tmaybe\n4\tFALSE\n4\tHALF-TRUE\n5\tHALF-TRUE\n')
+        try:
+            format_report = task2.check_format_stream(path)
+            self.assertEqual([(error['line'], error['type']) for error in format_report['errors']],
+                             [(2, report.ERROR_FORMAT), (4, report.ERROR_DUPLICATE), (None, report.ERROR_MISSING),
+                              (None, report.ERROR_MISSING)])
+        finally:
+            os.remove(path)
+
+
+class TSVColumns(TestCase):
+    def _read_columns(self, content, num_columns, **kwargs):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        try:
+            return tsv.read_columns(path, num_columns, **kwargs)
+        finally:
+            os.remove(path)
+
+    def test_read_columns(self):
+        columns = self._read_columns(b'1\t0.5\tx\r\n2\t-.25\tyz\r\n\n', 3)
+        self.assertEqual(tsv.to_ints(columns[0]).tolist(), [1, 2])
+        self.assertEqual(tsv.to_floats(columns[1]).tolist(), [0.5, -0.25])
+        self.assertEqual(tsv.to_strings(columns[2]).tolist(), ['x', 'yz'])
+        self.assertIsNone(tsv.to_ints(columns[1]))
+        self.assertIsNone(tsv.to_floats(columns[2]))
+
+    def test_fallback(self):
+        for content in [b'', b'\n', b'1\t2\n3\n', b'1\t2\t3\n', b'1\t2\n\n3\t4\n', b'1\t2 \n3\t4\n', b'1\t2\r3\t4\n']:
+            self.assertIsNone(self._read_columns(content, 2), content)
+        self.assertIsNone(self._read_columns(b'1\t"a"\n', 2, csv_quoting=True))
+        self.assertIsNotNone(self._read_columns(b'1\ta"\n', 2, csv_quoting=True))
+
+        pattern = tsv.file_pattern('[1-9]\t(?:a|b)')
+        self.assertIsNotNone(self._read_columns(b'1\ta\n2\tb\n', 2, pattern=pattern))
+        self.assertIsNone(self._read_columns(b'1\ta\n2\tc\n', 2, pattern=pattern))
+
+    def test_content_bounds(self):
+        window = tsv._BOUNDS_WINDOW
+        tsv._BOUNDS_WINDOW = 4
+        try:
+            for content in [b'', b' ', b'\n \r\n\t\n\n\n\n', b'x', b'1\t2', b'\n\n\n\n\n1\t2\n3\t4\n\n\n\n\n\n',
+                            b' \n\n\n\n\n\n\n\n1\t2 \t\n\n\n', b'1\t2\n\n\n\n\n\n\n\n\n\n\n\n']:
+                stripped = content.strip()
+                expected = (content.index(stripped), content.index(stripped) + len(stripped)) if stripped else None
+                self.assertEqual(tsv._content_bounds(np.frombuffer(content, dtype=np.uint8)), expected, content)
+            columns = self._read_columns(b'\n\n\n\n\n1\ta\n2\tb\n\n\n\n\n\n', 2)
+            self.assertEqual(tsv.to_strings(columns[1]).tolist(), ['a', 'b'])
+        finally:
+            tsv._BOUNDS_WINDOW = window
+
+    def test_checker_fallback(self):
+        # Files, which are not parsed with NumPy, are checked line by line with the same result.
+        for _file in FormatCheckerTask1._OK_FILES + FormatCheckerTask1._NOT_OK_FILES:
+            path = join(_TEST_DATA_FOLDER, _file)
+            self.assertEqual(task1._parse_valid_file(path) is not None, task1.check_format(path))
+        for _file in FormatCheckerTask2._OK_FILES + FormatCheckerTask2._NOT_OK_FILES:
+            path = join(_TEST_DATA_FOLDER, _file)
+            self.assertEqual(task2._parse_valid_file(path) is not None, task2.check_format(path))
@@ -0,0 +1,191 @@
+import mmap
+import re
+
+import numpy as np
+"""
+Vectorized reading of TAB separated files, shared by the format checkers and the scorers.
+
+A file is memory-mapped and split into columns with NumPy, so that no Python object is created per line.
+The fields of a column are returned as a fixed-width bytes array, which can be converted to numbers at once.
+Whenever a file is not in the plain form expected here (e.g. a line with a different number of fields,
+whitespace around a line, csv quoting or a value, which is not a number), None is returned
+and the callers fall back to their per-line parsing, which also reports the exact problem.
+"""
+
+_TAB = ord('\t')
+_NEWLINE = ord('\n')
+_CARRIAGE_RETURN = ord('\r')
+_QUOTE = ord('"')
+_ZERO, _NINE = ord('0'), ord('9')
+# Lookup table of the bytes, which str.strip() removes from an ASCII text.
+_IS_WHITESPACE = np.zeros(256, dtype=bool)
+_IS_WHITESPACE[[ord(c) for c in ' \t\n\r\x0b\x0c']] = True
+# Number of bytes, which are searched at once for the first and the last non-whitespace byte.
+_BOUNDS_WINDOW = 2 ** 16
+
+
+def file_pattern(line_pattern, flags=0):
+    """
+    Compiles a bytes pattern, which matches a whole (stripped) file with lines matching line_pattern.
+    :param line_pattern: regular expression for a single line, without the ^ and $ anchors.
+    :param flags: flags for re.compile.
+    """
+    return re.compile('(?:{0})(?:\r?\n(?:{0}))*'.format(line_pattern).encode('ascii'), flags)
+
+
+def read_columns(file_path, num_columns, pattern=None, csv_quoting=False):
+    """
+    Reads the columns of a TAB separated file.
+    Leading and trailing whitespace of the whole file is ignored, as well as '\r\n' line endings.
+    :param file_path: path to the file.
+    :param num_columns: number of fields in each line.
+    :param pattern: optional pattern from file_pattern, which the whole file should match.
+    :param csv_quoting: whether fields starting with a quote would be unquoted by the csv reader of the caller.
+    :return: list with a bytes array for each column; None if the file is empty or not in the expected form.
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            return None
+
+    try:
+        return _read_mapped(mapped, num_columns, pattern, csv_quoting)
+    finally:
+        mapped.close()
+
+
+def split_columns(buffer, num_columns, pattern=None, csv_quoting=False):
+    """
+    Splits the lines in a bytes buffer, e.g. a chunk of whole lines of a file too large to map at once,
+    into columns in the same way as read_columns.
+    :return: list with a bytes array for each column; None if the buffer is blank or not in the expected form.
+    """
+    return _read_mapped(buffer, num_columns, pattern, csv_quoting)
+
+
+def _read_mapped(mapped, num_columns, pattern, csv_quoting):
+    """ Reads the columns of a memory-mapped file. All arrays viewing the map are released on return. """
+    data = np.frombuffer(mapped, dtype=np.uint8)
+    bounds = _content_bounds(data)
+    if bounds is None:
+        return None
+    start, end = bounds
+    if (data[start:end] == 0).any():
+        return None
+    if pattern is not None and not pattern.fullmatch(mapped, start, end):
+        return None
+    # The fields are copied out of the map, so that it can be closed.
+    return _split_columns(data, start, end, num_columns, csv_quoting)
+
+
+def _content_bounds(data):
+    """
+    Finds the content of the data without the leading and trailing whitespace, scanning inward from each end
+    in windows of _BOUNDS_WINDOW bytes, so that no array of the size of the data is allocated.
+    :return: (start, end) offsets of the content; None if the data is blank.
+    """
+    start = 0
+    while True:
+        if start >= len(data):
+            return None
+        is_content = ~_IS_WHITESPACE[data[start:start + _BOUNDS_WINDOW]]
+        if is_content.any():
+            start += int(is_content.argmax())
+            break
+        start += _BOUNDS_WINDOW
+
+    # The byte at start is not whitespace, so the backward scan stops at it at the latest.
+    end = len(data)
+    while True:
+        window_start = max(end - _BOUNDS_WINDOW, start)
+        is_content = ~_IS_WHITESPACE[data[window_start:end]]
+        if is_content.any():
+            return start, end - int(is_content[::-1].argmax())
+        end = window_start
+
+
+def _split_columns(data, start, end, num_columns, csv_quoting):
+    """ Finds the fields of each line between the start and end offsets of the data and copies them. """
+    data = data[start:end]
+    separators = np.flatnonzero((data == _TAB) | (data == _NEWLINE))
+    is_newline = data[separators] == _NEWLINE
+    num_lines = np.count_nonzero(is_newline) + 1
+    if len(separators) != num_lines * num_columns - 1:
+        return None
+
+    # Each line should have exactly num_columns-1 TABs, followed by a newline.
+    separators = np.append(separators, len(data)).reshape(num_lines, num_columns)
+    if (data[separators[:, :-1]] != _TAB).any() or (data[separators[:-1, -1]] != _NEWLINE).any():
+        return None
+
+    starts = np.empty_like(separators)
+    starts[0, 0] = 0
+    starts[1:, 0] = separators[:-1, -1] + 1
+    starts[:, 1:] = separators[:, :-1] + 1
+    ends = separators.copy()
+    # Drop the '\r' of '\r\n' line endings.
+    has_carriage_return = ends[:, -1] > starts[:, -1]
+    has_carriage_return[has_carriage_return] = data[ends[has_carriage_return, -1] - 1] == _CARRIAGE_RETURN
+    ends[:, -1] -= has_carriage_return
+    # Any other '\r' is a line break for files read in text mode.
+    if np.count_nonzero(data == _CARRIAGE_RETURN) != np.count_nonzero(has_carriage_return):
+        return None
+
+    # The lines should not start or end with whitespace, which is stripped by the per-line parsing.
+    if (ends[:, -1] <= starts[:, 0]).any() or _IS_WHITESPACE[data[starts[:, 0]]].any() or \
+            _IS_WHITESPACE[data[ends[:, -1] - 1]].any():
+        return None
+    if csv_quoting:
+        non_empty = ends > starts
+        if (data[starts[non_empty]] == _QUOTE).any():
+            return None
+
+    return [_field_bytes(data, starts[:, i], ends[:, i]) for i in range(num_columns)]
+
+
+def _field_bytes(data, starts, ends):
+    """ Copies the fields between starts and ends into a fixed-width bytes array, padded with null bytes. """
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    offsets = np.arange(width)
+    indexes = np.minimum(starts[:, None] + offsets, len(data) - 1)
+    fields = np.where(offsets < lengths[:, None], data[indexes], 0).astype(np.uint8)
+    return fields.view('S{}'.format(width)).reshape(-1)
+
+
+def to_ints(fields):
+    """
+    Converts a bytes array with non-negative integers.
+    :return: int64 array; None if some of the fields is not made of digits only.
+    """
+    digits = fields.view(np.uint8).reshape(len(fields), -1)
+    lengths = np.count_nonzero(digits, axis=1)
+    is_digit = (digits >= _ZERO) & (digits <= _NINE)
+    # Longer numbers may not fit in int64.
+    if (lengths == 0).any() or (is_digit.sum(axis=1) != lengths).any() or digits.shape[1] > 18:
+        return None
+    return fields.astype(np.int64)
+
+
+def to_floats(fields):
+    """
+    Converts a bytes array with decimal numbers.
+    :return: float64 array; None if some of the fields is not a number.
+    """
+    try:
+        return fields.astype(np.float64)
+    except ValueError:
+        return None
+
+
+def to_strings(fields):
+    """
+    Decodes a bytes array with ASCII fields.
+    :return: str array; None if some of the fields is not ASCII.
+    """
+    try:
+        return fields.astype(np.str_)
+    except UnicodeDecodeError:
+        return None
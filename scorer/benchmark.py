@@ -0,0 +1,143 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from scorer import gold_cache, out_of_core, task1
+"""
+Benchmark of the in-memory and the out-of-core scoring of Task 1 on a synthetic debate with many lines.
+
+Each scorer runs in a fresh process, which reports its wall time and its peak resident memory,
+along with the memory of the process before scoring (the interpreter with NumPy).
+The gold file is cached before the measurements, so that parsing it is not measured.
+"""
+
+logger = logging.getLogger(__name__)
+
+_WRITE_CHUNK_LINES = 2 ** 20
+MODES = ['in_memory', 'out_of_core']
+# Seconds to wait for a measurement at once, before checking whether its process is still running.
+_POLL_SECONDS = 1
+
+
+def write_debate(gold_fpath, pred_fpath, num_lines, relevant_ratio=0.05, seed=0):
+    """ Writes a Task 1 gold file with num_lines lines and a pred file with random scores for them. """
+    random_state = np.random.RandomState(seed)
+    with open(gold_fpath, 'w') as gold_f:
+        for start in range(1, num_lines + 1, _WRITE_CHUNK_LINES):
+            line_numbers = np.arange(start, min(start + _WRITE_CHUNK_LINES, num_lines + 1))
+            labels = (random_state.rand(len(line_numbers)) < relevant_ratio).astype(int)
+            gold_f.write(''.join(['{}\tSPEAKER\ttext\t{}\n'.format(line_number, label)
+                                  for line_number, label in zip(line_numbers.tolist(), labels.tolist())]))
+
+    line_numbers = random_state.permutation(num_lines) + 1
+    with open(pred_fpath, 'w') as pred_f:
+        for start in range(0, num_lines, _WRITE_CHUNK_LINES):
+            chunk = line_numbers[start:start + _WRITE_CHUNK_LINES]
+            scores = random_state.rand(len(chunk))
+            pred_f.write(''.join(['{}\t{!r}\n'.format(line_number, score)
+                                  for line_number, score in zip(chunk.tolist(), scores.tolist())]))
+
+
+def _prepare(gold_fpath, pred_fpath, num_lines):
+    write_debate(gold_fpath, pred_fpath, num_lines)
+    gold_cache.load_gold(gold_fpath, 1)
+
+
+def _peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(mode, gold_fpath, pred_fpath, chunk_size, results):
+    start_memory = _peak_memory_mb()
+    start = time.perf_counter()
+    if mode == 'in_memory':
+        _, _, avg_precision, _, _ = task1._evaluate_files(gold_fpath, pred_fpath, task1.MAIN_THRESHOLDS)
+    elif mode == 'out_of_core':
+        avg_precision = out_of_core.evaluate(gold_fpath, pred_fpath, chunk_size=chunk_size)['avg_precision']
+    else:
+        raise ValueError('Unknown mode {}, use one of: {}'.format(mode, ', '.join(MODES)))
+    results.put({
+        'mode': mode,
+        'seconds': time.perf_counter() - start,
+        'start_memory_mb': start_memory,
+        'peak_memory_mb': _peak_memory_mb(),
+        'avg_precision': avg_precision,
+    })
+
+
+def _get_measurement(process, results, mode):
+    """
+    Waits for the measurement of a process.
+    :raises RuntimeError: if the process exits without a measurement, e.g. on an error.
+    """
+    while process.exitcode is None:
+        try:
+            return results.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    # The measurement may still be in the queue after the process exited.
+    try:
+        return results.get(timeout=_POLL_SECONDS)
+    except queue.Empty:
+        raise RuntimeError('Measuring {} failed with exit code {}'.format(mode, process.exitcode))
+
+
+def run_benchmark(num_lines, chunk_size=out_of_core.DEFAULT_CHUNK_SIZE, modes=tuple(MODES)):
+    """
+    Scores a synthetic debate with each of the modes, each in a new process.
+    :return: list with a dict of the measurements for each mode.
+    :raises RuntimeError: if preparing the debate or a measurement fails.
+    """
+    work_dir = tempfile.mkdtemp()
+    previous_cache_dir = os.environ.get('CLEF2018_CACHE_DIR')
+    try:
+        gold_fpath = os.path.join(work_dir, 'gold.txt')
+        pred_fpath = os.path.join(work_dir, 'pred.txt')
+        # The new processes read the cache directory from the environment.
+        os.environ['CLEF2018_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        context = multiprocessing.get_context('spawn')
+        # The data is prepared in another process too, as the peak memory of this one is inherited by the others.
+        process = context.Process(target=_prepare, args=(gold_fpath, pred_fpath, num_lines))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError('Preparing the debate failed with exit code {}'.format(process.exitcode))
+
+        results = context.Queue()
+        measurements = []
+        for mode in modes:
+            process = context.Process(target=_measure, args=(mode, gold_fpath, pred_fpath, chunk_size, results))
+            process.start()
+            measurements.append(_get_measurement(process, results, mode))
+            process.join()
+        return measurements
+    finally:
+        if previous_cache_dir is None:
+            os.environ.pop('CLEF2018_CACHE_DIR', None)
+        else:
+            os.environ['CLEF2018_CACHE_DIR'] = previous_cache_dir
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_lines", help="Number of lines of the synthetic debate.", type=int, default=2000000)
+    parser.add_argument("--chunk_size", help="Bytes of the pred file, which the out-of-core scorer ranks at once.",
+                        type=int, default=out_of_core.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logger.info('{:<15}{:>12}{:>20}{:>20}{:>15}'.format('MODE', 'SECONDS', 'START MEMORY (MB)', 'PEAK MEMORY (MB)',
+                                                        'AP'))
+    for measurement in run_benchmark(args.num_lines, args.chunk_size):
+        logger.info('{mode:<15}{seconds:>12.2f}{start_memory_mb:>20.1f}{peak_memory_mb:>20.1f}'
+                    '{avg_precision:>15.6f}'.format(**measurement))
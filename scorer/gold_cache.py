@@ -0,0 +1,227 @@
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from os.path import expanduser, isdir, join
+
+import numpy as np
+
+from format_checker import tsv
+"""
+Binary cache of the parsed gold files, shared by the scorers and the baselines.
+
+Each gold file is parsed only once into NumPy arrays - a column of the file each - which are stored as .npy files
+in a directory named after the SHA-1 hash of the file content. A changed gold file has a different hash,
+so it is parsed again automatically. The arrays are loaded lazily and memory-mapped.
+
+Numeric columns are stored as int64 arrays (a missing claim_number, 'N/A' in the file, is stored as -1),
+the short label column of Task 2 as a str array and the text columns as the UTF-8 bytes of all values
+with an array of offsets.
+
+The cache directory is taken from the CLEF2018_CACHE_DIR environment variable and defaults to
+~/.cache/clef2018-factchecking. Caching is disabled with set_cache_dir(None).
+"""
+
+logger = logging.getLogger(__name__)
+
+TASK1_COLUMNS = ['line_number', 'speaker', 'text', 'label']
+TASK2_COLUMNS = ['line_number', 'speaker', 'text', 'claim_number', 'normalized_claim', 'label']
+_TEXT_COLUMNS = {'speaker', 'text', 'normalized_claim'}
+_NO_CLAIM = 'N/A'
+# Changing the stored arrays requires a new version, so that old cache entries are not used.
+_CACHE_VERSION = 1
+_HASH_CHUNK_SIZE = 2 ** 20
+
+_cache_dir = os.environ.get('CLEF2018_CACHE_DIR', join(expanduser('~'), '.cache', 'clef2018-factchecking'))
+
+
+def set_cache_dir(cache_dir):
+    """ Sets the directory of the cache; None disables caching, so the gold files are always parsed. """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def get_cache_dir():
+    return _cache_dir
+
+
+def content_hash(file_path):
+    """ Computes the SHA-1 hash of the file content, as a hex string. """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _column_names(task):
+    return TASK1_COLUMNS if task == 1 else TASK2_COLUMNS
+
+
+def load_gold(gold_fpath, task, columns=None):
+    """
+    Loads the columns of a gold file from the cache, parsing and caching the file if needed.
+    :param gold_fpath: path to a gold file of Task 1 or Task 2.
+    :param task: 1 or 2.
+    :param columns: names of the columns to load; all columns by default.
+    :return: {column:values} dict, with arrays for the numeric and label columns
+    and lists of strings for the text columns.
+    :raises ValueError: if the gold file cannot be parsed.
+    """
+    columns = _column_names(task) if columns is None else columns
+    if _cache_dir is None:
+        return _select_columns(_parse_gold(gold_fpath, task), columns)
+
+    entry_dir = join(_cache_dir, 'gold', 'task{}-v{}-{}'.format(task, _CACHE_VERSION, content_hash(gold_fpath)))
+    if not isdir(entry_dir):
+        arrays = _parse_gold(gold_fpath, task)
+        try:
+            _write_entry(entry_dir, arrays)
+        except OSError as e:
+            logger.warning('Cannot cache gold file {}: {}'.format(gold_fpath, e))
+        return _select_columns(arrays, columns)
+
+    return _select_columns({name: _load_array(entry_dir, name) for name in _stored_names(columns)}, columns)
+
+
+def _stored_names(columns):
+    """ Names of the stored arrays of the columns. """
+    names = []
+    for column in columns:
+        names.append(column)
+        if column in _TEXT_COLUMNS:
+            names.append(column + '_offsets')
+    return names
+
+
+def _load_array(entry_dir, name):
+    return np.load(join(entry_dir, name + '.npy'), mmap_mode='r')
+
+
+def _write_entry(entry_dir, arrays):
+    """ Writes the arrays of a gold file into a temporary directory, which is then renamed atomically. """
+    parent_dir = os.path.dirname(entry_dir)
+    if not isdir(parent_dir):
+        os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(join(tmp_dir, name + '.npy'), array)
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Another process may have cached the same file in the meantime.
+        if not isdir(entry_dir):
+            raise
+
+
+def _select_columns(arrays, columns):
+    """ Picks the columns from the stored arrays, decoding the text columns. """
+    selected = {}
+    for column in columns:
+        if column in _TEXT_COLUMNS:
+            selected[column] = _decode_texts(arrays[column], arrays[column + '_offsets'])
+        else:
+            selected[column] = arrays[column]
+    return selected
+
+
+def _encode_texts(texts):
+    """ Encodes strings into an uint8 array with their UTF-8 bytes and an array with the offset of each string. """
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8).copy(), offsets
+
+
+def _field_texts(fields):
+    """ Converts a bytes array, as returned by tsv.read_columns, to the arrays of _encode_texts at once. """
+    fields = fields.view(np.uint8).reshape(len(fields), -1)
+    is_byte = fields != 0
+    offsets = np.zeros(len(fields) + 1, dtype=np.int64)
+    np.cumsum(np.count_nonzero(is_byte, axis=1), out=offsets[1:])
+    return fields[is_byte], offsets
+
+
+def _decode_texts(data, offsets):
+    text = np.asarray(data).tobytes()
+    offsets = np.asarray(offsets).tolist()
+    return [text[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _parse_claim_numbers(claim_numbers):
+    """ Converts claim_number strings to ints; -1 if the line is not a claim. """
+    parsed = []
+    for claim_number in claim_numbers:
+        if claim_number == _NO_CLAIM:
+            parsed.append(-1)
+        elif claim_number.isdigit() and str(int(claim_number)) == claim_number:
+            parsed.append(int(claim_number))
+        else:
+            raise ValueError('Wrong claim_number in a gold file: {}'.format(claim_number))
+    return np.array(parsed, dtype=np.int64)
+
+
+def _parse_gold(gold_fpath, task):
+    """
+    Parses all columns of a gold file into the arrays, which are stored in the cache.
+    :raises ValueError: if some line does not have the columns of the task.
+    """
+    logger.info("Parsing gold file {}".format(gold_fpath))
+    column_names = _column_names(task)
+    arrays = _parse_gold_fields(gold_fpath, task)
+    if arrays is not None:
+        return arrays
+
+    # Some of the gold files start with a byte order mark.
+    with open(gold_fpath, encoding='utf-8-sig') as gold_f:
+        rows = [row for row in csv.reader(gold_f, delimiter='\t') if row]
+    for i, row in enumerate(rows):
+        if len(row) != len(column_names):
+            raise ValueError('Expected {} columns in row {} of gold file {}, found {}.'.format(
+                len(column_names), i + 1, gold_fpath, len(row)))
+
+    arrays = {}
+    for column, values in zip(column_names, zip(*rows) if rows else [[]] * len(column_names)):
+        if column in _TEXT_COLUMNS:
+            arrays[column], arrays[column + '_offsets'] = _encode_texts(values)
+        elif column == 'claim_number':
+            arrays[column] = _parse_claim_numbers(values)
+        elif column == 'label' and task == 2:
+            arrays[column] = np.array(values, dtype=np.str_)
+        else:
+            arrays[column] = np.array([int(value) for value in values], dtype=np.int64)
+    return arrays
+
+
+def _parse_gold_fields(gold_fpath, task):
+    """ Parses a gold file in the plain form with NumPy; None if it should be parsed with the csv reader. """
+    column_names = _column_names(task)
+    fields = tsv.read_columns(gold_fpath, len(column_names), csv_quoting=True)
+    if fields is None:
+        return None
+
+    arrays = {}
+    for column, values in zip(column_names, fields):
+        if column in _TEXT_COLUMNS:
+            arrays[column], arrays[column + '_offsets'] = _field_texts(values)
+            continue
+
+        if column == 'claim_number':
+            is_claim = values != _NO_CLAIM.encode('ascii')
+            claim_numbers = tsv.to_ints(values[is_claim])
+            # The claim_numbers are used as strings by the scorer, so they should not have leading zeros.
+            if claim_numbers is None or (values[is_claim].view(np.uint8)[::values.itemsize] == ord('0')).any():
+                return None
+            parsed = np.full(len(values), -1, dtype=np.int64)
+            parsed[is_claim] = claim_numbers
+        elif column == 'label' and task == 2:
+            parsed = tsv.to_strings(values)
+        else:
+            parsed = tsv.to_ints(values)
+        if parsed is None:
+            return None
+        arrays[column] = parsed
+    return arrays
@@ -0,0 +1,240 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain
+
+from scorer import task1
+"""
+Incremental evaluation of Task 1, for scores which stream in while a debate is transcribed.
+
+The scored lines, and separately the relevant ones among them, are kept ranked in order-statistics structures:
+a sorted list split into blocks, with a Fenwick tree over the block sizes. Adding or re-scoring a line takes
+O(log n) steps (plus moving at most a block of keys), and so do the rank of a line and the line at a rank.
+P@N, R-Precision and RR take O(log n) steps to compute.
+AP keeps the running sums of the precisions of the relevant lines, in the order of the ranking. Scoring a line
+changes the rank, and so the precision, of every relevant line below it, so only the sums of the relevant lines
+ranked above all lines scored since the last computation are kept, and the others are recomputed in O(log n) steps
+each. Lines scored low, which are most of a debate, thus cost little, but a line scored above all relevant lines
+makes AP take O(R log n) steps, where R is the number of relevant lines scored so far: a shift of the ranks changes
+each precision by a different amount, so their sum cannot be updated in sub-linear time.
+The metrics are computed at most once between updates, so reading them again without new scores costs nothing.
+The metrics of the lines scored so far equal those of task1.evaluate on a pred file with these lines,
+written in the order in which they were first scored.
+"""
+
+# Maximum number of keys in a block is twice this number.
+_BLOCK_SIZE = 256
+
+
+class _OrderStatistics:
+    """ Sorted list of unique keys, which supports the rank of a key and the key at a rank. """
+
+    def __init__(self):
+        self._blocks = []
+        self._maxes = []
+        self._tree = [0]
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+        else:
+            idx = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+            block = self._blocks[idx]
+            insort(block, key)
+            self._maxes[idx] = block[-1]
+            if len(block) > 2 * _BLOCK_SIZE:
+                self._blocks[idx:idx + 1] = [block[:_BLOCK_SIZE], block[_BLOCK_SIZE:]]
+                self._maxes[idx:idx + 1] = [block[_BLOCK_SIZE - 1], block[-1]]
+                self._rebuild_tree()
+            else:
+                self._add_to_tree(idx, 1)
+        self._len += 1
+
+    def remove(self, key):
+        idx = bisect_left(self._maxes, key)
+        block = self._blocks[idx]
+        del block[bisect_left(block, key)]
+        if block:
+            self._maxes[idx] = block[-1]
+            self._add_to_tree(idx, -1)
+        else:
+            del self._blocks[idx]
+            del self._maxes[idx]
+            self._rebuild_tree()
+        self._len -= 1
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def rank(self, key, right=False):
+        """ Number of keys smaller than key, or with right - not greater than key. """
+        # Only the first block with a maximum not smaller than key may hold both smaller and greater keys.
+        idx = bisect_left(self._maxes, key)
+        if idx == len(self._blocks):
+            return self._len
+        bisect = bisect_right if right else bisect_left
+        return self._prefix_size(idx) + bisect(self._blocks[idx], key)
+
+    def __getitem__(self, rank):
+        """ The key at a (0-based) rank. """
+        # Descends the Fenwick tree to the block holding the rank.
+        idx = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if idx + step < len(self._tree) and self._tree[idx + step] <= rank:
+                idx += step
+                rank -= self._tree[idx]
+            step >>= 1
+        return self._blocks[idx][rank]
+
+    def _rebuild_tree(self):
+        """ Builds the Fenwick tree (1-based) over the sizes of the blocks in linear time. """
+        self._tree = [0] + [len(block) for block in self._blocks]
+        for idx in range(1, len(self._tree)):
+            parent = idx + (idx & -idx)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[idx]
+
+    def _add_to_tree(self, block_idx, delta):
+        idx = block_idx + 1
+        while idx < len(self._tree):
+            self._tree[idx] += delta
+            idx += idx & -idx
+
+    def _prefix_size(self, block_idx):
+        """ Number of keys in the blocks before block_idx. """
+        size = 0
+        while block_idx > 0:
+            size += self._tree[block_idx]
+            block_idx -= block_idx & -block_idx
+        return size
+
+
+class IncrementalEvaluator:
+    """
+    Ranking metrics of a debate, updated as (line_number, score) pairs stream in.
+    A line_number may be scored again, it then keeps its place among the lines with an equal score.
+    """
+
+    def __init__(self, gold_labels, thresholds=None):
+        """
+        :param gold_labels: {line_number:label} dict, as returned by task1._read_gold.
+        :param thresholds: list of N values for Precision@N. If not specified - task1.MAIN_THRESHOLDS.
+        """
+        self.thresholds = task1.MAIN_THRESHOLDS if thresholds is None else thresholds
+        self._relevant = {line_number for line_number, label in gold_labels.items() if label == 1}
+        self._gold_line_numbers = set(gold_labels)
+        # The key of a line is (-score, order of the first score), which ranks ties as a stable sort of a pred file.
+        self._keys = {}
+        self._ranking = _OrderStatistics()
+        self._relevant_ranking = _OrderStatistics()
+        # The running sums of the precisions of the first relevant lines, which are ranked above _changed_key,
+        # the smallest key added or removed since they were computed.
+        self._precision_sums = []
+        self._changed_key = None
+        # The metrics of the current ranking, None after an update.
+        self._metrics = None
+
+    @classmethod
+    def from_gold_file(cls, gold_fpath, thresholds=None):
+        return cls(task1._read_gold(gold_fpath), thresholds)
+
+    def __len__(self):
+        """ Number of scored lines. """
+        return len(self._keys)
+
+    def is_complete(self):
+        """ Whether all lines of the gold file are scored. """
+        return len(self._keys) == len(self._gold_line_numbers)
+
+    def update(self, line_number, score):
+        """
+        Adds the score of a line, or replaces its previous score.
+        :raises ValueError: on a line_number, which is not in the gold file, or on a NaN score.
+        """
+        if line_number not in self._gold_line_numbers:
+            raise ValueError('No such line_number: {} in gold file!'.format(line_number))
+        score = float(score)
+        if score != score:
+            raise ValueError('The score of line_number {} is not a number.'.format(line_number))
+
+        old_key = self._keys.get(line_number)
+        if old_key is None:
+            key = changed_key = (-score, len(self._keys))
+        else:
+            self._remove(line_number, old_key)
+            key = (-score,) + old_key[1:]
+            changed_key = min(key, old_key)
+        if self._changed_key is None or changed_key < self._changed_key:
+            self._changed_key = changed_key
+        self._keys[line_number] = key
+        self._ranking.add(key)
+        if line_number in self._relevant:
+            self._relevant_ranking.add(key)
+        self._metrics = None
+
+    def update_many(self, line_scores):
+        """ Adds the scores of an iterable of (line_number, score) pairs, e.g. a batch of transcribed lines. """
+        for line_number, score in line_scores:
+            self.update(line_number, score)
+
+    def _remove(self, line_number, key):
+        self._ranking.remove(key)
+        if line_number in self._relevant:
+            self._relevant_ranking.remove(key)
+
+    def _hits_at(self, threshold):
+        """ Number of relevant lines among the first threshold lines of the ranking. """
+        num_lines = len(self._ranking)
+        if not num_lines:
+            return 0
+        return self._relevant_ranking.rank(self._ranking[min(threshold, num_lines) - 1], right=True)
+
+    def metrics(self):
+        """
+        Computes the metrics of the current ranking.
+        :return: dict with the keys 'num_relevant', 'avg_precision', 'reciprocal_rank', 'r_precision' and
+        'precision_at', with the values of task1._compute_ranking_metrics for the ranking.
+        """
+        if self._metrics is None:
+            self._metrics = self._compute_metrics()
+        return dict(self._metrics, precision_at=dict(self._metrics['precision_at']))
+
+    def _update_precision_sums(self):
+        """ Recomputes the running sums of the precisions of the relevant lines ranked below _changed_key. """
+        if self._changed_key is not None:
+            del self._precision_sums[self._relevant_ranking.rank(self._changed_key):]
+            self._changed_key = None
+        # The precisions are summed in the order of the ranking, as in task1._compute_ranking_metrics.
+        precision_sum = self._precision_sums[-1] if self._precision_sums else 0.0
+        for hits in range(len(self._precision_sums) + 1, len(self._relevant_ranking) + 1):
+            precision_sum += hits / (self._ranking.rank(self._relevant_ranking[hits - 1]) + 1)
+            self._precision_sums.append(precision_sum)
+
+    def _compute_metrics(self):
+        num_lines = len(self._ranking)
+        num_relevant = len(self._relevant_ranking)
+
+        avg_precision = 0.0
+        reciprocal_rank = 0.0
+        if num_relevant:
+            self._update_precision_sums()
+            avg_precision = self._precision_sums[-1] / num_relevant
+            reciprocal_rank = 1.0 / (self._ranking.rank(self._relevant_ranking[0]) + 1)
+
+        r_precision = 0.0
+        if num_lines:
+            r_rank = min(num_relevant, num_lines)
+            r_precision = self._hits_at(r_rank) / r_rank if r_rank else self._hits_at(num_lines) / num_lines
+
+        return {
+            'num_relevant': num_relevant,
+            'avg_precision': avg_precision,
+            'reciprocal_rank': reciprocal_rank,
+            'r_precision': r_precision,
+            'precision_at': {threshold: self._hits_at(threshold) / threshold for threshold in self.thresholds},
+        }
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import json
+import logging
+import os
+
+from scorer import task1, task2
+from scorer.pool import pool_map
+"""
+Batch scoring of many runs (e.g. all team submissions) for Task 1 or Task 2.
+Each gold file is read only once and all runs are scored against it.
+
+The runs directory should contain one subdirectory per run, holding a prediction file for each debate,
+named as the gold file of the debate:
+<runs_dir>/<run_name>/<gold_file_name>
+"""
+
+logger = logging.getLogger(__name__)
+
+# Name of the debate column for the metrics over all debates (mean for Task 1, pooled claims for Task 2).
+ALL_DEBATES = 'ALL'
+TASK1_METRICS = task1.MAIN_METRICS
+TASK2_METRICS = task2.MAIN_METRICS
+
+
+def read_golds(task, gold_files):
+    """
+    Reads all gold files once.
+    :param task: 1 or 2.
+    :param gold_files: list with paths to the gold files.
+    :return: {debate_name:gold_labels} dict, where debate_name is the gold file name.
+    """
+    scorer = task1 if task == 1 else task2
+    return {os.path.basename(gold_file): scorer._read_gold(gold_file) for gold_file in gold_files}
+
+
+# Gold data of the debates, shared by all evaluations in a (worker) process.
+_golds = {}
+
+
+def _set_golds(golds):
+    _golds.clear()
+    _golds.update(golds)
+
+
+def score_pred(task, gold_labels, pred_file):
+    """
+    Checks and scores a pred file of a single debate against already read gold data.
+    :param task: 1 or 2.
+    :param gold_labels: the gold labels of the debate, as returned by read_golds.
+    :return: {metric:value} dict of the debate for Task 1 or the confusion matrix for Task 2.
+    :raises ValueError: if the pred file is badly formatted or does not match the gold data.
+    """
+    scorer = task1 if task == 1 else task2
+    # The format of the pred file is checked while reading it.
+    pred = scorer._check_and_read_pred(pred_file, gold_labels)
+    if task == 2:
+        return task2._compute_confusion_matrix(gold_labels, pred)
+
+    relevance = task1._compute_relevance(task1._gold_label_lookup(gold_labels), *pred)
+    metrics = task1._compute_ranking_metrics(relevance)
+    debate_results = {
+        'avg_precision': metrics['avg_precision'],
+        'reciprocal_rank': metrics['reciprocal_rank'],
+        'r_precision': metrics['r_precision'],
+    }
+    for th in task1.MAIN_THRESHOLDS:
+        debate_results['precision@{}'.format(th)] = metrics['precision_at'][th]
+    return debate_results
+
+
+def _score_debate(task, debate, pred_file, golds=None):
+    """
+    Scores the pred file of a single run for a single debate against the shared gold data.
+    :param golds: {debate_name:gold_labels} dict; the gold data shared by the worker process if not given.
+    :return: the metrics dict of the debate for Task 1 or the confusion matrix for Task 2;
+    None if the file is missing, badly formatted or does not match the gold file.
+    """
+    if not os.path.isfile(pred_file):
+        logger.error('Missing pred file {}. Cannot score the run.'.format(pred_file))
+        return None
+
+    try:
+        return score_pred(task, (_golds if golds is None else golds)[debate], pred_file)
+    except ValueError as e:
+        logger.error('Cannot score pred file {}: {}'.format(pred_file, e))
+        return None
+
+
+def _reduce_run(task, debate_results):
+    """
+    Combines the partial results of all debates of a run.
+    :param debate_results: {debate_name:partial result} dict with the results of _score_debate.
+    :return: {debate_name:{metric:value}} dict, with an additional ALL_DEBATES entry.
+    """
+    if task == 2:
+        results = {debate: task2._compute_metrics(conf_matrix) for debate, conf_matrix in debate_results.items()}
+        results[ALL_DEBATES] = task2._compute_metrics(task2._add_confusion_matrices(debate_results.values()))
+        return results
+
+    results = dict(debate_results)
+    results[ALL_DEBATES] = {metric: sum([results[debate][metric] for debate in debate_results]) / len(debate_results)
+                            for metric in TASK1_METRICS}
+    return results
+
+
+def score_run(task, golds, run_dir):
+    """
+    Scores a single run against the already read gold files.
+    :param task: 1 or 2.
+    :param golds: {debate_name:gold_labels} dict, as returned by read_golds.
+    :param run_dir: directory with a prediction file for each debate.
+    :return: {debate_name:{metric:value}} dict, with an additional ALL_DEBATES entry;
+    None if the run is incomplete, badly formatted or does not match the gold files.
+    """
+    return score_runs_with_golds(task, golds, [run_dir]).get(run_dir)
+
+
+def score_runs_with_golds(task, golds, run_dirs, workers=1):
+    """
+    Scores runs against the already read gold files, each (run, debate) pair in a separate job.
+    :param workers: number of worker processes. The results do not depend on it.
+    :return: {run_dir:{debate_name:{metric:value}}} dict for the runs that could be scored.
+    """
+    jobs = [(run_dir, debate) for run_dir in run_dirs for debate in golds]
+    debates = [debate for _, debate in jobs]
+    pred_files = [os.path.join(run_dir, debate) for run_dir, debate in jobs]
+    if workers <= 1:
+        # The gold data is passed directly, so that concurrent calls in the same process do not share it.
+        partials = [_score_debate(task, debate, pred_file, golds) for debate, pred_file in zip(debates, pred_files)]
+    else:
+        partials = pool_map(_score_debate, [task] * len(jobs), debates, pred_files,
+                            workers=workers, initializer=_set_golds, initargs=(golds,))
+
+    run_partials = {run_dir: {} for run_dir in run_dirs}
+    for (run_dir, debate), partial in zip(jobs, partials):
+        run_partials[run_dir][debate] = partial
+
+    results = {}
+    for run_dir, debate_results in run_partials.items():
+        if any([partial is None for partial in debate_results.values()]):
+            logger.error('Skipping run {}, as not all of its debates could be scored.'.format(run_dir))
+            continue
+        try:
+            results[run_dir] = _reduce_run(task, debate_results)
+        except ValueError as e:
+            logger.error('Cannot score the run {}: {}'.format(run_dir, e))
+    return results
+
+
+def score_runs(task, gold_files, runs_dir, workers=1):
+    """
+    Scores all runs from a directory.
+    :param workers: number of worker processes. The results do not depend on it.
+    :return: {run_name:{debate_name:{metric:value}}} dict for the runs that could be scored.
+    """
+    golds = read_golds(task, gold_files)
+
+    run_names = [run_name for run_name in sorted(os.listdir(runs_dir))
+                 if os.path.isdir(os.path.join(runs_dir, run_name))]
+    logger.info('Scoring {} runs'.format(len(run_names)))
+    results = score_runs_with_golds(task, golds, [os.path.join(runs_dir, run_name) for run_name in run_names],
+                                    workers)
+    return {os.path.basename(run_dir): run_results for run_dir, run_results in results.items()}
+
+
+def write_results(results, output_fpath, output_format='csv'):
+    """
+    Writes the run x debate x metric table.
+    The csv format has a row for each (run, debate, metric) triple, the json format nests them in this order.
+    """
+    with open(output_fpath, 'w') as out:
+        if output_format == 'json':
+            json.dump(results, out, indent=2, sort_keys=True)
+            return
+
+        writer = csv.writer(out)
+        writer.writerow(['run', 'debate', 'metric', 'value'])
+        for run_name, run_results in results.items():
+            for debate, metrics in run_results.items():
+                for metric, value in metrics.items():
+                    writer.writerow([run_name, debate, metric, value])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task", help="The task of the runs.", type=int, choices=[1, 2], required=True)
+    parser.add_argument(
+        "--gold_file_path",
+        help="Single string containing a comma separated list of paths to files with gold annotations.",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--runs_dir",
+        help="Directory with a subdirectory for each run, holding a pred file named as each of the gold files.",
+        type=str,
+        required=True
+    )
+    parser.add_argument("--output_file_path", help="Path to the file, where to write the results.", type=str,
+                        required=True)
+    parser.add_argument("--output_format", help="Format of the results file.", type=str, choices=['csv', 'json'],
+                        default='csv')
+    parser.add_argument("--workers", help="Number of worker processes, which score the (run, debate) pairs in parallel.",
+                        type=int, default=1)
+    args = parser.parse_args()
+
+    gold_files = [gold_file.strip() for gold_file in args.gold_file_path.split(",")]
+    if len(gold_files) != len(set(os.path.basename(gold_file) for gold_file in gold_files)):
+        logger.error('The gold files should have different names, as they are used to find the pred files.')
+    else:
+        logger.info("Started evaluating runs for Task {} ...".format(args.task))
+        results = score_runs(args.task, gold_files, args.runs_dir, args.workers)
+        write_results(results, args.output_file_path, args.output_format)
+        logger.info('Scored {} runs. Results written to {}'.format(len(results), args.output_file_path))
@@ -0,0 +1,242 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from format_checker import tsv
+from scorer import gold_cache, task1
+"""
+Out-of-core scoring of Task 1, for pred files too large to rank in memory (e.g. concatenated corpora).
+
+The pred file is read in chunks of whole lines. Each chunk is ranked by score and spilled to a temporary file as
+a sorted run of (negated score, position in the file, relevance) records. The runs are then merged with a k-way
+merge, which reads a block of each run at a time, and the metrics are accumulated from the merged relevance.
+Besides a chunk of the pred file and a block of each run, only one byte per gold line_number is kept in memory
+for the relevance lookup and one for the check that all gold lines are ranked.
+The metrics equal those of task1.evaluate, as ties are ranked in the order of the file in both.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the pred file in a chunk, which is ranked in memory and spilled as a single run.
+# Parsing a chunk takes about 30 times as much memory.
+DEFAULT_CHUNK_SIZE = 2 ** 22
+_RECORD_DTYPE = np.dtype([('neg_score', np.float64), ('position', np.int64), ('relevance', np.int8)])
+# Minimum number of records read from a run at once during the merge.
+_MIN_MERGE_BLOCK = 1024
+
+
+def _read_gold_lookups(gold_fpath):
+    """
+    Reads the relevance of the gold lines from the memory-mapped gold cache.
+    :return: (relevance lookup, gold lookup) tuple of arrays indexed by line_number, as task1._gold_label_lookup,
+    where the gold lookup tells whether a line_number is in the gold file.
+    """
+    logger.info("Reading gold predictions from file {}".format(gold_fpath))
+    gold = gold_cache.load_gold(gold_fpath, 1, ['line_number', 'label'])
+    line_numbers = np.asarray(gold['line_number'])
+    size = int(line_numbers.max()) + 1 if len(line_numbers) else 1
+    relevance_lookup = np.zeros(size, dtype=np.int8)
+    relevance_lookup[line_numbers] = np.asarray(gold['label']) == 1
+    gold_lookup = np.zeros(size, dtype=bool)
+    gold_lookup[line_numbers] = True
+    return relevance_lookup, gold_lookup
+
+
+def _iter_pred_chunks(pred_fpath, chunk_size):
+    """ Reads a pred file in chunks of whole lines. :return: generator of (line_numbers, scores) arrays. """
+    with open(pred_fpath, 'rb') as pred_f:
+        remainder = b''
+        while True:
+            data = pred_f.read(chunk_size)
+            buffer = remainder + data
+            if data:
+                end = buffer.rfind(b'\n') + 1
+                buffer, remainder = buffer[:end], buffer[end:]
+            if buffer.strip():
+                yield _parse_pred_chunk(buffer)
+            if not data:
+                return
+
+
+def _parse_pred_chunk(buffer):
+    """ Parses a chunk of whole lines of a pred file, as task1._read_pred. """
+    columns = tsv.split_columns(buffer, 2)
+    if columns is not None:
+        line_numbers, scores = tsv.to_ints(columns[0]), tsv.to_floats(columns[1])
+        if line_numbers is not None and scores is not None:
+            return line_numbers, scores
+
+    line_score = []
+    # The lines are split on '\n' only, as by the format checker and the in-memory scorer.
+    for line in buffer.decode('utf-8').split('\n'):
+        if not line.strip():
+            continue
+        line_number, score = line.split('\t')
+        line_score.append((int(line_number.strip()), float(score.strip())))
+    return np.array([t[0] for t in line_score], dtype=np.int64), np.array([t[1] for t in line_score], dtype=np.float64)
+
+
+def _spill_runs(pred_fpath, relevance_lookup, gold_lookup, spill_dir, chunk_size):
+    """
+    Ranks each chunk of the pred file and writes it to a run file, checking the line_numbers against the gold file.
+    :return: (run files, number of records in each run, number of relevant lines) tuple.
+    :raises ValueError: on a line_number, which is not in the gold file, or on missing line_numbers.
+    """
+    ranked = np.zeros(len(gold_lookup), dtype=bool)
+    run_files = []
+    run_lengths = []
+    num_relevant = 0
+    position = 0
+    for line_numbers, scores in _iter_pred_chunks(pred_fpath, chunk_size):
+        in_range = (line_numbers >= 0) & (line_numbers < len(gold_lookup))
+        is_gold = np.zeros(len(line_numbers), dtype=bool)
+        is_gold[in_range] = gold_lookup[line_numbers[in_range]]
+        if not is_gold.all():
+            raise ValueError('No such line_number: {} in gold file!'.format(line_numbers[~is_gold][0]))
+        if np.isnan(scores).any():
+            raise ValueError('The score of line_number {} is not a number.'.format(line_numbers[np.isnan(scores)][0]))
+        ranked[line_numbers] = True
+
+        # A stable sort keeps the order of the file for ties, as the sort of the whole file in task1.
+        order = np.argsort(-scores, kind='mergesort')
+        records = np.empty(len(line_numbers), dtype=_RECORD_DTYPE)
+        records['neg_score'] = -scores[order]
+        records['position'] = position + order
+        records['relevance'] = relevance_lookup[line_numbers[order]]
+        num_relevant += int(np.count_nonzero(records['relevance']))
+        position += len(line_numbers)
+
+        run_file = os.path.join(spill_dir, 'run-{}.bin'.format(len(run_files)))
+        records.tofile(run_file)
+        run_files.append(run_file)
+        run_lengths.append(len(records))
+
+    if (gold_lookup & ~ranked).any():
+        raise ValueError('The predictions do not match the lines from the gold file - missing or extra line_no')
+    return run_files, run_lengths, num_relevant
+
+
+def _merge_runs(run_files, block_size):
+    """
+    Merges the sorted runs, reading at most block_size records of each run at a time.
+    All records up to the smallest last record of the blocks in memory are sorted and emitted together.
+    :return: generator of the relevance arrays of consecutive ranks.
+    """
+    run_fs = [open(run_file, 'rb') for run_file in run_files]
+    try:
+        blocks = [np.fromfile(run_f, dtype=_RECORD_DTYPE, count=block_size) for run_f in run_fs]
+        while True:
+            active = [idx for idx, block in enumerate(blocks) if len(block)]
+            if not active:
+                return
+            # Keys are unique, as each line has a different position in the file.
+            bound = min([(blocks[idx]['neg_score'][-1], blocks[idx]['position'][-1]) for idx in active])
+            ready = []
+            for idx in active:
+                block = blocks[idx]
+                is_ready = (block['neg_score'] < bound[0]) | \
+                           ((block['neg_score'] == bound[0]) & (block['position'] <= bound[1]))
+                num_ready = int(np.count_nonzero(is_ready))
+                ready.append(block[:num_ready])
+                blocks[idx] = block[num_ready:]
+                if not len(blocks[idx]):
+                    blocks[idx] = np.fromfile(run_fs[idx], dtype=_RECORD_DTYPE, count=block_size)
+            merged = np.concatenate(ready)
+            yield merged['relevance'][np.lexsort((merged['position'], merged['neg_score']))]
+    finally:
+        for run_f in run_fs:
+            run_f.close()
+
+
+def _accumulate_metrics(relevance_blocks, num_lines, num_relevant, thresholds):
+    """
+    Computes the ranking metrics from the relevance of consecutive ranks, as task1._compute_ranking_metrics.
+    :return: dict with the keys 'num_lines', 'num_relevant', 'avg_precision', 'reciprocal_rank', 'r_precision'
+    and 'precision_at'.
+    """
+    # Ranks, at which the number of relevant lines is needed.
+    r_rank = min(num_relevant, num_lines) if num_relevant else num_lines
+    targets = {min(threshold, num_lines) for threshold in thresholds} | {r_rank}
+    hits_at = {}
+    precision_sum = np.zeros(1)
+    reciprocal_rank = 0.0
+    hits = 0
+    rank = 0
+    for relevance in relevance_blocks:
+        block_hits = hits + np.cumsum(relevance, dtype=np.int64)
+        ranks = np.arange(rank + 1, rank + len(relevance) + 1)
+        relevant = np.flatnonzero(relevance)
+        if len(relevant):
+            if not reciprocal_rank:
+                reciprocal_rank = 1.0 / int(ranks[relevant[0]])
+            # The precisions are added one by one to the running sum, as the cumsum over the whole ranking.
+            precision_sum = np.cumsum(np.append(precision_sum, block_hits[relevant] / ranks[relevant]))[-1:]
+        for target in targets:
+            if rank < target <= rank + len(relevance):
+                hits_at[target] = int(block_hits[target - rank - 1])
+        hits = int(block_hits[-1]) if len(relevance) else hits
+        rank += len(relevance)
+
+    return {
+        'num_lines': num_lines,
+        'num_relevant': num_relevant,
+        'avg_precision': float(precision_sum[0] / num_relevant) if num_relevant else 0.0,
+        'reciprocal_rank': reciprocal_rank,
+        'r_precision': hits_at[r_rank] / r_rank if num_lines else 0.0,
+        'precision_at': {threshold: (hits_at[min(threshold, num_lines)] if num_lines else 0) / threshold
+                         for threshold in thresholds},
+    }
+
+
+def evaluate(gold_fpath, pred_fpath, thresholds=None, chunk_size=DEFAULT_CHUNK_SIZE, spill_dir=None):
+    """
+    Evaluates the predicted line rankings w.r.t. a gold file in bounded memory.
+    :param gold_fpath: the original annotated gold file, where the last 4th column contains the labels.
+    :param pred_fpath: a file with line_number and score at each line.
+    :param thresholds: thresholds used for Precision@N. If not specified - task1.MAIN_THRESHOLDS.
+    :param chunk_size: bytes of the pred file, which are ranked in memory at once.
+    :param spill_dir: directory for the temporary run files; the default temporary directory if not specified.
+    :return: dict with the keys 'num_lines', 'num_relevant', 'avg_precision', 'reciprocal_rank', 'r_precision'
+    and 'precision_at' (a {N:precision@N} dict), with the values of task1.evaluate.
+    :raises ValueError: if the pred file does not match the gold file.
+    """
+    if thresholds is None:
+        thresholds = task1.MAIN_THRESHOLDS
+    relevance_lookup, gold_lookup = _read_gold_lookups(gold_fpath)
+
+    logger.info('Ranking predicted scores from file {} in chunks of {} bytes'.format(pred_fpath, chunk_size))
+    with tempfile.TemporaryDirectory(dir=spill_dir) as run_dir:
+        run_files, run_lengths, num_relevant = _spill_runs(pred_fpath, relevance_lookup, gold_lookup, run_dir,
+                                                           chunk_size)
+        # The blocks of all runs together take about as much memory as a single run.
+        block_size = max(_MIN_MERGE_BLOCK, max(run_lengths, default=0) // max(len(run_files), 1))
+        return _accumulate_metrics(_merge_runs(run_files, block_size), sum(run_lengths), num_relevant, thresholds)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gold_file_path", help="Path to the file with gold annotations.", type=str, required=True)
+    parser.add_argument("--pred_file_path", help="Path to the file with ranked line_numbers.", type=str,
+                        required=True)
+    parser.add_argument("--chunk_size", help="Bytes of the pred file, which are ranked in memory at once.", type=int,
+                        default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--spill_dir", help="Directory for the temporary files with the ranked chunks.", type=str)
+    args = parser.parse_args()
+
+    try:
+        metrics = evaluate(args.gold_file_path, args.pred_file_path, chunk_size=args.chunk_size,
+                           spill_dir=args.spill_dir)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+    logger.info('{:=^120}'.format(' RESULTS for {} '.format(os.path.basename(args.pred_file_path))))
+    task1.print_single_metric('AVERAGE PRECISION:', metrics['avg_precision'])
+    task1.print_single_metric('RECIPROCAL RANK:', metrics['reciprocal_rank'])
+    task1.print_single_metric('R-PRECISION (R={}):'.format(metrics['num_relevant']), metrics['r_precision'])
+    task1.print_thresholded_metric('PRECISION@N:', task1.MAIN_THRESHOLDS,
+                                   [metrics['precision_at'][th] for th in task1.MAIN_THRESHOLDS])
@@ -0,0 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor
+"""
+Process pool helper for scoring many debates and runs in parallel.
+"""
+
+
+def pool_map(func, *iterables, workers=1, initializer=None, initargs=()):
+    """
+    Maps func over the iterables in a pool of worker processes.
+    The results are returned in the order of the input, so reducing them does not depend on the number of workers.
+    :param func: a picklable (module level) function.
+    :param workers: number of worker processes. With a single worker func is called in the current process.
+    :param initializer: called once in each worker (or in the current process) before func, e.g. to set shared data.
+    :param initargs: arguments for initializer.
+    :return: list with the results.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return list(map(func, *iterables))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        return list(executor.map(func, *iterables))
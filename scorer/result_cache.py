@@ -0,0 +1,143 @@
+import json
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+
+from scorer.gold_cache import content_hash
+"""
+Memoization of scoring results in an SQLite file, so that byte-identical pred files are not scored again.
+
+A result is stored under the hash of the gold file content, the hash of the pred file content,
+the scorer with its version and the scoring parameters, so a cache hit does not parse any of the files.
+The least recently used results are evicted when the store has more than max_entries results.
+The memoization is disabled until a store is set with set_store. It is safe to use from multiple processes.
+"""
+
+DEFAULT_MAX_ENTRIES = 10000
+# The uses of the results are ordered by a counter, rather than by time, which may not be precise enough.
+_NEXT_USE = 'SELECT COALESCE(MAX(last_used), 0) + 1 FROM results'
+# Seconds to wait for a lock held by another process.
+_LOCK_TIMEOUT = 60
+
+_store_path = None
+_max_entries = DEFAULT_MAX_ENTRIES
+
+
+def set_store(store_path, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Sets the SQLite file, where the results are memoized.
+    :param store_path: path to the file, which is created if missing; None disables the memoization.
+    :param max_entries: maximum number of stored results.
+    """
+    global _store_path, _max_entries
+    _store_path = store_path
+    _max_entries = max_entries
+    if store_path is not None:
+        with _connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS results '
+                               '(key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+
+def get_store():
+    """ Returns the (store_path, max_entries) arguments of the last set_store, e.g. to set it in worker processes. """
+    return _store_path, _max_entries
+
+
+@contextmanager
+def _connect():
+    """ Opens a connection for a single transaction, which also works in forked worker processes. """
+    connection = sqlite3.connect(_store_path, timeout=_LOCK_TIMEOUT)
+    try:
+        with connection:
+            # The write lock is taken at the start, waiting for the other processes, as a read lock of a deferred
+            # transaction, e.g. of get, which reads and then touches a result, fails at once on its upgrade.
+            connection.execute('BEGIN IMMEDIATE')
+            yield connection
+    finally:
+        connection.close()
+
+
+def result_key(scorer, version, gold_fpath, pred_fpath, params=()):
+    """ Computes the key of a result from the contents of the files, the scorer version and the parameters. """
+    key = json.dumps([scorer, version, content_hash(gold_fpath), content_hash(pred_fpath), _encode(params)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def memoized(scorer, version, gold_fpath, pred_fpath, params, compute):
+    """
+    Returns the stored result for the files, computing and storing it if there is no such result.
+    :param scorer: name of the scoring function.
+    :param version: version of the scorer, which should change whenever its results change.
+    :param params: JSON serializable parameters of the scoring, which change the result.
+    :param compute: function without arguments, which computes the result. A None result is not stored.
+    :return: the result of compute.
+    """
+    if _store_path is None:
+        return compute()
+
+    key = result_key(scorer, version, gold_fpath, pred_fpath, params)
+    result = get(key)
+    if result is None:
+        result = compute()
+        if result is not None:
+            put(key, result)
+    return result
+
+
+def get(key):
+    """ Returns the result stored under the key, marking it as recently used; None if there is no such result. """
+    with _connect() as connection:
+        row = connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE results SET last_used = ({}) WHERE key = ?'.format(_NEXT_USE), (key,))
+    return _decode(json.loads(row[0]))
+
+
+def put(key, result):
+    """ Stores a result, evicting the least recently used results above the size limit. """
+    with _connect() as connection:
+        connection.execute('INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ({}))'
+                           .format(_NEXT_USE), (key, json.dumps(_encode(result))))
+        connection.execute('DELETE FROM results WHERE key IN '
+                           '(SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (_max_entries,))
+
+
+def num_entries():
+    with _connect() as connection:
+        return connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+def _encode(value):
+    """ Converts a result with arrays, tuples and dicts with non-string keys to a JSON serializable value. """
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': value.dtype.str, 'shape': list(value.shape)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {'__items__': [[_encode(key), _encode(item)] for key, item in value.items()]}
+    return value
+
+
+def _decode(value):
+    """ Restores a result converted with _encode. """
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if '__ndarray__' in value:
+        return np.array(value['__ndarray__'], dtype=np.dtype(value['dtype'])).reshape(value['shape'])
+    if '__tuple__' in value:
+        return tuple(_decode(item) for item in value['__tuple__'])
+    if '__items__' in value:
+        return {_decode(key): _decode(item) for key, item in value['__items__']}
+    return {key: _decode(item) for key, item in value.items()}
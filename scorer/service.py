@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from os.path import dirname, join
+from urllib.parse import unquote, urlsplit
+
+from scorer import leaderboard, task2
+"""
+Long-running HTTP service, which scores uploaded pred files for Task 1 and Task 2.
+
+All gold files are read once at startup and stay in the memory of the worker processes, so that a submission
+is checked and scored without the start-up of a new Python process and without reading its gold file.
+The event loop only reads the requests, the format checks and the scoring run in a pool of worker processes.
+
+Endpoints:
+  GET  /debates               {"1": [debate_name, ...], "2": [...]} with the gold files of each task.
+  POST /task1/<debate_name>   the content of a Task 1 pred file for the debate -> {"task", "debate", "metrics"}.
+  POST /task2/<debate_name>   the content of a Task 2 pred file -> also with the "confusion_matrix" of the claims.
+The debate_name is the name of the gold file, e.g. Task1-English-1st-Presidential.txt.
+Errors are returned as {"error": message}, e.g. with status 400 for a badly formatted pred file.
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8018
+DEFAULT_DATA_DIR = join(dirname(dirname(os.path.abspath(__file__))), 'data')
+TASKS = [1, 2]
+# Larger uploads are rejected; the pred files of the debates are well below 1 MB.
+MAX_UPLOAD_SIZE = 16 * 2 ** 20
+_MAX_HEADERS = 100
+
+
+def find_gold_files(data_dir, task):
+    """ Finds the gold files of a task in the data directory, laid out as data/task<k>/<language>/Task<k>-*.txt. """
+    return sorted(glob.glob(join(data_dir, 'task{}'.format(task), '*', 'Task{}-*.txt'.format(task))))
+
+
+def read_all_golds(data_dir=DEFAULT_DATA_DIR):
+    """
+    Reads the gold files of both tasks.
+    :return: {task:{debate_name:gold_labels}} dict.
+    """
+    return {task: leaderboard.read_golds(task, find_gold_files(data_dir, task)) for task in TASKS}
+
+
+# Gold data of both tasks, resident in each worker process.
+_golds = {}
+
+
+def _set_golds(golds):
+    _golds.clear()
+    _golds.update(golds)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _score_upload(task, debate, content):
+    """
+    Scores the content of an uploaded pred file in a worker process.
+    :return: dict with the metrics of the debate and, for Task 2, its confusion matrix.
+    :raises ValueError: if the pred file is badly formatted or does not match the gold file;
+    the message names the debate instead of the temporary pred file.
+    """
+    # The format checkers read files, so the upload is written to a temporary one.
+    fd, pred_file = tempfile.mkstemp(suffix='.txt')
+    try:
+        with os.fdopen(fd, 'wb') as pred_f:
+            pred_f.write(content)
+        result = leaderboard.score_pred(task, _golds[task][debate], pred_file)
+    except ValueError as e:
+        # The errors are sent to the client, which should not see the path of the temporary file.
+        raise ValueError(str(e).replace(pred_file, 'for {}'.format(debate))) from None
+    finally:
+        os.remove(pred_file)
+
+    if task == 1:
+        return {'metrics': result}
+    metrics = task2._compute_metrics(result)
+    return {'metrics': {metric: float(metrics[metric]) for metric in task2.MAIN_METRICS},
+            'confusion_matrix': result.tolist()}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_request(reader):
+    """
+    Reads a single HTTP/1.1 request.
+    :return: (method, path, headers, body) tuple, where the header names are lower case;
+    None if the client closed the connection.
+    :raises _HTTPError: if the request is malformed or too large.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed request line.')
+
+    headers = {'version': version}
+    for _ in range(_MAX_HEADERS):
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise _HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Too many headers.')
+
+    if 'transfer-encoding' in headers:
+        raise _HTTPError(HTTPStatus.LENGTH_REQUIRED, 'Send the pred file with a Content-Length.')
+    try:
+        content_length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, 'Malformed Content-Length.')
+    if content_length > MAX_UPLOAD_SIZE:
+        raise _HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                         'The pred file should be at most {} bytes.'.format(MAX_UPLOAD_SIZE))
+    body = await reader.readexactly(content_length) if content_length > 0 else b''
+    return method, path, headers, body
+
+
+def _keep_alive(headers):
+    connection = headers.get('connection', '').lower()
+    if headers['version'] == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+def _write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode('utf-8')
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+        status.value, status.phrase, len(body), 'keep-alive' if keep_alive else 'close')
+    writer.write(head.encode('latin-1') + body)
+
+
+class ScoringService:
+    """ Asyncio HTTP server with a pool of worker processes, which hold the gold data of all debates. """
+
+    def __init__(self, golds, workers=1):
+        """
+        :param golds: {task:{debate_name:gold_labels}} dict, as returned by read_all_golds.
+        :param workers: number of worker processes, which check and score the uploads.
+        """
+        self.golds = golds
+        self.workers = workers
+        self._executor = None
+        self._server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Starts the worker processes and the server.
+        :param port: port to listen on; 0 picks a free port.
+        :return: (host, port) tuple, where the server listens.
+        """
+        loop = asyncio.get_event_loop()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_set_golds,
+                                             initargs=(self.golds,))
+        # The workers are started right away, so that the first submissions do not wait for them.
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)])
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._executor.shutdown()
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await _read_request(reader)
+                except _HTTPError as e:
+                    _write_response(writer, e.status, {'error': str(e)}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                keep_alive = _keep_alive(headers)
+                start = time.perf_counter()
+                status, payload = await self._respond(method, path, body)
+                logger.info('{} {} {} {:.1f} ms'.format(method, path, status.value,
+                                                        (time.perf_counter() - start) * 1000))
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, path, body):
+        """ Routes a request. :return: (HTTPStatus, JSON payload) tuple. """
+        parts = [unquote(part) for part in urlsplit(path).path.strip('/').split('/')]
+        if parts == ['debates']:
+            if method != 'GET':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use GET for {}.'.format(path)}
+            return HTTPStatus.OK, {str(task): sorted(debates) for task, debates in self.golds.items()}
+
+        if len(parts) != 2 or parts[0] not in ['task{}'.format(task) for task in TASKS]:
+            return HTTPStatus.NOT_FOUND, {'error': 'No such endpoint: {}'.format(path)}
+        task, debate = int(parts[0][len('task'):]), parts[1]
+        if debate not in self.golds[task]:
+            return HTTPStatus.NOT_FOUND, {'error': 'No gold file {} for Task {}.'.format(debate, task)}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Upload the pred file with POST.'}
+
+        loop = asyncio.get_event_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, _score_upload, task, debate, body)
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except BrokenProcessPool:
+            logger.exception('A worker process died while scoring {}.'.format(path))
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'The scoring failed, try again.'}
+        result.update({'task': task, 'debate': debate})
+        return HTTPStatus.OK, result
+
+
+async def serve(golds, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1):
+    service = ScoringService(golds, workers)
+    host, port = await service.start(host, port)
+    logger.info('Scoring service listening on http://{}:{}'.format(host, port))
+    await service.serve_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_dir", help="Directory with the gold files, laid out as data/task<k>/<language>/.",
+                        type=str, default=DEFAULT_DATA_DIR)
+    parser.add_argument("--host", help="Host to listen on.", type=str, default=DEFAULT_HOST)
+    parser.add_argument("--port", help="Port to listen on.", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", help="Number of worker processes, which check and score the uploads.",
+                        type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    golds = read_all_golds(args.data_dir)
+    logger.info('Read the gold files of {} debates'.format(sum([len(debates) for debates in golds.values()])))
+    try:
+        asyncio.run(serve(golds, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
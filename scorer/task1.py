@@ -1,81 +1,242 @@
 import logging
 import argparse
 import os
+import sys
+from dataclasses import dataclass
 
+import numpy as np
+
+from format_checker import tsv
 from format_checker.task1 import check_format
+from scorer import gold_cache, result_cache
+from scorer.pool import pool_map
 """
 Scoring of Task 1 with the metrics Average Precision, R-Precision, P@N, RR@N. 
 """
 
-logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
 MAIN_THRESHOLDS = [1, 3, 5, 10, 20, 50]
+MAIN_METRICS = ['avg_precision', 'reciprocal_rank', 'r_precision'] + \
+               ['precision@{}'.format(th) for th in MAIN_THRESHOLDS]
+# Version of the metrics, which is a part of the key of the memoized results. Increase it whenever they change.
+SCORER_VERSION = 1
+# Upper bound for the number of elements in the matrices of a single chunk of bootstrap resamples.
+_BOOTSTRAP_CHUNK_SIZE = 2 ** 22
 
-def _read_gold_and_pred(gold_fpath, pred_fpath):
+
+@dataclass
+class RankingMetrics:
     """
-    Read gold and predicted data.
+    Metrics of the ranking of a single debate, or their means over multiple debates.
+    precision_at is a {N:precision@N} dict for MAIN_THRESHOLDS.
+    confidence_intervals is a {metric:(lower, upper)} dict with the bootstrap intervals of MAIN_METRICS,
+    None if they are not computed.
+    """
+    __slots__ = ('avg_precision', 'reciprocal_rank', 'r_precision', 'precision_at', 'num_relevant',
+                 'confidence_intervals')
+    avg_precision: float
+    reciprocal_rank: float
+    r_precision: float
+    precision_at: dict
+    num_relevant: int
+    confidence_intervals: dict
+
+
+@dataclass
+class Task1Result:
+    """
+    Results of a run for multiple debates.
+    debates holds the RankingMetrics of each debate, in the order of pred_files, and mean - their means
+    over the debates (with the total num_relevant).
+    """
+    __slots__ = ('pred_files', 'debates', 'mean')
+    pred_files: list
+    debates: list
+    mean: RankingMetrics
+
+
+def _read_gold(gold_fpath):
+    """
+    Read gold data.
     :param gold_fpath: the original annotated gold file, where the last 4th column contains the labels.
-    :param pred_fpath: a file with line_number and score at each line.
-    :return: {line_number:label} dict; list with (line_number, score) tuples.
+    :return: {line_number:label} dict.
     """
+    logger.info("Reading gold predictions from file {}".format(gold_fpath))
+
+    gold = gold_cache.load_gold(gold_fpath, 1, ['line_number', 'label'])
+    return dict(zip(gold['line_number'].tolist(), gold['label'].tolist()))
 
-    logging.info("Reading gold predictions from file {}".format(gold_fpath))
 
-    gold_labels = {}
-    with open(gold_fpath) as gold_f:
-        for line_res in gold_f:
-            line_number, _, _, label = line_res.strip().split('\t')  # process the line from the res file
-            gold_labels[int(line_number)] = int(label)
+def _read_pred(pred_fpath, gold_labels):
+    """
+    Read predicted data and check it against already read gold data.
+    :param pred_fpath: a file with line_number and score at each line.
+    :param gold_labels: {line_number:label} dict, as returned by _read_gold.
+    :return: list with (line_number, score) tuples.
+    """
+    logger.info('Reading predicted ranking order from file {}'.format(pred_fpath))
 
-    logging.info('Reading predicted ranking order from file {}'.format(pred_fpath))
+    columns = tsv.read_columns(pred_fpath, 2)
+    if columns is not None:
+        line_numbers, scores = tsv.to_ints(columns[0]), tsv.to_floats(columns[1])
+        if line_numbers is not None and scores is not None:
+            _check_pred_line_numbers(gold_labels, line_numbers)
+            return list(zip(line_numbers.tolist(), scores.tolist()))
 
     line_score = []
     with open(pred_fpath) as pred_f:
         for line in pred_f:
             line_number, score = line.split('\t')
-            line_number = int(line_number.strip())
-            score = float(score.strip())
+            line_score.append((int(line_number.strip()), float(score.strip())))
+
+    _check_pred_line_numbers(gold_labels, [tup[0] for tup in line_score])
+    return line_score
 
-            if line_number not in gold_labels:
-                logging.error('No such line_number: {} in gold file!'.format(line_number))
-                quit()
-            line_score.append((line_number, score))
 
-    if len(set(gold_labels).difference([tup[0] for tup in line_score])) != 0:
-        logging.error('The predictions do not match the lines from the gold file - missing or extra line_no')
+def _check_pred_line_numbers(gold_labels, line_numbers):
+    """
+    Checks that the predicted line_numbers are exactly the ones from the gold file.
+    :param gold_labels: {line_number:label} dict, as returned by _read_gold.
+    :param line_numbers: the predicted line_numbers, in the order of the pred file.
+    :raises ValueError: on a line_number, which is not in the gold file, or on missing line_numbers.
+    """
+    gold_line_numbers = np.fromiter(gold_labels.keys(), dtype=np.int64, count=len(gold_labels))
+    line_numbers = np.asarray(line_numbers, dtype=np.int64)
+
+    unknown = line_numbers[~np.isin(line_numbers, gold_line_numbers)]
+    if len(unknown):
+        raise ValueError('No such line_number: {} in gold file!'.format(unknown[0]))
+
+    if len(np.setdiff1d(gold_line_numbers, line_numbers)) != 0:
         raise ValueError('The predictions do not match the lines from the gold file - missing or extra line_no')
 
-    return gold_labels, line_score
 
+def _check_and_read_pred(pred_fpath, gold_labels):
+    """
+    Checks the format of a pred file and reads it in a single pass.
+    :param pred_fpath: a file with line_number and score at each line.
+    :param gold_labels: {line_number:label} dict, as returned by _read_gold.
+    :return: (line_numbers, scores) tuple of arrays.
+    :raises ValueError: if the format of the file is wrong (the problem is logged by the format checker),
+    or if it does not match the gold file.
+    """
+    logger.info('Checking and reading predicted ranking order from file {}'.format(pred_fpath))
+    parsed = check_format(pred_fpath, return_parsed=True)
+    if not parsed:
+        raise ValueError('Bad format for pred file {}. Cannot score.'.format(pred_fpath))
+    _check_pred_line_numbers(gold_labels, parsed[0])
+    return parsed
 
-def _compute_average_precision(gold_labels, ranked_lines):
-    """ Computes Average Precision. """
 
-    precisions = []
-    num_correct = 0
-    num_positive = sum([1 if v == 1 else 0 for k, v in gold_labels.items()])
+def _read_gold_and_pred(gold_fpath, pred_fpath):
+    """
+    Read gold and predicted data.
+    :param gold_fpath: the original annotated gold file, where the last 4th column contains the labels.
+    :param pred_fpath: a file with line_number and score at each line.
+    :return: {line_number:label} dict; list with (line_number, score) tuples.
+    """
+    gold_labels = _read_gold(gold_fpath)
+    return gold_labels, _read_pred(pred_fpath, gold_labels)
+
+
+def _gold_label_lookup(gold_labels):
+    """
+    Converts the gold labels to a dense array, indexed by line_number.
+    :param gold_labels: {line_number:label} dict.
+    :return: int8 array, where the value at each line_number is 1 for relevant lines and 0 otherwise.
+    """
+    line_numbers = np.fromiter(gold_labels.keys(), dtype=np.int64, count=len(gold_labels))
+    labels = np.fromiter(gold_labels.values(), dtype=np.int64, count=len(gold_labels))
+    lookup = np.zeros(line_numbers.max() + 1 if len(line_numbers) else 1, dtype=np.int8)
+    lookup[line_numbers] = labels == 1
+    return lookup
+
 
-    for i, line_number in enumerate(ranked_lines):
-        if gold_labels[line_number] == 1:
-            num_correct += 1
-            precisions.append(num_correct / (i + 1))
-    if precisions:
-        avg_prec = sum(precisions) / num_positive
+def _compute_relevance(gold_lookup, line_numbers, scores=None):
+    """
+    Computes the relevance vector of a ranking.
+    :param gold_lookup: int8 array indexed by line_number, as returned by _gold_label_lookup.
+    :param line_numbers: array with the predicted line_numbers.
+    :param scores: array with the score of each line_number. If given, the lines are ranked by descending score
+    (ties keep the order from the file), otherwise line_numbers are taken to be already ranked.
+    :return: int8 array with 1 at each rank holding a relevant line and 0 otherwise.
+    """
+    line_numbers = np.asarray(line_numbers, dtype=np.int64)
+    if scores is not None:
+        # A stable sort on the negated scores keeps the order of sorted(..., reverse=True) for ties.
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='mergesort')
+        line_numbers = line_numbers[order]
+    return gold_lookup[line_numbers]
+
+
+def _compute_ranking_metrics(relevance, thresholds=None, num_relevant=None):
+    """
+    Computes all ranking metrics from a relevance vector with a single cumulative sum.
+    :param relevance: int8 array with 1 at each rank holding a relevant line and 0 otherwise.
+    :param thresholds: list of N values for Precision@N and Recall@N. If not specified - MAIN_THRESHOLDS.
+    :param num_relevant: number of relevant lines in the gold file. If not specified - the relevant lines in the ranking.
+    :return: dict with the keys:
+      'num_relevant', 'avg_precision', 'reciprocal_rank', 'r_precision',
+      'precisions' (precision at every rank), 'recalls' (recall at every rank),
+      'precision_at' and 'recall_at' ({N:value} dicts for the thresholds),
+      'pr_curve' (a (recalls, precisions) tuple of arrays, taken at the rank of each relevant line).
+    """
+    if thresholds is None:
+        thresholds = MAIN_THRESHOLDS
+
+    num_lines = len(relevance)
+    hits = np.cumsum(relevance, dtype=np.int64)
+    precisions = hits / np.arange(1, num_lines + 1)
+    if num_relevant is None:
+        num_relevant = int(hits[-1]) if num_lines else 0
+    relevant_ranks = np.flatnonzero(relevance)
+
+    if len(relevant_ranks):
+        recalls = hits / num_relevant
+        # cumsum adds the precisions sequentially, so AP is bit-for-bit equal to a plain sum() over them.
+        avg_precision = float(np.cumsum(precisions[relevant_ranks])[-1] / num_relevant)
+        reciprocal_rank = 1.0 / (int(relevant_ranks[0]) + 1)
     else:
-        avg_prec = 0.0
+        recalls = np.zeros(num_lines)
+        avg_precision = 0.0
+        reciprocal_rank = 0.0
+
+    precision_at = {}
+    recall_at = {}
+    for threshold in thresholds:
+        found = int(hits[min(threshold, num_lines) - 1]) if num_lines else 0
+        precision_at[threshold] = found / threshold
+        recall_at[threshold] = found / num_relevant if num_relevant else 0.0
+
+    return {
+        'num_relevant': num_relevant,
+        'avg_precision': avg_precision,
+        'reciprocal_rank': reciprocal_rank,
+        'r_precision': float(precisions[min(num_relevant, num_lines) - 1]) if num_lines else 0.0,
+        'precisions': precisions,
+        'recalls': recalls,
+        'precision_at': precision_at,
+        'recall_at': recall_at,
+        'pr_curve': (recalls[relevant_ranks], precisions[relevant_ranks]),
+    }
+
+
+def _ranked_relevance(gold_labels, ranked_lines):
+    return _compute_relevance(_gold_label_lookup(gold_labels), ranked_lines)
 
-    return avg_prec
+
+def _compute_average_precision(gold_labels, ranked_lines):
+    """ Computes Average Precision. """
+    num_positive = sum([1 if v == 1 else 0 for k, v in gold_labels.items()])
+    relevance = _ranked_relevance(gold_labels, ranked_lines)
+    return _compute_ranking_metrics(relevance, [], num_positive)['avg_precision']
 
 
 def _compute_reciprocal_rank(gold_labels, ranked_lines):
     """ Computes Reciprocal Rank. """
-    rr = 0.0
-    for i, line_number in enumerate(ranked_lines):
-        if gold_labels[line_number] == 1:
-            rr += 1.0 / (i + 1)
-            break
-    return rr
+    return _compute_ranking_metrics(_ranked_relevance(gold_labels, ranked_lines), [])['reciprocal_rank']
 
 
 def _compute_precisions(gold_labels, ranked_lines, threshold):
@@ -83,14 +244,8 @@ def _compute_precisions(gold_labels, ranked_lines, threshold):
     precisions = [0.0] * threshold
     threshold = min(threshold, len(ranked_lines))
 
-    for i, line_number in enumerate(ranked_lines[:threshold]):
-        if gold_labels[line_number] == 1:
-            precisions[i] += 1.0
-
-    for i in range(1, threshold): # accumulate
-        precisions[i] += precisions[i - 1]
-    for i in range(1, threshold): # normalize
-        precisions[i] /= i+1
+    relevance = _ranked_relevance(gold_labels, ranked_lines[:threshold])
+    precisions[:threshold] = _compute_ranking_metrics(relevance, [])['precisions'].tolist()
     return precisions
 
 
@@ -102,20 +257,210 @@ def evaluate(gold_fpath, pred_fpath, thresholds=None):
     :param pred_fpath: a file with line_number at each line, where the list is ordered by check-worthiness.
     :param thresholds: thresholds used for Reciprocal Rank@N and Precision@N.
     If not specified - 1, 3, 5, 10, 20, 50, len(ranked_lines).
+    The results are memoized, if a store is set with result_cache.set_store.
     """
-    gold_labels, line_score = _read_gold_and_pred(gold_fpath, pred_fpath)
+    return result_cache.memoized('task1.evaluate', SCORER_VERSION, gold_fpath, pred_fpath, [thresholds],
+                                 lambda: _evaluate_files(gold_fpath, pred_fpath, thresholds))
+
 
-    ranked_lines = [t[0] for t in sorted(line_score, key=lambda x: x[1], reverse=True)]
+def _evaluate_files(gold_fpath, pred_fpath, thresholds=None):
+    """ Evaluates the predicted line rankings w.r.t. a gold file, as evaluate, without memoization. """
+    gold_labels, line_score = _read_gold_and_pred(gold_fpath, pred_fpath)
     if thresholds is None or len(thresholds) == 0:
-        thresholds = MAIN_THRESHOLDS + [len(ranked_lines)]
+        thresholds = MAIN_THRESHOLDS + [len(line_score)]
 
     # Calculate Metrics
-    precisions = _compute_precisions(gold_labels, ranked_lines, len(ranked_lines))
-    avg_precision = _compute_average_precision(gold_labels, ranked_lines)
-    reciprocal_rank = _compute_reciprocal_rank(gold_labels, ranked_lines)
-    num_relevant = len({k for k, v in gold_labels.items() if v == 1})
+    metrics = _evaluate_ranking(gold_labels, line_score, thresholds)
+
+    return thresholds, metrics['precisions'].tolist(), metrics['avg_precision'], metrics['reciprocal_rank'], \
+        metrics['num_relevant']
+
+
+def _evaluate_ranking(gold_labels, line_score, thresholds=None):
+    """
+    Computes the ranking metrics for already read gold and predicted data.
+    :param gold_labels: {line_number:label} dict, or its dense array form as returned by _gold_label_lookup.
+    :param line_score: list with (line_number, score) tuples.
+    :param thresholds: thresholds used for Precision@N and Recall@N. If not specified - MAIN_THRESHOLDS.
+    :return: the metrics dict of _compute_ranking_metrics.
+    """
+    return _compute_ranking_metrics(_ranking_relevance(gold_labels, line_score), thresholds)
+
+
+def _check_and_evaluate(gold_fpath, pred_fpath, bootstrap_resamples=0, seed=0):
+    """
+    Checks the format of a pred file and evaluates it, reading the file only once.
+    :param gold_fpath: the original annotated gold file, where the last 4th column contains the labels.
+    :param pred_fpath: a file with line_number and score at each line.
+    :param bootstrap_resamples: number of bootstrap resamples of the metrics. No resampling if 0.
+    :param seed: seed for the bootstrap resampling.
+    :return: the metrics dict of _compute_ranking_metrics, with the additional key 'bootstrap' holding the result
+    of _bootstrap_ranking_metrics (or None).
+    :raises ValueError: if the format of the pred file is wrong or it does not match the gold file.
+    The results are memoized, if a store is set with result_cache.set_store.
+    """
+    return result_cache.memoized('task1.check_and_evaluate', SCORER_VERSION, gold_fpath, pred_fpath,
+                                 [bootstrap_resamples, seed],
+                                 lambda: _check_and_evaluate_files(gold_fpath, pred_fpath, bootstrap_resamples, seed))
+
+
+def _check_and_evaluate_files(gold_fpath, pred_fpath, bootstrap_resamples=0, seed=0):
+    """ Checks the format of a pred file and evaluates it, as _check_and_evaluate, without memoization. """
+    gold_labels = _read_gold(gold_fpath)
+    parsed = _check_and_read_pred(pred_fpath, gold_labels)
+    relevance = _compute_relevance(_gold_label_lookup(gold_labels), *parsed)
+    metrics = _compute_ranking_metrics(relevance, MAIN_THRESHOLDS)
+    metrics['bootstrap'] = None
+    if bootstrap_resamples:
+        metrics['bootstrap'] = _bootstrap_ranking_metrics(relevance, bootstrap_resamples, MAIN_THRESHOLDS,
+                                                          np.random.RandomState(seed))
+    return metrics
+
+
+def score(gold_fpaths, pred_fpaths, workers=1, bootstrap_resamples=0, confidence=0.95, seed=0):
+    """
+    Checks and scores the pred files of a run, without logging the results, so that it can be used as a library.
+    It is thread-safe and the results are memoized, if a store is set with result_cache.set_store.
+    :param gold_fpaths: list with the gold file of each debate.
+    :param pred_fpaths: list with the pred file of each debate.
+    :param workers: number of worker processes, which check and score the debates. The results do not depend on it.
+    :param bootstrap_resamples: number of bootstrap resamples for the confidence intervals. No intervals if 0.
+    :param confidence: confidence level of the intervals.
+    :param seed: seed for the bootstrap resampling.
+    :return: Task1Result.
+    :raises ValueError: if the lists of files do not match, or a pred file is badly formatted
+    or does not match its gold file.
+    """
+    _check_file_lists(pred_fpaths, gold_fpaths)
+    num_debates = len(pred_fpaths)
+    # The store is set in the worker processes only: setting it again in this process would race with other threads.
+    initializer, initargs = (result_cache.set_store, result_cache.get_store()) if workers > 1 else (None, ())
+    debate_results = pool_map(_check_and_evaluate, gold_fpaths, pred_fpaths, [bootstrap_resamples] * num_debates,
+                              [seed] * num_debates, workers=workers, initializer=initializer, initargs=initargs)
+
+    debates = []
+    debate_metrics = []
+    for metrics in debate_results:
+        precisions = metrics['precisions']
+        num_relevant = metrics['num_relevant']
+        intervals = None
+        if metrics['bootstrap'] is not None:
+            intervals = _interval_dict(_confidence_intervals(metrics['bootstrap'], confidence))
+        debate = RankingMetrics(metrics['avg_precision'], metrics['reciprocal_rank'],
+                                float(precisions[num_relevant - 1]),
+                                {th: float(precisions[th - 1]) for th in MAIN_THRESHOLDS}, num_relevant, intervals)
+        debates.append(debate)
+        debate_metrics.append([debate.avg_precision, debate.reciprocal_rank, debate.r_precision] +
+                              [debate.precision_at[th] for th in MAIN_THRESHOLDS])
+
+    mean_intervals = None
+    if bootstrap_resamples:
+        mean_samples = _bootstrap_means(debate_metrics, bootstrap_resamples, np.random.RandomState(seed))
+        mean_intervals = _interval_dict(_confidence_intervals(mean_samples, confidence))
+    # The metrics are summed in the order of the debates, as in the former reports.
+    mean = RankingMetrics(sum([debate.avg_precision for debate in debates]) / num_debates,
+                          sum([debate.reciprocal_rank for debate in debates]) / num_debates,
+                          sum([debate.r_precision for debate in debates]) / num_debates,
+                          {th: sum([debate.precision_at[th] for debate in debates]) / num_debates
+                           for th in MAIN_THRESHOLDS},
+                          sum([debate.num_relevant for debate in debates]), mean_intervals)
+    return Task1Result(list(pred_fpaths), debates, mean)
+
+
+def _interval_dict(intervals):
+    """ Converts the array of _confidence_intervals to a {metric:(lower, upper)} dict. """
+    return {metric: (float(lower), float(upper)) for metric, lower, upper in zip(MAIN_METRICS, *intervals)}
+
+
+def _interval_bounds(interval_dict):
+    """ Converts a {metric:(lower, upper)} dict back to the (lower bounds, upper bounds) of MAIN_METRICS. """
+    return [interval_dict[metric][0] for metric in MAIN_METRICS], [interval_dict[metric][1] for metric in MAIN_METRICS]
+
+
+def _ranking_relevance(gold_labels, line_score):
+    """ Computes the relevance vector of the ranking by score of already read gold and predicted data. """
+    if isinstance(gold_labels, dict):
+        gold_labels = _gold_label_lookup(gold_labels)
+    line_numbers = np.fromiter((t[0] for t in line_score), dtype=np.int64, count=len(line_score))
+    scores = np.fromiter((t[1] for t in line_score), dtype=np.float64, count=len(line_score))
+    return _compute_relevance(gold_labels, line_numbers, scores)
+
+
+def _bootstrap_ranking_metrics(relevance, num_resamples, thresholds=None, random_state=None):
+    """
+    Bootstraps the ranking metrics of a debate by resampling its lines with replacement.
+    All resamples are scored together with matrix operations, in chunks of at most _BOOTSTRAP_CHUNK_SIZE elements.
+    :param relevance: int8 array with 1 at each rank holding a relevant line and 0 otherwise.
+    :param num_resamples: number of bootstrap resamples.
+    :param thresholds: thresholds used for Precision@N. If not specified - MAIN_THRESHOLDS.
+    :param random_state: numpy RandomState used for the resampling.
+    :return: (num_resamples, 3 + len(thresholds)) array with AP, RR, R-Precision and P@N of each resample.
+    """
+    if thresholds is None:
+        thresholds = MAIN_THRESHOLDS
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+
+    num_lines = len(relevance)
+    samples = np.zeros((num_resamples, 3 + len(thresholds)))
+    if not num_lines:
+        return samples
+
+    ranks = np.arange(1, num_lines + 1)
+    chunk_size = max(1, _BOOTSTRAP_CHUNK_SIZE // num_lines)
+    for start in range(0, num_resamples, chunk_size):
+        end = min(start + chunk_size, num_resamples)
+        # Sorting the sampled ranks keeps the resampled lines in the order of the original ranking.
+        resampled_ranks = np.sort(random_state.randint(0, num_lines, size=(end - start, num_lines)), axis=1)
+        resampled = relevance[resampled_ranks]
+        hits = np.cumsum(resampled, axis=1, dtype=np.int64)
+        num_relevant = np.maximum(hits[:, -1], 1)
+
+        samples[start:end, 0] = (resampled * hits / ranks).sum(axis=1) / num_relevant
+        samples[start:end, 1] = np.where(hits[:, -1] > 0, 1.0 / (np.argmax(resampled, axis=1) + 1), 0.0)
+        samples[start:end, 2] = hits[np.arange(end - start), num_relevant - 1] / num_relevant
+        for idx, threshold in enumerate(thresholds):
+            samples[start:end, 3 + idx] = hits[:, min(threshold, num_lines) - 1] / threshold
+    return samples
+
+
+def _bootstrap_means(debate_metrics, num_resamples, random_state=None):
+    """
+    Bootstraps the means of the metrics over multiple debates (e.g. MAP) by resampling the debates with replacement.
+    :param debate_metrics: (num_debates, num_metrics) array with the metrics of each debate.
+    :param num_resamples: number of bootstrap resamples.
+    :param random_state: numpy RandomState used for the resampling.
+    :return: (num_resamples, num_metrics) array with the mean metrics of each resample.
+    """
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    debate_metrics = np.asarray(debate_metrics, dtype=np.float64)
+    resampled_debates = random_state.randint(0, len(debate_metrics), size=(num_resamples, len(debate_metrics)))
+    return debate_metrics[resampled_debates].mean(axis=1)
+
+
+def _confidence_intervals(samples, confidence=0.95):
+    """
+    Computes percentile bootstrap confidence intervals.
+    :param samples: (num_resamples, num_metrics) array with the bootstrapped metrics.
+    :return: (2, num_metrics) array with the lower and the upper bounds for each metric.
+    """
+    tail = (1.0 - confidence) / 2 * 100
+    return np.percentile(samples, [tail, 100 - tail], axis=0)
 
-    return thresholds, precisions, avg_precision, reciprocal_rank, num_relevant
+
+def bootstrap(gold_fpath, pred_fpath, num_resamples=1000, seed=0):
+    """
+    Bootstraps the metrics of the predicted line rankings w.r.t. a gold file, resampling the lines of the debate.
+    :param gold_fpath: the original annotated gold file, where the last 4th column contains the labels.
+    :param pred_fpath: a file with line_number and score at each line.
+    :param num_resamples: number of bootstrap resamples.
+    :param seed: seed for the resampling.
+    :return: (num_resamples, len(MAIN_METRICS)) array with the metrics of each resample.
+    """
+    gold_labels, line_score = _read_gold_and_pred(gold_fpath, pred_fpath)
+    relevance = _ranking_relevance(gold_labels, line_score)
+    return _bootstrap_ranking_metrics(relevance, num_resamples, MAIN_THRESHOLDS, np.random.RandomState(seed))
 
 
 def get_threshold_line_format(thresholds, last_entry_name):
@@ -130,49 +475,97 @@ def print_thresholded_metric(title, thresholds, data, last_entry_name=None, last
     items = data
     if last_entry_value is not None:
         items = items + [last_entry_value]
-    logging.info(threshold_line_format.format(title))
-    logging.info('{:<30}'.format("") + "".join(['{0:<10.4f}'.format(item) for item in items]))
-    logging.info(line_separator)
+    logger.info(threshold_line_format.format(title))
+    logger.info('{:<30}'.format("") + "".join(['{0:<10.4f}'.format(item) for item in items]))
+    logger.info(line_separator)
 
 def print_single_metric(title, value):
     line_separator = '=' * 120
-    logging.info('{:<30}'.format(title) + '{0:<10.4f}'.format(value))
-    logging.info(line_separator)
+    logger.info('{:<30}'.format(title) + '{0:<10.4f}'.format(value))
+    logger.info(line_separator)
+
+def print_confidence_intervals(title, intervals):
+    line_separator = '=' * 120
+    logger.info('{:<30}'.format(title) + '{:<10}{:<10}{:<10}'.format('AP', 'RR', 'R-PR') +
+                 "".join(['@{:<9}'.format(th) for th in MAIN_THRESHOLDS]))
+    logger.info('{:<30}'.format('  lower') + "".join(['{0:<10.4f}'.format(item) for item in intervals[0]]))
+    logger.info('{:<30}'.format('  upper') + "".join(['{0:<10.4f}'.format(item) for item in intervals[1]]))
+    logger.info(line_separator)
 
 def print_metrics_info(line_separator):
-    logging.info('Description of the evaluation metrics: ')
-    logging.info('!!! THE OFFICIAL METRIC USED FOR THE COMPETITION RANKING IS MEAN AVERAGE PRECISION (MAP) !!!')
-    logging.info('R-Precision is Precision at R, where R is the number of relevant line_numbers for the evaluated set.')
-    logging.info('Average Precision is the precision@N, estimated only @ each relevant line_number and then averaged over the number of relevant line_numbers.')
-    logging.info('Reciprocal Rank is the reciprocal of the rank of the first relevant line_number in the list of predictions sorted by score (descendingly).')
-    logging.info('Precision@N is precision estimated for the first N line_numbers in the provided ranked list.')
-    logging.info('The MEAN versions of each metric are provided to average over multiple debates (each with separate prediction file).')
-    logging.info(line_separator)
-    logging.info(line_separator)
-
-
-def validate_files(pred_files, gold_files):
+    logger.info('Description of the evaluation metrics: ')
+    logger.info('!!! THE OFFICIAL METRIC USED FOR THE COMPETITION RANKING IS MEAN AVERAGE PRECISION (MAP) !!!')
+    logger.info('R-Precision is Precision at R, where R is the number of relevant line_numbers for the evaluated set.')
+    logger.info('Average Precision is the precision@N, estimated only @ each relevant line_number and then averaged over the number of relevant line_numbers.')
+    logger.info('Reciprocal Rank is the reciprocal of the rank of the first relevant line_number in the list of predictions sorted by score (descendingly).')
+    logger.info('Precision@N is precision estimated for the first N line_numbers in the provided ranked list.')
+    logger.info('The MEAN versions of each metric are provided to average over multiple debates (each with separate prediction file).')
+    logger.info(line_separator)
+    logger.info(line_separator)
+
+
+def _check_file_lists(pred_files, gold_files):
+    """
+    Checks that there is a different pred file for each gold file.
+    :raises ValueError: if the lists of files do not match.
+    """
     if len(pred_files) != len(gold_files):
-        logging.error(
-            'Different number of gold files ({}) and pred files ({}) provided. Cannot score.'.format(
-                len(gold_files), len(pred_files)
-            )
-        )
-        return False
+        raise ValueError('Different number of gold files ({}) and pred files ({}) provided. Cannot score.'.format(
+            len(gold_files), len(pred_files)))
 
     if len(pred_files) != len(set(pred_files)):
-        logging.error('Same pred file provided multiple times. The pred files should be for different debates.')
+        raise ValueError('Same pred file provided multiple times. The pred files should be for different debates.')
+
+
+def validate_files(pred_files, gold_files, workers=1, check_formats=True):
+    """
+    Validates the lists of pred and gold files before scoring.
+    :param check_formats: whether to check the format of each pred file. Pass False when the files are checked
+    while reading them for scoring (as in _check_and_evaluate).
+    """
+    try:
+        _check_file_lists(pred_files, gold_files)
+    except ValueError as e:
+        logger.error(e)
         return False
 
-    for pred_file in pred_files:
-        if not check_format(pred_file):
-            logging.error('Bad format for pred file {}. Cannot score.'.format(pred_file))
+    if not check_formats:
+        return True
+
+    for pred_file, format_ok in zip(pred_files, pool_map(check_format, pred_files, workers=workers)):
+        if not format_ok:
+            logger.error('Bad format for pred file {}. Cannot score.'.format(pred_file))
             return False
 
     return True
 
 
+def print_results(result, confidence=0.95):
+    """ Logs the results of score: the metrics of each debate and, for multiple debates, their means. """
+    ci_title = 'BOOTSTRAP {:.0%} CI:'.format(confidence)
+    for pred_file, debate in zip(result.pred_files, result.debates):
+        filename = os.path.basename(pred_file)
+        logger.info('{:=^120}'.format(' RESULTS for {} '.format(filename)))
+        print_single_metric('AVERAGE PRECISION:', debate.avg_precision)
+        print_single_metric('RECIPROCAL RANK:', debate.reciprocal_rank)
+        print_single_metric('R-PRECISION (R={}):'.format(debate.num_relevant), debate.r_precision)
+        print_thresholded_metric('PRECISION@N:', MAIN_THRESHOLDS, [debate.precision_at[th] for th in MAIN_THRESHOLDS])
+        if debate.confidence_intervals is not None:
+            print_confidence_intervals(ci_title, _interval_bounds(debate.confidence_intervals))
+
+    if len(result.debates) > 1:
+        mean = result.mean
+        logger.info('{:=^120}'.format(' AVERAGED RESULTS '))
+        print_single_metric('MEAN AVERAGE PRECISION (MAP):', mean.avg_precision)
+        print_single_metric('MEAN RECIPROCAL RANK:', mean.reciprocal_rank)
+        print_single_metric('MEAN R-PRECISION:', mean.r_precision)
+        print_thresholded_metric('MEAN PRECISION@N:', MAIN_THRESHOLDS, [mean.precision_at[th] for th in MAIN_THRESHOLDS])
+        if mean.confidence_intervals is not None:
+            print_confidence_intervals('MEAN ' + ci_title, _interval_bounds(mean.confidence_intervals))
+
+
 if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--gold_file_path",
@@ -186,48 +579,42 @@ if __name__ == '__main__':
         type=str,
         required=True
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of worker processes, which check and score the debates in parallel.",
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        "--bootstrap_resamples",
+        help="Number of bootstrap resamples for confidence intervals of the metrics. No intervals are computed if 0.",
+        type=int,
+        default=0
+    )
+    parser.add_argument("--confidence", help="Confidence level of the bootstrap intervals.", type=float, default=0.95)
+    parser.add_argument("--seed", help="Seed for the bootstrap resampling.", type=int, default=0)
+    parser.add_argument(
+        "--result_cache_path",
+        help="Path to an SQLite file, where the results are memoized, so that unchanged files are not scored again.",
+        type=str
+    )
+    parser.add_argument("--result_cache_size", help="Maximum number of memoized results.", type=int,
+                        default=result_cache.DEFAULT_MAX_ENTRIES)
     args = parser.parse_args()
+    if args.result_cache_path:
+        result_cache.set_store(args.result_cache_path, args.result_cache_size)
 
     pred_files = [pred_file.strip() for pred_file in args.pred_file_path.split(",")]
     gold_files = [gold_file.strip() for gold_file in args.gold_file_path.split(",")]
     line_separator = '=' * 120
 
-    if validate_files(pred_files, gold_files):
-        logging.info("Started evaluating results for Task 1 ...")
-        overall_precisions = [0.0] * len(MAIN_THRESHOLDS)
-        mean_r_precision = 0.0
-        mean_avg_precision = 0.0
-        mean_reciprocal_rank = 0.0
-
-        for (pred_file, gold_file) in zip(pred_files, gold_files):
-            thresholds, precisions, avg_precision, reciprocal_rank, num_relevant = evaluate(gold_file, pred_file)
-            threshold_precisions = [precisions[th - 1] for th in MAIN_THRESHOLDS]
-            r_precision = precisions[num_relevant - 1]
-
-            for idx in range(0, len(MAIN_THRESHOLDS)):
-                overall_precisions[idx] += threshold_precisions[idx]
-            mean_r_precision += r_precision
-            mean_avg_precision += avg_precision
-            mean_reciprocal_rank += reciprocal_rank
-
-            filename = os.path.basename(pred_file)
-            logging.info('{:=^120}'.format(' RESULTS for {} '.format(filename)))
-            print_single_metric('AVERAGE PRECISION:', avg_precision)
-            print_single_metric('RECIPROCAL RANK:', reciprocal_rank)
-            print_single_metric('R-PRECISION (R={}):'.format(num_relevant), r_precision)
-            print_thresholded_metric('PRECISION@N:', MAIN_THRESHOLDS, threshold_precisions)
-
-        debate_count = len(pred_files)
-        if debate_count > 1:
-            overall_precisions = [item * 1.0 / debate_count for item in overall_precisions]
-            mean_r_precision /= debate_count
-            mean_avg_precision /= debate_count
-            mean_reciprocal_rank /= debate_count
-            logging.info('{:=^120}'.format(' AVERAGED RESULTS '))
-            print_single_metric('MEAN AVERAGE PRECISION (MAP):', mean_avg_precision)
-            print_single_metric('MEAN RECIPROCAL RANK:', mean_reciprocal_rank)
-            print_single_metric('MEAN R-PRECISION:', mean_r_precision)
-            print_thresholded_metric('MEAN PRECISION@N:', MAIN_THRESHOLDS, overall_precisions)
-
+    if validate_files(pred_files, gold_files, check_formats=False):
+        logger.info("Started evaluating results for Task 1 ...")
+        # Each pred file is checked and scored in a single pass, the scoring stops if any of them is badly formatted.
+        try:
+            result = score(gold_files, pred_files, args.workers, args.bootstrap_resamples, args.confidence, args.seed)
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+        print_results(result, args.confidence)
         print_metrics_info(line_separator)
-
@@ -1,147 +1,431 @@
 import logging
-import csv
 import argparse
+import itertools
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from format_checker import tsv
 from format_checker.task2 import check_format
+from scorer import gold_cache, result_cache
+from scorer.pool import pool_map
 """
 Scoring of Task 2 with confusion matrix, Acc, Macro F1 and Average Recall. 
 """
 
-logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 _LABELS = ['true', 'false', 'half-true']
 # The "distance" for a false-true mistake is 2, and for every other pair - 1
 _LABEL_NUMERIC_VALUES = { 'false': 0, 'half-true': 1, 'true': 2 }
+MAIN_METRICS = ['mae', 'macro_mae', 'accuracy', 'macro_f1', 'macro_recall']
+
+# Integer codes of the labels are their indices in _LABELS.
+_LABEL_CODES = {label: code for code, label in enumerate(_LABELS)}
+# Ordinal cost of predicting the label at each column for the gold label at each row.
+_LABEL_DISTANCES = np.array([[abs(_LABEL_NUMERIC_VALUES[gold_label] - _LABEL_NUMERIC_VALUES[pred_label])
+                              for pred_label in _LABELS] for gold_label in _LABELS], dtype=np.float64)
+# Compact representation of the claims of multiple debates, keyed by (file_idx, claim_number) instead of strings.
+_CLAIM_DTYPE = np.dtype([('file_idx', np.int32), ('claim_number', np.int32), ('gold', np.int8), ('pred', np.int8)])
+# Version of the metrics, which is a part of the key of the memoized results. Increase it whenever they change.
+SCORER_VERSION = 1
+# Upper bound for the number of elements in the matrices of a single chunk of permutations.
+_PERMUTATION_CHUNK_SIZE = 2 ** 22
+# Tolerance when comparing the metric differences of permutations with the observed one.
+_EPSILON = 1e-12
+
+
+@dataclass
+class ClassificationMetrics:
+    """
+    Metrics of the predicted labels of a set of claims.
+    confusion_matrix is a 3x3 array with the count of each (gold label, predicted label) pair, ordered as _LABELS.
+    """
+    __slots__ = ('confusion_matrix', 'mae', 'macro_mae', 'accuracy', 'macro_f1', 'macro_recall')
+    confusion_matrix: np.ndarray
+    mae: float
+    macro_mae: float
+    accuracy: float
+    macro_f1: float
+    macro_recall: float
 
 
-def _read_gold_and_pred(gold_file_path, pred_file_path, claim_number_prefix=''):
-    logging.info("Reading gold predictions from file {}".format(gold_file_path))
+@dataclass
+class Task2Result:
+    """
+    Results of a run for multiple debates.
+    confusion_matrices holds the confusion matrix of each debate, in the order of pred_files,
+    and metrics - the metrics of all their claims together.
+    """
+    __slots__ = ('pred_files', 'confusion_matrices', 'metrics')
+    pred_files: list
+    confusion_matrices: list
+    metrics: ClassificationMetrics
 
-    gold_labels = {}
-    with open(gold_file_path) as gold_file:
-        gold_reader = csv.DictReader(gold_file, delimiter='\t', fieldnames=['line_number', 'speaker', 'text', 'claim_number', 'normalized_claim', 'label'])
 
-        for row in gold_reader:
-            if row['claim_number'] != 'N/A':
-                claim_id = claim_number_prefix + row['claim_number']
-                gold_labels[claim_id] = row['label']
+def _read_gold(gold_file_path, claim_number_prefix=''):
+    logger.info("Reading gold predictions from file {}".format(gold_file_path))
 
-    logging.info('Reading predicted classification labels from file {}'\
+    gold = gold_cache.load_gold(gold_file_path, 2, ['claim_number', 'label'])
+    is_claim = gold['claim_number'] >= 0
+    return {claim_number_prefix + str(claim_number): label
+            for claim_number, label in zip(gold['claim_number'][is_claim].tolist(), gold['label'][is_claim].tolist())}
+
+
+def _read_pred(pred_file_path, gold_labels, claim_number_prefix=''):
+    logger.info('Reading predicted classification labels from file {}'\
         .format(pred_file_path))
 
-    predicted_labels = {}
+    columns = tsv.read_columns(pred_file_path, 2)
+    if columns is not None:
+        claim_numbers, labels = tsv.to_strings(columns[0]), tsv.to_strings(columns[1])
+        if claim_numbers is not None and labels is not None:
+            return _match_pred(gold_labels, claim_numbers.tolist(), labels.tolist(), claim_number_prefix)
+
+    claim_numbers = []
+    labels = []
     with open(pred_file_path) as pred_file:
         for i, line in enumerate(pred_file):
             claim_number, label = line.strip().split('\t')
-            claim_id = claim_number_prefix + claim_number
+            claim_numbers.append(claim_number)
+            labels.append(label)
 
-            if claim_id not in gold_labels:
-                logging.error('No such claim_number: {} in gold file!'.format(claim_number))
-                quit()
+    return _match_pred(gold_labels, claim_numbers, labels, claim_number_prefix)
 
-            predicted_labels[claim_id] = label
+
+def _match_pred(gold_labels, claim_numbers, labels, claim_number_prefix=''):
+    """
+    Matches the predicted labels to the claims from the gold file.
+    :param gold_labels: a dictionary with gold label for each claim_id, as returned by _read_gold
+    :param claim_numbers: the predicted claim_numbers (as strings or ints), in the order of the pred file
+    :param labels: the predicted label for each of the claim_numbers
+    :return: a dictionary with predicted label for each claim_id
+    :raises ValueError: on a claim_number, which is not in the gold file, or on missing claim_numbers
+    """
+    predicted_labels = {}
+    for claim_number, label in zip(claim_numbers, labels):
+        claim_id = claim_number_prefix + str(claim_number)
+
+        if claim_id not in gold_labels:
+            raise ValueError('No such claim_number: {} in gold file!'.format(claim_number))
+
+        predicted_labels[claim_id] = label
 
     if len(set(gold_labels).difference(predicted_labels)) != 0:
-        logging.error('The predictions do not match the claims from the gold file - missing or extra claim_number')
         raise ValueError('The predictions do not match the claims from the gold file - missing or extra claim_number')
 
-    return gold_labels, predicted_labels
+    return predicted_labels
+
+
+def _check_and_read_pred(pred_file_path, gold_labels):
+    """
+    Checks the format of a pred file and reads it in a single pass.
+    :return: a dictionary with predicted label for each claim_number.
+    :raises ValueError: if the format of the file is wrong (the problem is logged by the format checker),
+    or if it does not match the gold file.
+    """
+    logger.info('Checking and reading predicted classification labels from file {}'.format(pred_file_path))
+    parsed = check_format(pred_file_path, return_parsed=True)
+    if not parsed:
+        raise ValueError('Bad format for pred file {}. Cannot score.'.format(pred_file_path))
+    return _match_pred(gold_labels, parsed[0].tolist(), parsed[1].tolist())
+
+
+def _read_gold_and_pred(gold_file_path, pred_file_path, claim_number_prefix=''):
+    gold_labels = _read_gold(gold_file_path, claim_number_prefix)
+    return gold_labels, _read_pred(pred_file_path, gold_labels, claim_number_prefix)
+
+
+def _encode_labels(labels):
+    """ Encodes labels (in any case) to an int8 array with their codes from _LABEL_CODES. """
+    labels = list(labels)
+    # Only the few distinct spellings of the labels need to be lower-cased, not every label.
+    codes = {label: _LABEL_CODES[label.lower()] for label in set(labels)}
+    return np.fromiter((codes[label] for label in labels), dtype=np.int8, count=len(labels))
+
+
+def _confusion_matrix_from_codes(gold_codes, pred_codes):
+    """
+    Computes Confusion Matrix from encoded labels with a single bincount.
+    :return: 3x3 int array, where rows are gold labels and columns are predicted ones, ordered as _LABELS.
+    """
+    num_labels = len(_LABELS)
+    pair_codes = np.asarray(gold_codes, dtype=np.int64) * num_labels + pred_codes
+    return np.bincount(pair_codes, minlength=num_labels * num_labels).reshape(num_labels, num_labels)
 
 
 def _compute_confusion_matrix(gold_labels, pred_labels):
     """ Computes Confusion Matrix. """
-    conf_matrix = {'true' : {'true' : 0, 'false' : 0, 'half-true': 0},
-                    'false' : {'true' : 0, 'false' : 0, 'half-true': 0},
-                    'half-true': {'true' : 0, 'false' : 0, 'half-true': 0}}
+    gold_codes = _encode_labels(gold_labels[claim_number] for claim_number in pred_labels)
+    pred_codes = _encode_labels(pred_labels.values())
+    return _confusion_matrix_from_codes(gold_codes, pred_codes)
 
-    for claim_number, pred_label in pred_labels.items():
-        pred_label = pred_label.lower()
-        true_label = gold_labels[claim_number].lower()
-        conf_matrix[true_label][pred_label] += 1
 
-    return conf_matrix
+def _claims_array(gold_labels, pred_labels, file_idx=0):
+    """
+    Converts the labels of a debate to a compact structured array.
+    :param gold_labels: a dictionary with gold label for each claim_number (without prefix)
+    :param pred_labels: a dictionary with predicted label for each claim_number (without prefix)
+    :param file_idx: index of the debate among all evaluated debates.
+    :return: array of _CLAIM_DTYPE with a row for each claim, ordered by claim_number.
+    """
+    claim_numbers = list(gold_labels.keys())
+    claims = np.zeros(len(claim_numbers), dtype=_CLAIM_DTYPE)
+    claims['file_idx'] = file_idx
+    claims['claim_number'] = np.fromiter((int(claim_number) for claim_number in claim_numbers), dtype=np.int32,
+                                         count=len(claim_numbers))
+    claims['gold'] = _encode_labels(gold_labels[claim_number] for claim_number in claim_numbers)
+    claims['pred'] = _encode_labels(pred_labels[claim_number] for claim_number in claim_numbers)
+    claims.sort(order=['file_idx', 'claim_number'])
+    return claims
 
 
-def _compute_accuracy(conf_matrix):
-    """ Computes Accuracy. """
-    num_claims = sum([sum(row.values()) for row in conf_matrix.values()])
-    correct_claims = sum([conf_matrix[l][l] for l in _LABELS])
-    if num_claims:
-        return correct_claims / num_claims
-    else:
-        return 0.0
+def _read_claims(gold_file_path, pred_file_path, file_idx=0):
+    """ Reads the gold and predicted labels of a debate to an array of _CLAIM_DTYPE. """
+    gold_labels, pred_labels = _read_gold_and_pred(gold_file_path, pred_file_path)
+    return _claims_array(gold_labels, pred_labels, file_idx)
 
 
-def _compute_macro_f1(conf_matrix):
-    """ Computes Macro F1. """
-    # Calculate standard P, R, F1, Acc
-    p = {'true': 0, 'false': 0, 'half-true': 0}
-    r = {'true': 0, 'false': 0, 'half-true': 0}
+def _iter_claims(gold_file_paths, pred_file_paths):
+    """
+    Streams the claims of multiple debates, one debate at a time.
+    Only the string dictionaries of the current debate are held in memory.
+    :return: generator of _CLAIM_DTYPE arrays, one for each debate, with file_idx the index of the debate.
+    """
+    for file_idx, (gold_file_path, pred_file_path) in enumerate(zip(gold_file_paths, pred_file_paths)):
+        yield _read_claims(gold_file_path, pred_file_path, file_idx)
+
+
+def _merge_claims(claim_arrays):
+    """ Concatenates (e.g. streamed) claim arrays of multiple debates into a single array of _CLAIM_DTYPE. """
+    return np.concatenate(list(claim_arrays) or [np.zeros(0, dtype=_CLAIM_DTYPE)])
+
+
+def _claims_confusion_matrix(claims):
+    """ Computes Confusion Matrix of an array of _CLAIM_DTYPE. """
+    return _confusion_matrix_from_codes(claims['gold'], claims['pred'])
+
+
+def _compute_file_confusion_matrix(gold_file_path, pred_file_path):
+    """ Computes the Confusion Matrix of a single debate. """
+    return _claims_confusion_matrix(_read_claims(gold_file_path, pred_file_path))
+
+
+def _check_and_compute_confusion_matrix(gold_file_path, pred_file_path):
+    """
+    Checks the format of the pred file of a single debate and computes its Confusion Matrix, reading the file once.
+    :return: the Confusion Matrix.
+    :raises ValueError: if the format of the pred file is wrong or it does not match the gold file.
+    The results are memoized, if a store is set with result_cache.set_store.
+    """
+    return result_cache.memoized('task2.check_and_compute_confusion_matrix', SCORER_VERSION, gold_file_path,
+                                 pred_file_path, [],
+                                 lambda: _check_and_compute_file_confusion_matrix(gold_file_path, pred_file_path))
+
+
+def _check_and_compute_file_confusion_matrix(gold_file_path, pred_file_path):
+    """ Checks and scores the pred file of a debate, as _check_and_compute_confusion_matrix, without memoization. """
+    gold_labels = _read_gold(gold_file_path)
+    pred_labels = _check_and_read_pred(pred_file_path, gold_labels)
+    return _claims_confusion_matrix(_claims_array(gold_labels, pred_labels))
+
+
+def _compute_stream_confusion_matrix(gold_file_paths, pred_file_paths):
+    """
+    Computes the Confusion Matrix of all claims of multiple debates, streaming the debates one at a time,
+    so that thousands of debates can be evaluated in constant memory.
+    """
+    return _add_confusion_matrices(_claims_confusion_matrix(claims)
+                                   for claims in _iter_claims(gold_file_paths, pred_file_paths))
 
-    for label in _LABELS:
-        all_predicted = sum([conf_matrix[l][label] for l in _LABELS])
 
-        if all_predicted:
-            p[label] = conf_matrix[label][label] / all_predicted
-        else:
-            p[label] = 0.0
-        all_gold = sum([conf_matrix[label][l] for l in _LABELS])
+def _safe_divide(numerator, denominator):
+    """ Divides element-wise, giving 0.0 where the denominator is 0. """
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result[()]
 
-        if all_gold == 0:
+
+def _all_gold(conf_matrix):
+    """ Counts the gold instances of each class. """
+    all_gold = np.sum(conf_matrix, axis=-1)
+    for code, label in enumerate(_LABELS):
+        if np.any(all_gold[..., code] == 0):
             raise ValueError('No instances for class {} found!'.format(label))
+    return all_gold
+
 
-        r[label] = conf_matrix[label][label] / all_gold
-    
-    f1 = {'true': 0, 'false': 0, 'half-true': 0}
-    for label in _LABELS:
-        if p[label] + r[label]:
-            f1[label] = 2.0 * p[label] * r[label] / (p[label] + r[label])
-        else:
-            f1[label] = 0.0
+# All metric functions take a 3x3 confusion matrix, where rows and columns are ordered as _LABELS.
+# They also take a (..., 3, 3) batch of confusion matrices and then return an array with the metric of each matrix.
+def _compute_accuracy(conf_matrix):
+    """ Computes Accuracy. """
+    num_claims = np.sum(conf_matrix, axis=(-2, -1))
+    correct_claims = np.trace(conf_matrix, axis1=-2, axis2=-1)
+    return _safe_divide(correct_claims, num_claims)
 
-    return sum(f1.values()) / len(f1)
+
+def _compute_macro_f1(conf_matrix):
+    """ Computes Macro F1. """
+    correct = np.diagonal(conf_matrix, axis1=-2, axis2=-1)
+    p = _safe_divide(correct, np.sum(conf_matrix, axis=-2))
+    r = correct / _all_gold(conf_matrix)
+    f1 = _safe_divide(2.0 * p * r, p + r)
+    return np.mean(f1, axis=-1)
 
 
 def _compute_macro_recall(conf_matrix):
     """ Computes Macro Recall """
-    r = {}
-    for label in _LABELS:
-        all_gold = sum([conf_matrix[label][l] for l in _LABELS])
-        if all_gold == 0:
-            raise ValueError('No instances for class {} found!'.format(label))
-
-        r[label] = conf_matrix[label][label] / all_gold
-    
-    return sum(r.values()) / len(r)
+    r = np.diagonal(conf_matrix, axis1=-2, axis2=-1) / _all_gold(conf_matrix)
+    return np.mean(r, axis=-1)
 
 
 def _compute_mean_absolute_error(conf_matrix):
     """ Computes Mean Absolute Error (MAE). """
-    num_claims = sum([sum(row.values()) for row in conf_matrix.values()])
-    distance_sum = 0.0
-    for gold_label in conf_matrix:
-        for pred_label in conf_matrix:
-            distance = abs(_LABEL_NUMERIC_VALUES[gold_label] - _LABEL_NUMERIC_VALUES[pred_label])
-            distance_sum += conf_matrix[gold_label][pred_label] * distance
-    if num_claims:
-        return distance_sum / num_claims
-    else:
-        return 0.0
+    num_claims = np.sum(conf_matrix, axis=(-2, -1))
+    distance_sum = np.sum(conf_matrix * _LABEL_DISTANCES, axis=(-2, -1))
+    return _safe_divide(distance_sum, num_claims)
 
 
 def _compute_macro_averaged_mae(conf_matrix):
     """ Computes Macro-averaged Mean Absolute Error. """
-    mae = {}
-    for label in _LABELS:
-        all_gold = sum([conf_matrix[label][l] for l in _LABELS])
-        distance_sum = 0.0
-        gold_label_value = _LABEL_NUMERIC_VALUES[label]
-        for pred_label in conf_matrix[label]:
-            distance = abs(gold_label_value - _LABEL_NUMERIC_VALUES[pred_label])
-            distance_sum += conf_matrix[label][pred_label] * distance
-        if all_gold == 0:
-            raise ValueError('No instances for class {} found!'.format(label))
-        mae[label] = distance_sum / all_gold
-    return sum(mae.values()) / len(mae)
+    distance_sum = np.sum(conf_matrix * _LABEL_DISTANCES, axis=-1)
+    mae = distance_sum / _all_gold(conf_matrix)
+    return np.mean(mae, axis=-1)
+
+
+def _add_confusion_matrices(conf_matrices):
+    """ Sums confusion matrices, e.g. of separate debates, into the confusion matrix of all their claims. """
+    total = np.zeros((len(_LABELS), len(_LABELS)), dtype=np.int64)
+    for conf_matrix in conf_matrices:
+        total += conf_matrix
+    return total
+
+
+def _compute_metrics(conf_matrix):
+    """ Computes MAE, Macro MAE, Acc, Macro F1 and Average Recall from a confusion matrix (or a batch of them). """
+    return {
+        'mae': _compute_mean_absolute_error(conf_matrix),
+        'macro_mae': _compute_macro_averaged_mae(conf_matrix),
+        'accuracy': _compute_accuracy(conf_matrix),
+        'macro_f1': _compute_macro_f1(conf_matrix),
+        'macro_recall': _compute_macro_recall(conf_matrix),
+    }
+
+
+def _classification_metrics(conf_matrix):
+    """ Computes the metrics of a confusion matrix as ClassificationMetrics. """
+    metrics = _compute_metrics(conf_matrix)
+    return ClassificationMetrics(conf_matrix, *[float(metrics[metric]) for metric in MAIN_METRICS])
+
+
+def score(gold_file_paths, pred_file_paths, workers=1):
+    """
+    Checks and scores the pred files of a run, without logging the results, so that it can be used as a library.
+    It is thread-safe and the results are memoized, if a store is set with result_cache.set_store.
+    :param gold_file_paths: list with the gold file of each debate.
+    :param pred_file_paths: list with the pred file of each debate.
+    :param workers: number of worker processes, which check and score the debates. The results do not depend on it.
+    :return: Task2Result.
+    :raises ValueError: if the lists of files do not match, or a pred file is badly formatted
+    or does not match its gold file.
+    """
+    _check_file_lists(pred_file_paths, gold_file_paths)
+    # The store is set in the worker processes only: setting it again in this process would race with other threads.
+    initializer, initargs = (result_cache.set_store, result_cache.get_store()) if workers > 1 else (None, ())
+    conf_matrices = pool_map(_check_and_compute_confusion_matrix, gold_file_paths, pred_file_paths, workers=workers,
+                             initializer=initializer, initargs=initargs)
+    return Task2Result(list(pred_file_paths), conf_matrices,
+                       _classification_metrics(_add_confusion_matrices(conf_matrices)))
+
+
+def _approximate_randomization(gold_codes, pred_codes_a, pred_codes_b, num_permutations=10000, random_state=None):
+    """
+    Paired approximate randomization test between the predictions of two runs for the same claims.
+    Each permutation swaps the predictions of the runs for a random subset of the claims. Only the claims with
+    different predictions can change the confusion matrices, so the permuted matrices of all permutations are computed
+    as batched updates with np.bincount over the encoded (gold, pred) pairs of these claims.
+    :param gold_codes: int array with the encoded gold label of each claim.
+    :param pred_codes_a: int array with the encoded labels predicted by the first run.
+    :param pred_codes_b: int array with the encoded labels predicted by the second run.
+    :param num_permutations: number of random permutations.
+    :param random_state: numpy RandomState used for the permutations.
+    :return: {metric:difference} dict with the observed difference of the runs (a - b) for each metric in MAIN_METRICS;
+    {metric:p-value} dict with the two-sided p-value for each metric.
+    """
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    num_labels = len(_LABELS)
+    num_cells = num_labels * num_labels
+
+    pair_codes_a = np.asarray(gold_codes, dtype=np.int64) * num_labels + pred_codes_a
+    pair_codes_b = np.asarray(gold_codes, dtype=np.int64) * num_labels + pred_codes_b
+    conf_a = _confusion_matrix_from_codes(gold_codes, pred_codes_a).ravel()
+    conf_b = _confusion_matrix_from_codes(gold_codes, pred_codes_b).ravel()
+    conf_total = conf_a + conf_b
+
+    observed_a = _compute_metrics(conf_a.reshape(num_labels, num_labels))
+    observed_b = _compute_metrics(conf_b.reshape(num_labels, num_labels))
+    differences = {metric: float(observed_a[metric] - observed_b[metric]) for metric in MAIN_METRICS}
+
+    differing = pair_codes_a != pair_codes_b
+    swap_from = pair_codes_a[differing]
+    swap_to = pair_codes_b[differing]
+    num_differing = len(swap_from)
+
+    num_extreme = {metric: 0 for metric in MAIN_METRICS}
+    chunk_size = max(1, _PERMUTATION_CHUNK_SIZE // max(num_differing, 1))
+    for start in range(0, num_permutations, chunk_size):
+        num_chunk = min(chunk_size, num_permutations - start)
+        permutations, claims = np.nonzero(random_state.randint(0, 2, size=(num_chunk, num_differing)))
+        offsets = permutations * num_cells
+        update = np.bincount(offsets + swap_to[claims], minlength=num_chunk * num_cells) - \
+            np.bincount(offsets + swap_from[claims], minlength=num_chunk * num_cells)
+
+        permuted_a = conf_a + update.reshape(num_chunk, num_cells)
+        permuted_b = conf_total - permuted_a
+        metrics_a = _compute_metrics(permuted_a.reshape(num_chunk, num_labels, num_labels))
+        metrics_b = _compute_metrics(permuted_b.reshape(num_chunk, num_labels, num_labels))
+        for metric in MAIN_METRICS:
+            permuted_differences = np.abs(metrics_a[metric] - metrics_b[metric])
+            num_extreme[metric] += int(np.sum(permuted_differences >= abs(differences[metric]) - _EPSILON))
+
+    p_values = {metric: (num_extreme[metric] + 1.0) / (num_permutations + 1.0) for metric in MAIN_METRICS}
+    return differences, p_values
+
+
+def compare_runs(gold_file_paths, runs_pred_file_paths, num_permutations=10000, seed=0):
+    """
+    Tests the significance of the differences between every pair of runs with paired approximate randomization.
+    The claims of all debates are pooled, as for the evaluation of a single run.
+    The format of each pred file is checked while reading it.
+    :param gold_file_paths: list with the gold file of each debate.
+    :param runs_pred_file_paths: list with the list of pred files (one for each debate) of each run.
+    :param num_permutations: number of random permutations for each pair of runs.
+    :param seed: seed for the permutations.
+    :return: list with a (run index a, run index b, differences, p_values) tuple for each pair of runs,
+    where differences and p_values are the dicts returned by _approximate_randomization.
+    """
+    runs_claims = [[] for _ in runs_pred_file_paths]
+    for file_idx, gold_file_path in enumerate(gold_file_paths):
+        gold_labels = _read_gold(gold_file_path)
+        for claims, pred_file_paths in zip(runs_claims, runs_pred_file_paths):
+            pred_labels = _check_and_read_pred(pred_file_paths[file_idx], gold_labels)
+            claims.append(_claims_array(gold_labels, pred_labels, file_idx))
+
+    runs_claims = [_merge_claims(claims) for claims in runs_claims]
+    gold_codes = runs_claims[0]['gold']
+    runs_pred_codes = [claims['pred'] for claims in runs_claims]
+
+    comparisons = []
+    for run_a, run_b in itertools.combinations(range(len(runs_pred_codes)), 2):
+        differences, p_values = _approximate_randomization(gold_codes, runs_pred_codes[run_a],
+                                                           runs_pred_codes[run_b], num_permutations,
+                                                           np.random.RandomState(seed))
+        comparisons.append((run_a, run_b, differences, p_values))
+    return comparisons
 
 
 def evaluate(gold_labels, pred_labels):
@@ -151,79 +435,122 @@ def evaluate(gold_labels, pred_labels):
     :param gold_labels: a dictionary with gold label for each claim_id
     :param pred_labels: a dictionary with predicted label for each claim_id
     """
+    evaluate_confusion_matrix(_compute_confusion_matrix(gold_labels, pred_labels))
+
+
+def evaluate_confusion_matrix(conf_matrix):
+    """
+    Evaluates an already computed confusion matrix, e.g. summed over multiple debates.
+    Metrics are: confusion matrix, Acc, Macro F1, Average Recall, MAE, Macro MAE
+    :param conf_matrix: 3x3 array with the count of each (gold label, predicted label) pair, ordered as _LABELS
+    """
+    print_results(_classification_metrics(conf_matrix))
+
+
+def print_results(metrics):
+    """ Logs ClassificationMetrics, e.g. the metrics of the result of score. """
+    conf_matrix = metrics.confusion_matrix
 
-    # Calculate Metrics
-    conf_matrix = _compute_confusion_matrix(gold_labels, pred_labels)
-    mae = _compute_mean_absolute_error(conf_matrix)
-    macro_mae = _compute_macro_averaged_mae(conf_matrix)
-    accuracy = _compute_accuracy(conf_matrix)
-    macro_f1 = _compute_macro_f1(conf_matrix)
-    macro_recall = _compute_macro_recall(conf_matrix)
-    
     # Log Results
     lines_separator = '=' * 120
     higher_better = '     (higher is better)'
     lower_better = '     (lower is better)'
-    logging.info('{:=^120}'.format(' RESULTS '))
+    logger.info('{:=^120}'.format(' RESULTS '))
 
-    logging.info('{:<30}'.format('MEAN ABSOLUTE ERROR (MAE):') + '{0:.4f}'.format(mae) + lower_better)
-    logging.info(lines_separator)
+    logger.info('{:<30}'.format('MEAN ABSOLUTE ERROR (MAE):') + '{0:.4f}'.format(metrics.mae) + lower_better)
+    logger.info(lines_separator)
 
-    logging.info('{:<30}'.format('MACRO-AVERAGE MAE:') + '{0:.4f}'.format(macro_mae) + lower_better)
-    logging.info(lines_separator)
+    logger.info('{:<30}'.format('MACRO-AVERAGE MAE:') + '{0:.4f}'.format(metrics.macro_mae) + lower_better)
+    logger.info(lines_separator)
 
-    logging.info('{:<30}'.format('ACCURACY:') + '{0:.4f}'.format(accuracy) + higher_better)
-    logging.info(lines_separator)
+    logger.info('{:<30}'.format('ACCURACY:') + '{0:.4f}'.format(metrics.accuracy) + higher_better)
+    logger.info(lines_separator)
 
-    logging.info('{:<30}'.format('MACRO-AVERAGE F1:') + '{0:.4f}'.format(macro_f1) + higher_better)
-    logging.info(lines_separator)
+    logger.info('{:<30}'.format('MACRO-AVERAGE F1:') + '{0:.4f}'.format(metrics.macro_f1) + higher_better)
+    logger.info(lines_separator)
 
-    logging.info('{:<30}'.format('MACRO-AVERAGE RECALL:') + '{0:.4f}'.format(macro_recall) + higher_better)
-    logging.info(lines_separator)
+    logger.info('{:<30}'.format('MACRO-AVERAGE RECALL:') + '{0:.4f}'.format(metrics.macro_recall) + higher_better)
+    logger.info(lines_separator)
 
-    logging.info('{:<30}'.format('CONFUSION MATRIX:'))
-    logging.info(' '*10 + ''.join(['{:>15}'.format(l) for l in _LABELS]))
+    logger.info('{:<30}'.format('CONFUSION MATRIX:'))
+    logger.info(' '*10 + ''.join(['{:>15}'.format(l) for l in _LABELS]))
     for true_label in _LABELS:
-        predicted_labels = conf_matrix[true_label]
-        logging.info('{:<10}'.format(true_label) + ''.join(['{:>15}'.format(predicted_labels[l]) for l in _LABELS]))
-    logging.info(lines_separator)
-
-    logging.info('Description of the evaluation metrics: ')
-    logging.info('!!! THE OFFICIAL METRIC USED FOR THE COMPETITION RANKING IS MEAN ABSOLUTE ERROR !!!')
-    logging.info('Mean Absolute Error (MAE) computes the mean "distance" between the predicted and gold labels.')
-    logging.info('  For correct predictions the distance is 0.')
-    logging.info('  For mistakes between FALSE and TRUE classes it is 2, and for all other mistakes it is 1.')
-    logging.info('Macro-average MAE computes MAE for each of the (gold) classes and takes the average.')
-    logging.info('Accuracy computes the percentage of correctly predicted classes.')
-    logging.info('Macro-average F1 computes the F1 score for each of the classes and takes their average.')
-    logging.info('Macro-average Recall computes Recall for each of the classes and takes its average.')
-    logging.info('Confusion Matrix computes the distribution of predicted classes, where rows are true labels and columns are predicted ones.')
-    logging.info(lines_separator)
-    logging.info(lines_separator)
-
-
-def validate_files(pred_files, gold_files):
+        predicted_labels = conf_matrix[_LABEL_CODES[true_label]]
+        logger.info('{:<10}'.format(true_label) + ''.join(['{:>15}'.format(predicted_labels[_LABEL_CODES[l]]) for l in _LABELS]))
+    logger.info(lines_separator)
+
+    logger.info('Description of the evaluation metrics: ')
+    logger.info('!!! THE OFFICIAL METRIC USED FOR THE COMPETITION RANKING IS MEAN ABSOLUTE ERROR !!!')
+    logger.info('Mean Absolute Error (MAE) computes the mean "distance" between the predicted and gold labels.')
+    logger.info('  For correct predictions the distance is 0.')
+    logger.info('  For mistakes between FALSE and TRUE classes it is 2, and for all other mistakes it is 1.')
+    logger.info('Macro-average MAE computes MAE for each of the (gold) classes and takes the average.')
+    logger.info('Accuracy computes the percentage of correctly predicted classes.')
+    logger.info('Macro-average F1 computes the F1 score for each of the classes and takes their average.')
+    logger.info('Macro-average Recall computes Recall for each of the classes and takes its average.')
+    logger.info('Confusion Matrix computes the distribution of predicted classes, where rows are true labels and columns are predicted ones.')
+    logger.info(lines_separator)
+    logger.info(lines_separator)
+
+
+def print_comparisons(runs_pred_files, comparisons, num_permutations):
+    lines_separator = '=' * 120
+    logger.info('{:=^120}'.format(' SIGNIFICANCE TESTS '))
+    for run_idx, pred_files in enumerate(runs_pred_files):
+        logger.info('RUN {}: {}'.format(run_idx + 1, ', '.join(pred_files)))
+    logger.info(lines_separator)
+
+    for run_a, run_b, differences, p_values in comparisons:
+        logger.info('RUN {} vs RUN {}'.format(run_a + 1, run_b + 1))
+        logger.info('{:<30}{:>15}{:>15}'.format('', 'DIFFERENCE', 'P-VALUE'))
+        for metric in MAIN_METRICS:
+            logger.info('{:<30}{:>15.4f}{:>15.4f}'.format(metric.upper() + ':', differences[metric], p_values[metric]))
+        logger.info(lines_separator)
+
+    logger.info('The difference is the metric of the first run minus the metric of the second run.')
+    logger.info('The p-values are from a two-sided paired approximate randomization test with {} permutations.'
+                 .format(num_permutations))
+    logger.info(lines_separator)
+
+
+def _check_file_lists(pred_files, gold_files):
+    """
+    Checks that there is a different pred file for each gold file.
+    :raises ValueError: if the lists of files do not match.
+    """
     if len(pred_files) != len(gold_files):
-        logging.error(
-            'Different number of gold files ({}) and pred files ({}) provided. Cannot score.'.format(
-                len(gold_files), len(pred_files)
-            )
-        )
-        return False
+        raise ValueError('Different number of gold files ({}) and pred files ({}) provided. Cannot score.'.format(
+            len(gold_files), len(pred_files)))
 
     if len(pred_files) != len(set(pred_files)):
-        logging.error('Same pred file provided multiple times. The pred files should be for different debates.')
+        raise ValueError('Same pred file provided multiple times. The pred files should be for different debates.')
+
+
+def validate_files(pred_files, gold_files, workers=1, check_formats=True):
+    """
+    Validates the lists of pred and gold files before scoring.
+    :param check_formats: whether to check the format of each pred file. Pass False when the files are checked
+    while reading them for scoring (as in _check_and_compute_confusion_matrix).
+    """
+    try:
+        _check_file_lists(pred_files, gold_files)
+    except ValueError as e:
+        logger.error(e)
         return False
 
-    for pred_file in pred_files:
-        if not check_format(pred_file):
-            logging.error('Bad format for pred file {}. Cannot score.'.format(pred_file))
+    if not check_formats:
+        return True
+
+    for pred_file, format_ok in zip(pred_files, pool_map(check_format, pred_files, workers=workers)):
+        if not format_ok:
+            logger.error('Bad format for pred file {}. Cannot score.'.format(pred_file))
             return False
 
     return True
 
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s : %(message)s', level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--gold_file_path",
@@ -233,22 +560,57 @@ if __name__ == '__main__':
     )
     parser.add_argument(
         "--pred_file_path",
-        help="Single string containing a comma separated list of paths to files with classified claims.",
+        help="Single string containing a comma separated list of paths to files with classified claims. "
+             "Multiple runs can be separated with semicolons, then the differences between the runs are tested "
+             "for significance.",
         type=str,
         required=True
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of worker processes, which check and score the debates in parallel.",
+        type=int,
+        default=1
+    )
+    parser.add_argument(
+        "--permutations",
+        help="Number of permutations for the significance tests between multiple runs.",
+        type=int,
+        default=10000
+    )
+    parser.add_argument("--seed", help="Seed for the permutations of the significance tests.", type=int, default=0)
+    parser.add_argument(
+        "--result_cache_path",
+        help="Path to an SQLite file, where the results are memoized, so that unchanged files are not scored again.",
+        type=str
+    )
+    parser.add_argument("--result_cache_size", help="Maximum number of memoized results.", type=int,
+                        default=result_cache.DEFAULT_MAX_ENTRIES)
     args = parser.parse_args()
+    if args.result_cache_path:
+        result_cache.set_store(args.result_cache_path, args.result_cache_size)
 
-    pred_files = [pred_file.strip() for pred_file in args.pred_file_path.split(",")]
+    runs_pred_files = [[pred_file.strip() for pred_file in run_pred_files.split(",")]
+                       for run_pred_files in args.pred_file_path.split(";")]
+    pred_files = runs_pred_files[0]
     gold_files = [gold_file.strip() for gold_file in args.gold_file_path.split(",")]
 
-    if validate_files(pred_files, gold_files):
-        logging.info("Started evaluating results for Task 2 ...")
-        all_gold_labels = {}
-        all_pred_labels = {}
-        for idx, (pred_file, gold_file) in enumerate(zip(pred_files, gold_files)):
-            gold_labels, pred_labels = _read_gold_and_pred(gold_file, pred_file, 'file-{}-claim-number-'.format(idx))
-            all_gold_labels.update(gold_labels)
-            all_pred_labels.update(pred_labels)
-
-        evaluate(all_gold_labels, all_pred_labels)
+    if len(runs_pred_files) > 1:
+        if all([validate_files(run_pred_files, gold_files, check_formats=False) for run_pred_files in runs_pred_files]):
+            logger.info("Started significance tests between {} runs for Task 2 ...".format(len(runs_pred_files)))
+            try:
+                comparisons = compare_runs(gold_files, runs_pred_files, args.permutations, args.seed)
+            except ValueError as e:
+                logger.error(e)
+                sys.exit(1)
+            print_comparisons(runs_pred_files, comparisons, args.permutations)
+
+    elif validate_files(pred_files, gold_files, check_formats=False):
+        logger.info("Started evaluating results for Task 2 ...")
+        # Each pred file is checked and scored in a single pass, the scoring stops if any of them is badly formatted.
+        try:
+            result = score(gold_files, pred_files, args.workers)
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+        print_results(result.metrics)
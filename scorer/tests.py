@@ -1,15 +1,46 @@
-from unittest import TestCase
-from os.path import dirname, join
-
-from scorer import task1, task2
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+from os import makedirs
+from os.path import basename, dirname, join
+
+import numpy as np
+
+from scorer import benchmark, gold_cache, incremental, leaderboard, out_of_core, result_cache, service, task1, task2
+from scorer.pool import pool_map
 
 _ROOT_DIR = dirname(dirname(__file__))
 _GOLD_FILE_1 = join(_ROOT_DIR, 'data/task1/English/Task1-English-1st-Presidential.txt')
 _PRED_FILE_1 = join(_ROOT_DIR, 'scorer/data/task1_random_baseline.txt')
 _PRED_FILE_1_NOTFULL = join(_ROOT_DIR, 'scorer/data/task1_not_all_lines.txt')
+_PRED_FILE_1_GOLD = join(_ROOT_DIR, 'scorer/data/task1_gold.txt')
+_PRED_FILE_1_OTHER = join(_ROOT_DIR, 'scorer/data/task1_other_line_number.txt')
 _GOLD_FILE_2 = join(_ROOT_DIR, 'data/task2/English/Task2-English-1st-Presidential.txt')
 _PRED_FILE_2 = join(_ROOT_DIR, 'scorer/data/task2_random_baseline.txt')
 _PRED_FILE_2_NOTFULL = join(_ROOT_DIR, 'scorer/data/task2_not_all_claims.txt')
+_PRED_FILE_2_GOLD = join(_ROOT_DIR, 'scorer/data/task2_gold.txt')
+_GOLD_FILE_2_ARABIC = join(_ROOT_DIR, 'data/task2/Arabic/Task2-Arabic-2nd-Presidential.txt')
+
+_cache_dir = None
+
+
+def setUpModule():
+    # The gold files are cached in a temporary directory, not in the cache of the user.
+    global _cache_dir
+    _cache_dir = tempfile.mkdtemp()
+    gold_cache.set_cache_dir(_cache_dir)
+
+
+def tearDownModule():
+    gold_cache.set_cache_dir(None)
+    shutil.rmtree(_cache_dir)
 
 
 class ScorerTask1(TestCase):
@@ -54,6 +85,108 @@ class ScorerTask1(TestCase):
         rr = task1._compute_reciprocal_rank(y_gold_labels, [2, 5, 4, 1, 3])
         self.assertEqual(rr, 1/2)
 
+    def test_ranking_metrics(self):
+        relevance = task1._compute_relevance(task1._gold_label_lookup({1: 1, 2: 0, 3: 1, 4: 0, 5: 1}),
+                                             [1, 2, 3, 4, 5], [0.9, 0.8, 0.1, 0.8, 0.5])
+        self.assertEqual(relevance.tolist(), [1, 0, 0, 1, 1])
+
+        metrics = task1._compute_ranking_metrics(relevance, [1, 2, 10])
+        self.assertEqual(metrics['num_relevant'], 3)
+        self.assertEqual(metrics['avg_precision'], (1 + 2/4 + 3/5) / 3)
+        self.assertEqual(metrics['reciprocal_rank'], 1)
+        self.assertEqual(metrics['r_precision'], 1/3)
+        self.assertEqual(metrics['precision_at'], {1: 1, 2: 0.5, 10: 3/10})
+        self.assertEqual(metrics['recall_at'], {1: 1/3, 2: 1/3, 10: 1})
+        self.assertEqual(metrics['pr_curve'][0].tolist(), [1/3, 2/3, 1])
+        self.assertEqual(metrics['pr_curve'][1].tolist(), [1, 2/4, 3/5])
+
+        metrics = task1._compute_ranking_metrics(relevance[:0])
+        self.assertEqual(metrics['avg_precision'], 0)
+        self.assertEqual(metrics['reciprocal_rank'], 0)
+
+    def test_evaluate(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        ranked_lines = [t[0] for t in sorted(line_score, key=lambda x: x[1], reverse=True)]
+
+        thresholds, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        self.assertEqual(thresholds, task1.MAIN_THRESHOLDS + [len(ranked_lines)])
+        self.assertEqual(precisions, [sum([gold_labels[l] for l in ranked_lines[:i + 1]]) / (i + 1)
+                                      for i in range(len(ranked_lines))])
+        self.assertEqual(num_relevant, sum(gold_labels.values()))
+        self.assertEqual(avg_precision, sum([precisions[i] for i, l in enumerate(ranked_lines) if gold_labels[l]])
+                         / num_relevant)
+        self.assertEqual(reciprocal_rank, 1 / (precisions.index(next(p for p in precisions if p)) + 1))
+
+    def test_bootstrap(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1_GOLD)
+        relevance = task1._ranking_relevance(gold_labels, line_score)
+        thresholds = [1, 5, 50]
+
+        samples = task1._bootstrap_ranking_metrics(relevance, 20, thresholds, np.random.RandomState(1))
+        self.assertEqual(samples.shape, (20, 3 + len(thresholds)))
+
+        resampled_ranks = np.sort(np.random.RandomState(1).randint(0, len(relevance), size=(20, len(relevance))),
+                                  axis=1)
+        for resample, ranks in zip(samples, resampled_ranks):
+            metrics = task1._compute_ranking_metrics(relevance[ranks], thresholds)
+            expected = [metrics['avg_precision'], metrics['reciprocal_rank'], metrics['r_precision']] + \
+                       [metrics['precision_at'][th] for th in thresholds]
+            np.testing.assert_allclose(resample, expected)
+
+        intervals = task1._confidence_intervals(samples, 0.9)
+        self.assertEqual(intervals.shape, (2, 3 + len(thresholds)))
+        self.assertTrue(np.all(intervals[0] <= intervals[1]))
+
+    def test_bootstrap_means(self):
+        debate_metrics = [[0.1, 1.0], [0.3, 0.5]]
+        samples = task1._bootstrap_means(debate_metrics, 1000, np.random.RandomState(0))
+        self.assertEqual(samples.shape, (1000, 2))
+        self.assertEqual(set(samples[:, 0].round(6)), {0.1, 0.2, 0.3})
+        self.assertAlmostEqual(samples[:, 0].mean(), 0.2, places=2)
+
+    def test_check_and_evaluate(self):
+        metrics = task1._check_and_evaluate(_GOLD_FILE_1, _PRED_FILE_1, 10)
+        _, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        self.assertEqual(metrics['precisions'].tolist(), precisions)
+        self.assertEqual(metrics['avg_precision'], avg_precision)
+        self.assertEqual(metrics['reciprocal_rank'], reciprocal_rank)
+        self.assertEqual(metrics['num_relevant'], num_relevant)
+        self.assertEqual(metrics['bootstrap'].tolist(), task1.bootstrap(_GOLD_FILE_1, _PRED_FILE_1, 10).tolist())
+
+        with self.assertRaises(ValueError):
+            task1._check_and_evaluate(_GOLD_FILE_1, _PRED_FILE_1_OTHER)
+        with self.assertRaises(ValueError):
+            task1._check_and_evaluate(_GOLD_FILE_1, _PRED_FILE_1_NOTFULL)
+
+    def test_score(self):
+        result = task1.score([_GOLD_FILE_1, _GOLD_FILE_1], [_PRED_FILE_1, _PRED_FILE_1_GOLD], bootstrap_resamples=10)
+        self.assertEqual(result.pred_files, [_PRED_FILE_1, _PRED_FILE_1_GOLD])
+        _, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        debate = result.debates[0]
+        self.assertEqual(debate.avg_precision, avg_precision)
+        self.assertEqual(debate.reciprocal_rank, reciprocal_rank)
+        self.assertEqual(debate.r_precision, precisions[num_relevant - 1])
+        self.assertEqual(debate.precision_at[5], precisions[4])
+        self.assertEqual(debate.num_relevant, num_relevant)
+        self.assertEqual(sorted(debate.confidence_intervals.keys()), sorted(task1.MAIN_METRICS))
+        self.assertEqual(result.debates[1].avg_precision, 1.0)
+        self.assertEqual(result.mean.avg_precision, (avg_precision + 1.0) / 2)
+        self.assertEqual(result.mean.num_relevant, 2 * num_relevant)
+        self.assertIsNone(task1.score([_GOLD_FILE_1], [_PRED_FILE_1]).mean.confidence_intervals)
+
+        with self.assertRaises(ValueError):
+            task1.score([_GOLD_FILE_1], [_PRED_FILE_1, _PRED_FILE_1_GOLD])
+        with self.assertRaises(ValueError):
+            task1.score([_GOLD_FILE_1, _GOLD_FILE_1], [_PRED_FILE_1, _PRED_FILE_1])
+        with self.assertRaises(ValueError):
+            task1.score([_GOLD_FILE_1], [_PRED_FILE_1_OTHER])
+
+    def test_score_threads(self):
+        expected = task1.score([_GOLD_FILE_1], [_PRED_FILE_1]).debates[0]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: task1.score([_GOLD_FILE_1], [_PRED_FILE_1]), range(8)))
+        self.assertEqual([result.debates[0] for result in results], [expected] * 8)
+
     def test_read_gold_and_pred(self):
         gold_labels, pred_ranked = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
 
@@ -65,33 +198,191 @@ class ScorerTask1(TestCase):
           task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1_NOTFULL)
 
 
+class ScorerIncremental(TestCase):
+    def test_evaluate(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        evaluator = incremental.IncrementalEvaluator.from_gold_file(_GOLD_FILE_1)
+        for line_number, score in line_score[:100]:
+            evaluator.update(line_number, score)
+        evaluator.update_many(line_score[100:])
+        self.assertTrue(evaluator.is_complete())
+
+        metrics = evaluator.metrics()
+        _, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        self.assertEqual(metrics['avg_precision'], avg_precision)
+        self.assertEqual(metrics['reciprocal_rank'], reciprocal_rank)
+        self.assertEqual(metrics['num_relevant'], num_relevant)
+        self.assertEqual(metrics['r_precision'], precisions[num_relevant - 1])
+        self.assertEqual(metrics['precision_at'], {th: precisions[th - 1] for th in task1.MAIN_THRESHOLDS})
+
+    @mock.patch.object(incremental, '_BLOCK_SIZE', 4)
+    def test_partial_rankings(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        random_state = np.random.RandomState(0)
+        # Rounded scores have many ties, which are ranked in the order of the first score.
+        line_score = [(line_number, round(score, 1)) for line_number, score in line_score]
+        evaluator = incremental.IncrementalEvaluator(gold_labels)
+        for num_lines in [1, 10, 50, 300, len(line_score)]:
+            evaluator.update_many(line_score[len(evaluator):num_lines])
+            rescored = random_state.randint(0, num_lines, 5)
+            for idx in rescored:
+                line_score[idx] = (line_score[idx][0], float(random_state.randint(0, 10)) / 10)
+                evaluator.update(*line_score[idx])
+
+            metrics = evaluator.metrics()
+            expected = task1._evaluate_ranking(gold_labels, line_score[:num_lines])
+            for metric in ['num_relevant', 'avg_precision', 'reciprocal_rank', 'r_precision', 'precision_at']:
+                self.assertEqual(metrics[metric], expected[metric])
+
+    @mock.patch.object(incremental, '_BLOCK_SIZE', 2)
+    def test_order_statistics(self):
+        keys = incremental._OrderStatistics()
+        for key in [5, 1, 9, 3, 7, 2, 8]:
+            keys.add(key)
+        keys.remove(7)
+        self.assertEqual(list(keys), [1, 2, 3, 5, 8, 9])
+        self.assertEqual([keys[rank] for rank in range(len(keys))], [1, 2, 3, 5, 8, 9])
+        self.assertEqual([keys.rank(key) for key in [0, 3, 4, 9, 10]], [0, 2, 3, 5, 6])
+        self.assertEqual([keys.rank(key, right=True) for key in [0, 3, 4, 9, 10]], [0, 3, 3, 6, 6])
+
+    def test_cached_metrics(self):
+        evaluator = incremental.IncrementalEvaluator({1: 0, 2: 1, 3: 1})
+        evaluator.update_many([(1, 0.9), (2, 0.5)])
+        with mock.patch.object(evaluator, '_compute_metrics', wraps=evaluator._compute_metrics) as compute_metrics:
+            metrics = evaluator.metrics()
+            metrics['precision_at'][1] = 1.0
+            self.assertEqual(evaluator.metrics()['precision_at'][1], 0.0)
+            self.assertEqual(compute_metrics.call_count, 1)
+            evaluator.update(3, 1.0)
+            self.assertEqual(evaluator.metrics()['precision_at'][1], 1.0)
+            self.assertEqual(compute_metrics.call_count, 2)
+
+    def test_precision_sums(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        random_state = np.random.RandomState(1)
+        evaluator = incremental.IncrementalEvaluator(gold_labels)
+        scored = {}
+        # The metrics are read after every update, so that each uses the sums kept from the previous one.
+        for idx in random_state.randint(0, 200, 400):
+            line_number = line_score[idx][0]
+            scored[line_number] = float(random_state.randint(0, 20)) / 20
+            evaluator.update(line_number, scored[line_number])
+            ranking = sorted(scored.items(), key=lambda item: evaluator._keys[item[0]][1])
+            self.assertEqual(evaluator.metrics()['avg_precision'],
+                             task1._evaluate_ranking(gold_labels, ranking)['avg_precision'])
+
+        # A line scored below all relevant lines keeps their sums, one scored above them recomputes them all.
+        num_relevant = evaluator.metrics()['num_relevant']
+        line_number = next(line_number for line_number, _ in line_score[200:] if gold_labels[line_number] == 0)
+        with mock.patch.object(evaluator._ranking, 'rank', wraps=evaluator._ranking.rank) as rank:
+            evaluator.update(line_number, -1.0)
+            evaluator.metrics()
+            self.assertEqual(rank.call_count, 1)
+            evaluator.update(line_number, 2.0)
+            evaluator.metrics()
+            self.assertEqual(rank.call_count, 2 + num_relevant)
+
+    def test_errors(self):
+        evaluator = incremental.IncrementalEvaluator({1: 0, 2: 1})
+        self.assertEqual(evaluator.metrics()['avg_precision'], 0.0)
+        with self.assertRaises(ValueError):
+            evaluator.update(3, 0.5)
+        with self.assertRaises(ValueError):
+            evaluator.update(1, float('nan'))
+
+
+class ScorerOutOfCore(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spill_dir = join(self.tmp_dir, 'spill')
+        makedirs(self.spill_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_metrics(self, pred_file):
+        _, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, pred_file)
+        # Small chunks split the file into many runs.
+        for chunk_size in [100, 5000, out_of_core.DEFAULT_CHUNK_SIZE]:
+            metrics = out_of_core.evaluate(_GOLD_FILE_1, pred_file, chunk_size=chunk_size, spill_dir=self.spill_dir)
+            self.assertEqual(metrics['avg_precision'], avg_precision)
+            self.assertEqual(metrics['reciprocal_rank'], reciprocal_rank)
+            self.assertEqual(metrics['num_relevant'], num_relevant)
+            self.assertEqual(metrics['r_precision'], precisions[num_relevant - 1])
+            self.assertEqual(metrics['precision_at'], {th: precisions[th - 1] for th in task1.MAIN_THRESHOLDS})
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_evaluate(self):
+        self._assert_metrics(_PRED_FILE_1)
+        self._assert_metrics(_PRED_FILE_1_GOLD)
+
+    def test_ties(self):
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        pred_file = join(self.tmp_dir, 'ties.txt')
+        with open(pred_file, 'w') as pred_f:
+            for line_number, score in line_score:
+                pred_f.write('{}\t{}\n'.format(line_number, round(score, 1)))
+        self._assert_metrics(pred_file)
+
+    def test_line_separators(self):
+        # Other line separators of Unicode are whitespace within a line, not line breaks.
+        gold_labels, line_score = task1._read_gold_and_pred(_GOLD_FILE_1, _PRED_FILE_1)
+        pred_file = join(self.tmp_dir, 'separators.txt')
+        with open(pred_file, 'w', encoding='utf-8') as pred_f:
+            for idx, (line_number, score) in enumerate(line_score):
+                pred_f.write('{}{}\t{}\n'.format(line_number, ['', '\x0b', '\x1c', '\u2028'][idx % 4], score))
+        self._assert_metrics(pred_file)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            out_of_core.evaluate(_GOLD_FILE_1, _PRED_FILE_1_NOTFULL, chunk_size=100)
+        with self.assertRaises(ValueError):
+            out_of_core.evaluate(_GOLD_FILE_1, _PRED_FILE_1_OTHER, chunk_size=100)
+
+    def test_benchmark(self):
+        with mock.patch.dict(os.environ, {'CLEF2018_CACHE_DIR': self.tmp_dir}):
+            measurements = benchmark.run_benchmark(1000, chunk_size=1000)
+            self.assertEqual([measurement['mode'] for measurement in measurements], benchmark.MODES)
+            self.assertEqual(measurements[0]['avg_precision'], measurements[1]['avg_precision'])
+            self.assertEqual(os.environ['CLEF2018_CACHE_DIR'], self.tmp_dir)
+
+            # A failed measurement raises instead of waiting for it forever.
+            with self.assertRaises(RuntimeError):
+                benchmark.run_benchmark(100, modes=('in_memory', 'unknown'))
+            self.assertEqual(os.environ['CLEF2018_CACHE_DIR'], self.tmp_dir)
+        with mock.patch.dict(os.environ):
+            os.environ.pop('CLEF2018_CACHE_DIR', None)
+            benchmark.run_benchmark(100, modes=('in_memory',))
+            self.assertNotIn('CLEF2018_CACHE_DIR', os.environ)
+
+
 class ScorerTask2(TestCase):
     def test_accuracy(self):
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 3},
-                       'false': {'true': 2, 'false': 2, 'half-true': 3},
-                       'half-true': {'true': 2, 'false': 3, 'half-true': 1}}
+        conf_matrix = np.array([[0, 2, 3],
+                                [2, 2, 3],
+                                [2, 3, 1]])
         self.assertEqual(task2._compute_accuracy(conf_matrix), 3 / 18)
 
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 3},
-                       'false': {'true': 2, 'false': 0, 'half-true': 3},
-                       'half-true': {'true': 2, 'false': 3, 'half-true': 0}}
+        conf_matrix = np.array([[0, 2, 3],
+                                [2, 0, 3],
+                                [2, 3, 0]])
         self.assertEqual(task2._compute_accuracy(conf_matrix), 0 / 15)
 
     def test_recall(self):
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 3},
-                       'false': {'true': 2, 'false': 2, 'half-true': 3},
-                       'half-true': {'true': 2, 'false': 3, 'half-true': 1}}
+        conf_matrix = np.array([[0, 2, 3],
+                                [2, 2, 3],
+                                [2, 3, 1]])
         self.assertEqual(task2._compute_macro_recall(conf_matrix), (0 + 2 / 7 + 1 / 6) / 3)
 
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 3},
-                       'false': {'true': 2, 'false': 0, 'half-true': 3},
-                       'half-true': {'true': 2, 'false': 3, 'half-true': 0}}
+        conf_matrix = np.array([[0, 2, 3],
+                                [2, 0, 3],
+                                [2, 3, 0]])
         self.assertEqual(task2._compute_macro_recall(conf_matrix), (0 + 0 / 5 + 0 / 5) / 3)
 
     def test_f1(self):
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 3},
-                       'false': {'true': 2, 'false': 2, 'half-true': 3},
-                       'half-true': {'true': 2, 'false': 3, 'half-true': 1}}
+        conf_matrix = np.array([[0, 2, 3],
+                                [2, 2, 3],
+                                [2, 3, 1]])
         p_true = 0
         r_true = 0
         p_false = 2/7
@@ -101,9 +392,9 @@ class ScorerTask2(TestCase):
         self.assertEqual(task2._compute_macro_f1(conf_matrix),
                          sum([2*p*r/(p+r) for p, r in zip([p_false, p_half_true],[r_false, r_half_true])]) / 3)
 
-        conf_matrix = {'true': {'true': 0, 'false': 1, 'half-true': 0},
-                       'false': {'true': 1, 'false': 0, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 1, 'half-true': 0}}
+        conf_matrix = np.array([[0, 1, 0],
+                                [1, 0, 0],
+                                [0, 1, 0]])
 
         self.assertEqual(task2._compute_macro_f1(conf_matrix), 0)
 
@@ -119,59 +410,434 @@ class ScorerTask2(TestCase):
         with self.assertRaises(ValueError):
           task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2_NOTFULL)
 
+    def test_check_and_read(self):
+        gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2)
+        self.assertEqual(task2._check_and_read_pred(_PRED_FILE_2, gold_labels), pred_labels)
+        self.assertEqual(task2._check_and_compute_confusion_matrix(_GOLD_FILE_2, _PRED_FILE_2).tolist(),
+                         task2._compute_confusion_matrix(gold_labels, pred_labels).tolist())
+        with self.assertRaises(ValueError):
+            task2._check_and_read_pred(_PRED_FILE_2_NOTFULL, gold_labels)
+
+    def test_score(self):
+        result = task2.score([_GOLD_FILE_2, _GOLD_FILE_2], [_PRED_FILE_2, _PRED_FILE_2_GOLD])
+        gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2)
+        conf_matrix = task2._compute_confusion_matrix(gold_labels, pred_labels)
+        self.assertEqual(result.confusion_matrices[0].tolist(), conf_matrix.tolist())
+        total = task2._add_confusion_matrices(result.confusion_matrices)
+        self.assertEqual(result.metrics.confusion_matrix.tolist(), total.tolist())
+        expected = task2._compute_metrics(total)
+        self.assertEqual({metric: getattr(result.metrics, metric) for metric in task2.MAIN_METRICS}, expected)
+
+        with self.assertRaises(ValueError):
+            task2.score([_GOLD_FILE_2, _GOLD_FILE_2], [_PRED_FILE_2])
+        with self.assertRaises(ValueError):
+            task2.score([_GOLD_FILE_2], [_PRED_FILE_2_NOTFULL])
+
     def test_conf_matrix(self):
         gold_labels = {1: 'true', 2: 'true', 3: 'half-true', 4: 'false'}
         pred_labels = {1: 'false', 2: 'true', 3:'false', 4: 'false'}
 
-        conf_matrix = {'true': {'true': 1, 'false': 1, 'half-true': 0},
-                       'false': {'true': 0, 'false': 1, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 1, 'half-true': 0}}
+        conf_matrix = np.array([[1, 1, 0],
+                                [0, 1, 0],
+                                [0, 1, 0]])
+
+        self.assertEqual(task2._compute_confusion_matrix(gold_labels, pred_labels).tolist(), conf_matrix.tolist())
+
+    def test_add_conf_matrices(self):
+        gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2)
+        conf_matrix = task2._compute_confusion_matrix(gold_labels, pred_labels)
+
+        merged_gold_labels, merged_pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2, 'file-0-')
+        for prefix, pred_file in [('file-1-', _PRED_FILE_2_GOLD), ('file-2-', _PRED_FILE_2)]:
+            gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, pred_file, prefix)
+            merged_gold_labels.update(gold_labels)
+            merged_pred_labels.update(pred_labels)
+
+        self.assertEqual(task2._add_confusion_matrices([conf_matrix, task2._compute_file_confusion_matrix(
+            _GOLD_FILE_2, _PRED_FILE_2_GOLD), conf_matrix]).tolist(),
+            task2._compute_confusion_matrix(merged_gold_labels, merged_pred_labels).tolist())
+
+    def test_merge_claims(self):
+        gold_files = [_GOLD_FILE_2, _GOLD_FILE_2, _GOLD_FILE_2]
+        pred_files = [_PRED_FILE_2, _PRED_FILE_2_GOLD, _PRED_FILE_2]
+        claims = task2._merge_claims(task2._iter_claims(gold_files, pred_files))
+
+        merged_gold_labels, merged_pred_labels = {}, {}
+        for idx, (gold_file, pred_file) in enumerate(zip(gold_files, pred_files)):
+            gold_labels, pred_labels = task2._read_gold_and_pred(gold_file, pred_file, 'file-{}-claim-number-'.format(idx))
+            merged_gold_labels.update(gold_labels)
+            merged_pred_labels.update(pred_labels)
+
+        self.assertEqual(len(claims), len(merged_gold_labels))
+        self.assertEqual(claims.dtype, task2._CLAIM_DTYPE)
+        self.assertEqual(sorted(['file-{}-claim-number-{}'.format(claim['file_idx'], claim['claim_number'])
+                                 for claim in claims]), sorted(merged_gold_labels.keys()))
+        self.assertEqual([task2._LABELS[code] for code in claims['pred'][claims['file_idx'] == 1]],
+                         [task2._LABELS[code] for code in claims['gold'][claims['file_idx'] == 1]])
+
+        conf_matrix = task2._compute_confusion_matrix(merged_gold_labels, merged_pred_labels).tolist()
+        self.assertEqual(task2._claims_confusion_matrix(claims).tolist(), conf_matrix)
+        self.assertEqual(task2._compute_stream_confusion_matrix(gold_files, pred_files).tolist(), conf_matrix)
+
+    def test_metrics_batch(self):
+        conf_matrices = np.array([[[0, 2, 3],
+                                   [2, 2, 3],
+                                   [2, 3, 1]],
+                                  [[1, 2, 0],
+                                   [1, 1, 0],
+                                   [0, 0, 1]]])
+
+        metrics = task2._compute_metrics(conf_matrices)
+        for idx, conf_matrix in enumerate(conf_matrices):
+            for metric, value in task2._compute_metrics(conf_matrix).items():
+                self.assertEqual(metrics[metric][idx], value)
 
-        self.assertEqual(task2._compute_confusion_matrix(gold_labels, pred_labels), conf_matrix)
+        with self.assertRaises(ValueError):
+            task2._compute_metrics(np.array([[1, 0, 0], [0, 1, 0], [0, 0, 0]]))
+
+    def test_approximate_randomization(self):
+        random_state = np.random.RandomState(0)
+        gold_codes = random_state.randint(0, 3, size=50)
+        pred_codes_a = np.where(random_state.rand(50) < 0.6, gold_codes, random_state.randint(0, 3, size=50))
+        pred_codes_b = random_state.randint(0, 3, size=50)
+
+        differences, p_values = task2._approximate_randomization(gold_codes, pred_codes_a, pred_codes_b, 200,
+                                                                 np.random.RandomState(1))
+
+        def metrics(pred_codes):
+            gold_labels = {idx: task2._LABELS[code] for idx, code in enumerate(gold_codes)}
+            pred_labels = {idx: task2._LABELS[code] for idx, code in enumerate(pred_codes)}
+            conf_matrix = [[0] * 3 for _ in range(3)]
+            for claim_number, pred_label in pred_labels.items():
+                conf_matrix[task2._LABEL_CODES[gold_labels[claim_number]]][task2._LABEL_CODES[pred_label]] += 1
+            return task2._compute_metrics(np.array(conf_matrix))
+
+        metrics_a, metrics_b = metrics(pred_codes_a), metrics(pred_codes_b)
+        differing = np.flatnonzero(pred_codes_a != pred_codes_b)
+        swaps = np.random.RandomState(1).randint(0, 2, size=(200, len(differing))).astype(bool)
+        num_extreme = {metric: 0 for metric in task2.MAIN_METRICS}
+        for swap in swaps:
+            permuted_a, permuted_b = pred_codes_a.copy(), pred_codes_b.copy()
+            permuted_a[differing[swap]] = pred_codes_b[differing[swap]]
+            permuted_b[differing[swap]] = pred_codes_a[differing[swap]]
+            permuted_metrics_a, permuted_metrics_b = metrics(permuted_a), metrics(permuted_b)
+            for metric in task2.MAIN_METRICS:
+                if abs(permuted_metrics_a[metric] - permuted_metrics_b[metric]) >= \
+                        abs(metrics_a[metric] - metrics_b[metric]) - 1e-12:
+                    num_extreme[metric] += 1
+
+        for metric in task2.MAIN_METRICS:
+            self.assertAlmostEqual(differences[metric], metrics_a[metric] - metrics_b[metric])
+            self.assertEqual(p_values[metric], (num_extreme[metric] + 1) / 201)
+
+    def test_compare_runs(self):
+        comparisons = task2.compare_runs([_GOLD_FILE_2], [[_PRED_FILE_2], [_PRED_FILE_2_GOLD], [_PRED_FILE_2]], 100)
+        self.assertEqual([(a, b) for a, b, _, _ in comparisons], [(0, 1), (0, 2), (1, 2)])
+        self.assertEqual(comparisons[1][2], {metric: 0.0 for metric in task2.MAIN_METRICS})
+        self.assertEqual(comparisons[1][3], {metric: 1.0 for metric in task2.MAIN_METRICS})
+        self.assertLess(comparisons[0][3]['mae'], 0.05)
 
     def test_mean_absolute_error(self):
-        conf_matrix = {'true': {'true': 1, 'false': 0, 'half-true': 0},
-                       'false': {'true': 0, 'false': 2, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 0, 'half-true': 3}}
+        conf_matrix = np.array([[1, 0, 0],
+                                [0, 2, 0],
+                                [0, 0, 3]])
         self.assertEqual(task2._compute_mean_absolute_error(conf_matrix), 0)
 
-        conf_matrix = {'true': {'true': 0, 'false': 0, 'half-true': 3},
-                       'false': {'true': 0, 'false': 0, 'half-true': 4},
-                       'half-true': {'true': 1, 'false': 2, 'half-true': 0}}
+        conf_matrix = np.array([[0, 0, 3],
+                                [0, 0, 4],
+                                [1, 2, 0]])
         self.assertEqual(task2._compute_mean_absolute_error(conf_matrix), 1)
 
-        conf_matrix = {'true': {'true': 0, 'false': 2, 'half-true': 0},
-                       'false': {'true': 1, 'false': 0, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 0, 'half-true': 0}}
+        conf_matrix = np.array([[0, 2, 0],
+                                [1, 0, 0],
+                                [0, 0, 0]])
         self.assertEqual(task2._compute_mean_absolute_error(conf_matrix), 2)
 
     def test_macro_averaged_mae(self):
-        conf_matrix = {'true': {'true': 1, 'false': 0, 'half-true': 0},
-                       'false': {'true': 0, 'false': 2, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 0, 'half-true': 3}}
+        conf_matrix = np.array([[1, 0, 0],
+                                [0, 2, 0],
+                                [0, 0, 3]])
         self.assertEqual(task2._compute_macro_averaged_mae(conf_matrix), 0)
 
-        conf_matrix = {'true': {'true': 1, 'false': 0, 'half-true': 0},
-                       'false': {'true': 0, 'false': 1, 'half-true': 0},
-                       'half-true': {'true': 1, 'false': 2, 'half-true': 1}}
+        conf_matrix = np.array([[1, 0, 0],
+                                [0, 1, 0],
+                                [1, 2, 1]])
         expected = (0 + 0 + 3/4) / 3
         self.assertEqual(task2._compute_macro_averaged_mae(conf_matrix), expected)
 
-        conf_matrix = {'true': {'true': 1, 'false': 0, 'half-true': 1},
-                       'false': {'true': 0, 'false': 1, 'half-true': 2},
-                       'half-true': {'true': 1, 'false': 0, 'half-true': 1}}
+        conf_matrix = np.array([[1, 0, 1],
+                                [0, 1, 2],
+                                [1, 0, 1]])
         expected = (1/2 + 2/3 + 1/2) / 3
         self.assertEqual(task2._compute_macro_averaged_mae(conf_matrix), expected)
 
-        conf_matrix = {'true': {'true': 1, 'false': 2, 'half-true': 0},
-                       'false': {'true': 1, 'false': 1, 'half-true': 0},
-                       'half-true': {'true': 0, 'false': 0, 'half-true': 1}}
+        conf_matrix = np.array([[1, 2, 0],
+                                [1, 1, 0],
+                                [0, 0, 1]])
         expected = (4/3 + 2/2 + 0) / 3
         self.assertEqual(task2._compute_macro_averaged_mae(conf_matrix), expected)
 
-        conf_matrix = {'true': {'true': 1, 'false': 0, 'half-true': 0},
-                       'false': {'true': 1, 'false': 1, 'half-true': 0},
-                       'half-true': {'true': 1, 'false': 0, 'half-true': 1}}
+        conf_matrix = np.array([[1, 0, 0],
+                                [1, 1, 0],
+                                [1, 0, 1]])
         expected = (0 + 2/2 + 1/2) / 3
         self.assertEqual(task2._compute_macro_averaged_mae(conf_matrix), expected)
 
+
+
+class ScorerLeaderboard(TestCase):
+    def setUp(self):
+        self.runs_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.runs_dir)
+
+    def _add_run(self, run_name, pred_file, gold_file):
+        makedirs(join(self.runs_dir, run_name))
+        shutil.copy(pred_file, join(self.runs_dir, run_name, basename(gold_file)))
+
+    def test_task1(self):
+        self._add_run('gold', _PRED_FILE_1_GOLD, _GOLD_FILE_1)
+        self._add_run('random', _PRED_FILE_1, _GOLD_FILE_1)
+        self._add_run('not_full', _PRED_FILE_1_NOTFULL, _GOLD_FILE_1)
+
+        results = leaderboard.score_runs(1, [_GOLD_FILE_1], self.runs_dir)
+        self.assertEqual(sorted(results.keys()), ['gold', 'random'])
+
+        debate = basename(_GOLD_FILE_1)
+        _, precisions, avg_precision, reciprocal_rank, num_relevant = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        self.assertEqual(results['random'][debate]['avg_precision'], avg_precision)
+        self.assertEqual(results['random'][debate]['reciprocal_rank'], reciprocal_rank)
+        self.assertEqual(results['random'][debate]['r_precision'], precisions[num_relevant - 1])
+        self.assertEqual(results['random'][debate]['precision@5'], precisions[4])
+        self.assertEqual(results['random'][leaderboard.ALL_DEBATES], results['random'][debate])
+        self.assertEqual(results['gold'][debate]['avg_precision'], 1.0)
+
+    def test_task2(self):
+        self._add_run('gold', _PRED_FILE_2_GOLD, _GOLD_FILE_2)
+        self._add_run('random', _PRED_FILE_2, _GOLD_FILE_2)
+
+        results = leaderboard.score_runs(2, [_GOLD_FILE_2], self.runs_dir)
+        debate = basename(_GOLD_FILE_2)
+        gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2)
+        expected = task2._compute_metrics(task2._compute_confusion_matrix(gold_labels, pred_labels))
+        self.assertEqual(results['random'][debate], expected)
+        self.assertEqual(results['random'][leaderboard.ALL_DEBATES], expected)
+        self.assertEqual(results['gold'][debate]['mae'], 0.0)
+
+    def test_workers(self):
+        self._add_run('gold', _PRED_FILE_2_GOLD, _GOLD_FILE_2)
+        self._add_run('random', _PRED_FILE_2, _GOLD_FILE_2)
+        self._add_run('not_full', _PRED_FILE_2_NOTFULL, _GOLD_FILE_2)
+
+        results = leaderboard.score_runs(2, [_GOLD_FILE_2], self.runs_dir)
+        self.assertEqual(sorted(results.keys()), ['gold', 'random'])
+        self.assertEqual(leaderboard.score_runs(2, [_GOLD_FILE_2], self.runs_dir, workers=2), results)
+
+    def test_threads(self):
+        self._add_run('random', _PRED_FILE_2, _GOLD_FILE_2)
+        golds = leaderboard.read_golds(2, [_GOLD_FILE_2])
+        run_dir = join(self.runs_dir, 'random')
+        expected = leaderboard.score_run(2, golds, run_dir)
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: leaderboard.score_run(2, golds, run_dir), range(8)))
+        self.assertEqual(results, [expected] * 8)
+
+    def test_write_results(self):
+        self._add_run('random', _PRED_FILE_1, _GOLD_FILE_1)
+        results = leaderboard.score_runs(1, [_GOLD_FILE_1], self.runs_dir)
+        output_fpath = join(self.runs_dir, 'results.csv')
+        leaderboard.write_results(results, output_fpath)
+        with open(output_fpath) as results_file:
+            rows = results_file.read().strip().split('\n')
+        self.assertEqual(rows[0].strip(), 'run,debate,metric,value')
+        self.assertEqual(len(rows), 1 + 2 * len(leaderboard.TASK1_METRICS))
+
+
+class ScorerService(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        golds = {1: leaderboard.read_golds(1, [_GOLD_FILE_1]), 2: leaderboard.read_golds(2, [_GOLD_FILE_2])}
+        cls.loop = asyncio.new_event_loop()
+        cls.service = service.ScoringService(golds, workers=1)
+        cls.host, cls.port = cls.loop.run_until_complete(cls.service.start(port=0))
+        cls.thread = threading.Thread(target=cls.loop.run_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.run_coroutine_threadsafe(cls.service.close(), cls.loop).result()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    def _connect(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self.addCleanup(connection.close)
+        return connection
+
+    def _request(self, method, path, pred_file=None, connection=None):
+        connection = connection or self._connect()
+        body = None
+        if pred_file is not None:
+            with open(pred_file, 'rb') as pred_f:
+                body = pred_f.read()
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_debates(self):
+        status, debates = self._request('GET', '/debates')
+        self.assertEqual(status, 200)
+        self.assertEqual(debates, {'1': [basename(_GOLD_FILE_1)], '2': [basename(_GOLD_FILE_2)]})
+
+    def test_task1(self):
+        connection = self._connect()
+        path = '/task1/' + basename(_GOLD_FILE_1)
+        # The connection is kept alive between the submissions.
+        for pred_file in [_PRED_FILE_1, _PRED_FILE_1_GOLD]:
+            status, result = self._request('POST', path, pred_file, connection)
+            self.assertEqual(status, 200)
+            self.assertEqual(result['debate'], basename(_GOLD_FILE_1))
+            expected = leaderboard.score_pred(1, task1._read_gold(_GOLD_FILE_1), pred_file)
+            self.assertEqual(result['metrics'], expected)
+
+        status, result = self._request('POST', path, _PRED_FILE_1_NOTFULL)
+        self.assertEqual(status, 400)
+        self.assertIn('missing or extra line_no', result['error'])
+        self.assertNotIn(tempfile.gettempdir(), result['error'])
+
+    def test_task2(self):
+        status, result = self._request('POST', '/task2/' + basename(_GOLD_FILE_2), _PRED_FILE_2)
+        self.assertEqual(status, 200)
+        gold_labels, pred_labels = task2._read_gold_and_pred(_GOLD_FILE_2, _PRED_FILE_2)
+        conf_matrix = task2._compute_confusion_matrix(gold_labels, pred_labels)
+        self.assertEqual(result['confusion_matrix'], conf_matrix.tolist())
+        self.assertEqual(result['metrics'], task2._compute_metrics(conf_matrix))
+
+        status, result = self._request('POST', '/task2/' + basename(_GOLD_FILE_2), _PRED_FILE_1)
+        self.assertEqual(status, 400)
+        self.assertEqual(result['error'], 'Bad format for pred file for {}. Cannot score.'.format(
+            basename(_GOLD_FILE_2)))
+        self.assertNotIn(tempfile.gettempdir(), result['error'])
+
+    def test_errors(self):
+        self.assertEqual(self._request('POST', '/task1/' + basename(_GOLD_FILE_2), _PRED_FILE_1)[0], 404)
+        self.assertEqual(self._request('POST', '/task3/' + basename(_GOLD_FILE_1), _PRED_FILE_1)[0], 404)
+        self.assertEqual(self._request('GET', '/task1/' + basename(_GOLD_FILE_1))[0], 405)
+
+
+class ScorerLogging(TestCase):
+    def test_no_handlers(self):
+        # Importing the scorers as a library should not configure the logging of the application.
+        handlers = list(logging.getLogger().handlers)
+        task1.score([_GOLD_FILE_1], [_PRED_FILE_1])
+        task2.score([_GOLD_FILE_2], [_PRED_FILE_2])
+        self.assertEqual(logging.getLogger().handlers, handlers)
+
+
+class ScorerGoldCache(TestCase):
+    def test_load_gold(self):
+        for gold_file, task in [(_GOLD_FILE_1, 1), (_GOLD_FILE_2, 2), (_GOLD_FILE_2_ARABIC, 2)]:
+            gold_cache.set_cache_dir(None)
+            parsed = gold_cache.load_gold(gold_file, task)
+            gold_cache.set_cache_dir(_cache_dir)
+            for _ in range(2):
+                # Parsed and cached at first, then loaded from the cache.
+                cached = gold_cache.load_gold(gold_file, task)
+                self.assertEqual(sorted(cached), sorted(parsed))
+                for column in parsed:
+                    self.assertEqual(list(cached[column]), list(parsed[column]))
+
+        gold = gold_cache.load_gold(_GOLD_FILE_2, 2, ['claim_number', 'normalized_claim'])
+        self.assertEqual(sorted(gold), ['claim_number', 'normalized_claim'])
+        self.assertEqual(gold['claim_number'][0], -1)
+        self.assertEqual(gold['normalized_claim'][0], '-')
+
+    def test_changed_file(self):
+        fd, gold_file = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('1\tA\tSome text.\t0\n2\tB\tOther "text".\t1\n')
+            self.assertEqual(task1._read_gold(gold_file), {1: 0, 2: 1})
+            with open(gold_file, 'w') as f:
+                f.write('1\tA\tSome text.\t1\n2\tB\tOther "text".\t1\n')
+            self.assertEqual(task1._read_gold(gold_file), {1: 1, 2: 1})
+            self.assertEqual(gold_cache.load_gold(gold_file, 1, ['text'])['text'], ['Some text.', 'Other "text".'])
+
+            with open(gold_file, 'w') as f:
+                f.write('1\tA\tSome text.\n')
+            self.assertRaises(ValueError, gold_cache.load_gold, gold_file, 1)
+        finally:
+            os.remove(gold_file)
+
+
+def _get_results(key, num_gets):
+    return [result_cache.get(key) for _ in range(num_gets)]
+
+
+class ScorerResultCache(TestCase):
+    def setUp(self):
+        self._store_dir = tempfile.mkdtemp()
+        result_cache.set_store(join(self._store_dir, 'results.sqlite'))
+
+    def tearDown(self):
+        result_cache.set_store(None)
+        shutil.rmtree(self._store_dir)
+
+    def test_task1(self):
+        results = task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1)
+        # A hit does not read the files.
+        with mock.patch.object(task1, '_evaluate_files', side_effect=AssertionError):
+            self.assertEqual(task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1), results)
+        self.assertNotEqual(task1.evaluate(_GOLD_FILE_1, _PRED_FILE_1, [1, 2]), results)
+
+        metrics = task1._check_and_evaluate(_GOLD_FILE_1, _PRED_FILE_1, bootstrap_resamples=10)
+        with mock.patch.object(task1, '_check_and_evaluate_files', side_effect=AssertionError):
+            cached = task1._check_and_evaluate(_GOLD_FILE_1, _PRED_FILE_1, bootstrap_resamples=10)
+        self.assertEqual(sorted(cached), sorted(metrics))
+        self.assertEqual(cached['precision_at'], metrics['precision_at'])
+        self.assertEqual(cached['bootstrap'].tolist(), metrics['bootstrap'].tolist())
+        self.assertEqual([values.tolist() for values in cached['pr_curve']],
+                         [values.tolist() for values in metrics['pr_curve']])
+        self.assertEqual(result_cache.num_entries(), 3)
+
+    def test_task2(self):
+        conf_matrix = task2._check_and_compute_confusion_matrix(_GOLD_FILE_2, _PRED_FILE_2)
+        with mock.patch.object(task2, '_check_and_compute_file_confusion_matrix', side_effect=AssertionError):
+            self.assertEqual(task2._check_and_compute_confusion_matrix(_GOLD_FILE_2, _PRED_FILE_2).tolist(),
+                             conf_matrix.tolist())
+
+    def test_changed_file(self):
+        pred_file = join(self._store_dir, 'pred.txt')
+        shutil.copy(_PRED_FILE_1_GOLD, pred_file)
+        self.assertEqual(task1.evaluate(_GOLD_FILE_1, pred_file)[2], 1.0)
+        shutil.copy(_PRED_FILE_1, pred_file)
+        self.assertEqual(task1.evaluate(_GOLD_FILE_1, pred_file), task1._evaluate_files(_GOLD_FILE_1, pred_file))
+
+    def test_score(self):
+        # With a single worker the store of this process is used as it is, not set again.
+        with mock.patch.object(result_cache, 'set_store', side_effect=AssertionError('The store was set.')):
+            task1.score([_GOLD_FILE_1], [_PRED_FILE_1])
+            task2.score([_GOLD_FILE_2], [_PRED_FILE_2])
+        self.assertEqual(result_cache.num_entries(), 2)
+        # The worker processes set the store of this process.
+        task1.score([_GOLD_FILE_1, _GOLD_FILE_1], [_PRED_FILE_1, _PRED_FILE_1_GOLD], workers=2)
+        self.assertEqual(result_cache.num_entries(), 3)
+
+    def test_processes(self):
+        # The processes read and touch the same result at once, waiting for the locks of each other.
+        result_cache.put('a', [1, 2])
+        results = pool_map(_get_results, ['a'] * 8, [200] * 8, workers=4, initializer=result_cache.set_store,
+                           initargs=result_cache.get_store())
+        self.assertEqual(results, [[[1, 2]] * 200] * 8)
+
+    def test_lru_eviction(self):
+        result_cache.set_store(join(self._store_dir, 'results.sqlite'), max_entries=2)
+        result_cache.put('a', 1)
+        result_cache.put('b', 2)
+        self.assertEqual(result_cache.get('a'), 1)
+        result_cache.put('c', 3)
+        self.assertEqual(result_cache.num_entries(), 2)
+        self.assertIsNone(result_cache.get('b'))
+        self.assertEqual([result_cache.get('a'), result_cache.get('c')], [1, 3])
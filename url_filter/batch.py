@@ -0,0 +1,298 @@
+# Concurrent batch filtering of URLs for the CLEF-2018 Fact Checking Lab (Python 3.7+)
+#
+# The URLs, which are not decided by the matchers, are expanded concurrently with asyncio:
+# the number of requests is bounded globally and per host, the connections to each host are kept alive and reused,
+# every request has a timeout and is retried on network errors and on temporary HTTP errors,
+# and the redirects are followed (with HEAD requests) up to a maximal depth.
+
+import asyncio
+import socket
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+try:
+	from url_filter import url_filter
+except ImportError:
+	import url_filter
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_PER_HOST = 4
+# Seconds for a single request, from connecting to reading the response headers
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 2
+# The same limit as the redirect handler of urllib
+DEFAULT_MAX_REDIRECTS = 10
+# Seconds before the first retry, doubled for each next one
+DEFAULT_BACKOFF = 0.5
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Temporary errors, which are retried
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Servers, which do not support HEAD requests, are asked with GET
+_HEAD_NOT_ALLOWED_STATUSES = (405, 501)
+_MAX_HEADERS = 100
+
+class ExpansionError(Exception):
+	pass
+
+# Idle keep-alive connections per (scheme, host, port)
+class _ConnectionPool:
+	def __init__(self):
+		self._idle = {}
+		self._sslContext = None
+		self.numOpened = 0
+
+	async def acquire(self, key):
+		idle = self._idle.get(key)
+		while idle:
+			reader, writer = idle.pop()
+			if not writer.is_closing() and not reader.at_eof():
+				return reader, writer, True
+			writer.close()
+
+		scheme, host, port = key
+		sslContext = None
+		if scheme == 'https':
+			if self._sslContext is None:
+				self._sslContext = ssl.create_default_context()
+			sslContext = self._sslContext
+		reader, writer = await asyncio.open_connection(host, port, ssl=sslContext,
+			server_hostname=host if sslContext else None)
+		self.numOpened += 1
+		return reader, writer, False
+
+	def release(self, key, reader, writer):
+		self._idle.setdefault(key, []).append((reader, writer))
+
+	def close(self):
+		for connections in self._idle.values():
+			for reader, writer in connections:
+				writer.close()
+		self._idle.clear()
+
+def _request_key(url):
+	parts = urlsplit(url)
+	scheme = parts.scheme.lower()
+	if scheme not in ('http', 'https') or not parts.hostname:
+		raise ExpansionError('Cannot expand URL "' + url + '": unsupported URL')
+	port = parts.port or (443 if scheme == 'https' else 80)
+	return (scheme, parts.hostname, port), parts
+
+async def _read_response_head(reader):
+	statusLine = await reader.readline()
+	if not statusLine:
+		raise ConnectionResetError('The connection was closed by the server')
+	try:
+		version, status, reason = (statusLine.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+		status = int(status)
+	except ValueError:
+		raise ExpansionError('Malformed response: ' + repr(statusLine))
+
+	headers = {'set-cookie': []}
+	for _ in range(_MAX_HEADERS):
+		line = (await reader.readline()).decode('latin-1').strip()
+		if not line:
+			break
+		name, _, value = line.partition(':')
+		name = name.strip().lower()
+		if name == 'set-cookie':
+			headers[name].append(value.strip())
+		else:
+			headers[name] = value.strip()
+	else:
+		raise ExpansionError('Too many response headers')
+	return version, status, reason, headers
+
+class _Expander:
+	def __init__(self, concurrency, perHost, timeout, retries, maxRedirects, backoff):
+		self.pool = _ConnectionPool()
+		self.perHost = perHost
+		self.timeout = timeout
+		self.retries = retries
+		self.maxRedirects = maxRedirects
+		self.backoff = backoff
+		self._semaphore = asyncio.Semaphore(concurrency)
+		self._hostSemaphores = {}
+
+	def close(self):
+		self.pool.close()
+
+	# Sends a single request, reusing an idle connection to the host if there is one
+	# Returns (status, reason, headers) of the response
+	async def _request(self, url, method, cookies):
+		key, parts = _request_key(url)
+		target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+		lines = [method + ' ' + target + ' HTTP/1.1', 'Host: ' + parts.netloc.rpartition('@')[2],
+			'User-Agent: ' + url_filter._USER_AGENT, 'Accept: */*', 'Connection: keep-alive']
+		if cookies:
+			lines.append('Cookie: ' + '; '.join([name + '=' + value for name, value in cookies.items()]))
+		request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+		while True:
+			reader, writer, reused = await self.pool.acquire(key)
+			try:
+				writer.write(request)
+				await writer.drain()
+				version, status, reason, headers = await _read_response_head(reader)
+			except (ConnectionError, asyncio.IncompleteReadError, ExpansionError):
+				writer.close()
+				# The server may have closed an idle connection in the meantime
+				if reused:
+					continue
+				raise
+			except BaseException:
+				writer.close()
+				raise
+			break
+
+		keepAlive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+		# The body of a GET response is not read, so the connection cannot be reused
+		if method == 'HEAD' and keepAlive:
+			self.pool.release(key, reader, writer)
+		else:
+			writer.close()
+		return status, reason, headers
+
+	# Sends a request with the limits, the timeout and the retries
+	async def _request_with_retries(self, url, method, cookies):
+		host = urlsplit(url).hostname or ''
+		if host not in self._hostSemaphores:
+			self._hostSemaphores[host] = asyncio.Semaphore(self.perHost)
+		hostSemaphore = self._hostSemaphores[host]
+
+		for attempt in range(self.retries + 1):
+			try:
+				# A request waiting for its host does not hold a global slot, so a busy host does not starve the others
+				async with hostSemaphore:
+					async with self._semaphore:
+						status, reason, headers = await asyncio.wait_for(self._request(url, method, cookies),
+							self.timeout)
+				if status not in _RETRY_STATUSES or attempt == self.retries:
+					return status, reason, headers
+			except socket.gaierror as e:
+				raise ExpansionError('Cannot resolve host "' + host + '": ' + str(e))
+			except asyncio.TimeoutError:
+				if attempt == self.retries:
+					raise ExpansionError('Timed out after ' + str(self.timeout) + ' seconds')
+			except OSError as e:
+				if attempt == self.retries:
+					raise ExpansionError(str(e))
+			await asyncio.sleep(self.backoff * 2 ** attempt)
+
+	# Follows the redirects of a URL and returns the final URL
+	async def expand(self, url):
+		cookies = {}
+		for _ in range(self.maxRedirects + 1):
+			status, reason, headers = await self._request_with_retries(url, 'HEAD', cookies)
+			if status in _HEAD_NOT_ALLOWED_STATUSES:
+				status, reason, headers = await self._request_with_retries(url, 'GET', cookies)
+			# The cookies are kept for the hops of a single redirect chain, as some redirectors require them
+			for cookie in headers['set-cookie']:
+				name, _, value = cookie.split(';', 1)[0].partition('=')
+				cookies[name.strip()] = value.strip()
+
+			location = headers.get('location')
+			if status in _REDIRECT_STATUSES and location:
+				url = urljoin(url, location)
+				continue
+			if status >= 400:
+				raise ExpansionError('HTTP Error ' + str(status) + ': ' + reason)
+			return url
+		raise ExpansionError('Too many redirects (more than ' + str(self.maxRedirects) + ')')
+
+def _error_message(error):
+	return str(error) or error.__class__.__name__
+
+# Expands a URL, storing the expansion or its error to the cache if given
+async def _expand(expander, url, cache):
+	start = time.perf_counter()
+	try:
+		expandedUrl = await expander.expand(url)
+	except asyncio.CancelledError:
+		raise
+	except Exception as e:
+		if cache is not None:
+			cache.put(url, error = _error_message(e))
+		if url_filter._metrics is not None:
+			url_filter._metrics.observe_expansion(url_filter._get_host(url), 'error', time.perf_counter() - start)
+		raise
+	if cache is not None:
+		cache.put(url, expandedUrl)
+	if url_filter._metrics is not None:
+		url_filter._metrics.observe_expansion(url_filter._get_host(url), 'ok', time.perf_counter() - start)
+	return expandedUrl
+
+async def _complete(expansion, result, task):
+	try:
+		expandedUrl = await expansion
+	except Exception as e:
+		result['error'] = _error_message(e)
+		_count_decision(task, 'failed')
+		return
+	url_filter._set_expanded_url(result, expandedUrl, task == 1)
+	_count_decision(task, 'expanded')
+
+def _count_decision(task, outcome):
+	if url_filter._metrics is not None:
+		url_filter._metrics.count_decision(task, outcome)
+
+# Decides whether each URL is BAD for task 1 or 2, expanding the undecided URLs concurrently
+# Returns a list with the result dict of url_filter.classify_url for each URL, in the order of the input
+# With offlineFirst only the URLs of shortenerHosts (url_filter.SHORTENER_HOSTS by default) are expanded
+# The expansions are looked up in and stored to the cache, an expansion_cache.ExpansionCache, if given
+async def filter_urls_async(urls, task = 1, offlineFirst = False, shortenerHosts = None, cache = None,
+		concurrency = DEFAULT_CONCURRENCY, perHost = DEFAULT_PER_HOST, timeout = DEFAULT_TIMEOUT,
+		retries = DEFAULT_RETRIES, maxRedirects = DEFAULT_MAX_REDIRECTS, backoff = DEFAULT_BACKOFF):
+	allMatchers = task == 1
+	expander = _Expander(concurrency, perHost, timeout, retries, maxRedirects, backoff)
+	# Repeated URLs are expanded only once
+	expansions = {}
+	# The input is read while the expansions run, but at most a few URLs per request wait for their turn
+	maxPending = 4 * concurrency
+	pending = set()
+	results = []
+	try:
+		for url in urls:
+			result, needsExpansion = url_filter._classify_offline(url, allMatchers, not offlineFirst, shortenerHosts)
+			result['url'] = url
+			results.append(result)
+			if not needsExpansion:
+				_count_decision(task, 'table' if result['bad'] else 'offline')
+				continue
+
+			if url not in expansions:
+				entry = None if cache is None else cache.get(url)
+				if entry is not None:
+					url_filter._set_cached_expansion(result, entry, allMatchers)
+					_count_decision(task, 'cached')
+					continue
+				expansions[url] = asyncio.ensure_future(_expand(expander, url, cache))
+			pending.add(asyncio.ensure_future(_complete(expansions[url], result, task)))
+			if len(pending) >= maxPending:
+				pending = (await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))[1]
+		if pending:
+			await asyncio.wait(pending)
+	finally:
+		for future in list(pending) + list(expansions.values()):
+			future.cancel()
+		expander.close()
+	return results
+
+def filter_urls(urls, task = 1, **options):
+	return asyncio.run(filter_urls_async(urls, task, **options))
+
+if __name__ == '__main__':
+	import sys
+	cache = None
+	if '--cache' in sys.argv[1:]:
+		from url_filter.expansion_cache import ExpansionCache
+		cache = ExpansionCache()
+	if '--metrics' in sys.argv[1:]:
+		from url_filter.metrics import Metrics
+		url_filter.set_metrics(Metrics())
+	for result in filter_urls([line.strip() for line in sys.stdin if line.strip()],
+			offlineFirst='--offline-first' in sys.argv[1:], cache=cache):
+		print(('BAD' if result['bad'] else 'OK ') + ' ' + result['url'] + ('' if result['error'] is None else ' (' + result['error'] + ')'))
+	if url_filter._metrics is not None:
+		print(url_filter._metrics.to_json(), file=sys.stderr)
@@ -0,0 +1,173 @@
+# Persistent cache of URL expansions for the CLEF-2018 Fact Checking Lab
+#
+# The expanded URL of each shortened URL is stored in an SQLite file on the local disk, so that the same URLs are
+# not expanded again across queries and runs. The BAD/OK decisions are not stored: the matchers are run on the
+# expanded URL at each lookup, so that changed matchers apply to the cached expansions too.
+# The entries expire after a time to live, and the least recently used entries are evicted above a maximal number.
+# Failed expansions are cached too, with a shorter time to live, so that unreachable hosts are not asked again
+# and again, but are tried again soon.
+# The file can be shared by concurrent processes, each transaction holds the write lock of the database.
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_PATH = os.path.join(os.environ.get('CLEF2018_CACHE_DIR',
+	os.path.join(os.path.expanduser('~'), '.cache', 'clef2018-factchecking')), 'url-expansions.sqlite')
+DEFAULT_MAX_ENTRIES = 1000000
+# Seconds until an expansion expires: 30 days, and 1 hour for failures
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 3600
+# Seconds to wait for the lock held by another process
+_LOCK_TIMEOUT = 60
+# The uses of the entries are ordered by a counter, rather than by time, which may not be precise enough
+_NEXT_USE = 'SELECT COALESCE(MAX(last_used), 0) + 1 FROM expansions'
+# The outcomes of the lookups, counted in the stats
+OUTCOMES = ['hits', 'negativeHits', 'misses', 'expired']
+# Changing the stored expansions requires a new version, the entries of older versions are dropped
+_SCHEMA_VERSION = 2
+
+_SCHEMA = [
+	'CREATE TABLE IF NOT EXISTS expansions (url TEXT PRIMARY KEY, expanded_url TEXT, error TEXT, '
+		'expires REAL NOT NULL, last_used INTEGER NOT NULL)',
+	'CREATE INDEX IF NOT EXISTS expansions_last_used ON expansions (last_used)',
+	'CREATE INDEX IF NOT EXISTS expansions_expires ON expansions (expires)',
+	'CREATE TABLE IF NOT EXISTS stats (outcome TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+	# The number of entries, kept up to date, as counting them takes a scan of the table
+	'CREATE TABLE IF NOT EXISTS size (entries INTEGER NOT NULL)',
+]
+
+class ExpansionCache(object):
+	# path: the SQLite file, which is created if missing (DEFAULT_PATH by default)
+	# maxEntries: the maximal number of stored expansions
+	# ttl, negativeTtl: seconds until a successful and a failed expansion expire
+	def __init__(self, path = None, maxEntries = DEFAULT_MAX_ENTRIES, ttl = DEFAULT_TTL,
+			negativeTtl = DEFAULT_NEGATIVE_TTL):
+		self.path = DEFAULT_PATH if path is None else path
+		self.maxEntries = maxEntries
+		self.ttl = ttl
+		self.negativeTtl = negativeTtl
+		# The outcomes of the lookups of this instance, the totals of all processes are stored in the file
+		self.counts = dict([(outcome, 0) for outcome in OUTCOMES])
+		self._clock = time.time
+		self._lock = threading.Lock()
+		self._connection = None
+		self._pid = None
+
+		directory = os.path.dirname(os.path.abspath(self.path))
+		if not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				if not os.path.isdir(directory):
+					raise
+		with self._transaction() as connection:
+			if connection.execute('PRAGMA user_version').fetchone()[0] != _SCHEMA_VERSION:
+				connection.execute('DROP TABLE IF EXISTS expansions')
+				connection.execute('DROP TABLE IF EXISTS size')
+				connection.execute('PRAGMA user_version = ' + str(_SCHEMA_VERSION))
+			for statement in _SCHEMA:
+				connection.execute(statement)
+			if connection.execute('SELECT COUNT(*) FROM size').fetchone()[0] == 0:
+				connection.execute('INSERT INTO size (entries) SELECT COUNT(*) FROM expansions')
+		# Readers do not wait for the writer with a write-ahead log
+		self._connect().execute('PRAGMA journal_mode=WAL')
+
+	# A connection is opened for each process, as a connection cannot be used after a fork
+	def _connect(self):
+		if self._connection is None or self._pid != os.getpid():
+			self._connection = sqlite3.connect(self.path, timeout=_LOCK_TIMEOUT, isolation_level=None,
+				check_same_thread=False)
+			self._pid = os.getpid()
+		return self._connection
+
+	# Runs a transaction, which takes the write lock right away, as each lookup writes too
+	@contextmanager
+	def _transaction(self):
+		with self._lock:
+			connection = self._connect()
+			connection.execute('BEGIN IMMEDIATE')
+			try:
+				yield connection
+			except:
+				connection.execute('ROLLBACK')
+				raise
+			connection.execute('COMMIT')
+
+	# Returns the cached expansion of a URL as a dict with the keys 'expandedUrl' and 'error',
+	# None if the URL is not cached or if its entry expired
+	def get(self, urlString):
+		with self._transaction() as connection:
+			row = connection.execute('SELECT expanded_url, error, expires FROM expansions WHERE url = ?',
+				(urlString,)).fetchone()
+			entry = None
+			if row is None:
+				outcome = 'misses'
+			elif row[2] <= self._clock():
+				outcome = 'expired'
+				connection.execute('DELETE FROM expansions WHERE url = ?', (urlString,))
+				_add_entries(connection, -1)
+			else:
+				outcome = 'hits' if row[1] is None else 'negativeHits'
+				connection.execute('UPDATE expansions SET last_used = (' + _NEXT_USE + ') WHERE url = ?', (urlString,))
+				entry = {'expandedUrl': row[0], 'error': row[1]}
+			connection.execute('INSERT OR IGNORE INTO stats (outcome, count) VALUES (?, 0)', (outcome,))
+			connection.execute('UPDATE stats SET count = count + 1 WHERE outcome = ?', (outcome,))
+		self.counts[outcome] += 1
+		return entry
+
+	# Stores the expanded URL of a URL, or the error of a failed expansion
+	# Evicts the expired entries and the least recently used ones above maxEntries, both found with an index,
+	# so that a put does not take longer with more entries
+	def put(self, urlString, expandedUrl = None, error = None):
+		now = self._clock()
+		if error is None:
+			expires = now + self.ttl
+		else:
+			expandedUrl = None
+			expires = now + self.negativeTtl
+		with self._transaction() as connection:
+			isNew = connection.execute('SELECT 1 FROM expansions WHERE url = ?', (urlString,)).fetchone() is None
+			connection.execute('INSERT OR REPLACE INTO expansions (url, expanded_url, error, expires, last_used) '
+				'VALUES (?, ?, ?, ?, (' + _NEXT_USE + '))', (urlString, expandedUrl, error, expires))
+			expired = connection.execute('DELETE FROM expansions WHERE expires <= ?', (now,)).rowcount
+			entries = _add_entries(connection, int(isNew) - expired)
+			if entries > self.maxEntries:
+				evicted = connection.execute('DELETE FROM expansions WHERE url IN '
+					'(SELECT url FROM expansions ORDER BY last_used LIMIT ?)', (entries - self.maxEntries,)).rowcount
+				_add_entries(connection, -evicted)
+
+	def __len__(self):
+		with self._transaction() as connection:
+			return connection.execute('SELECT entries FROM size').fetchone()[0]
+
+	def clear(self):
+		with self._transaction() as connection:
+			connection.execute('DELETE FROM expansions')
+			connection.execute('DELETE FROM stats')
+			connection.execute('UPDATE size SET entries = 0')
+
+	def close(self):
+		if self._connection is not None and self._pid == os.getpid():
+			self._connection.close()
+		self._connection = None
+
+	# Returns the lookup counts of each outcome, with the 'lookups' and the 'hitRate' (of both kinds of hits)
+	# With allProcesses the totals of all processes using the file, otherwise those of this instance
+	def stats(self, allProcesses = False):
+		counts = dict(self.counts)
+		if allProcesses:
+			with self._transaction() as connection:
+				counts.update(dict([(outcome, 0) for outcome in OUTCOMES]))
+				counts.update(connection.execute('SELECT outcome, count FROM stats').fetchall())
+		counts['lookups'] = sum([counts[outcome] for outcome in OUTCOMES])
+		counts['hitRate'] = float(counts['hits'] + counts['negativeHits']) / counts['lookups'] if counts['lookups'] else 0.0
+		counts['entries'] = len(self)
+		return counts
+
+# Adds amount to the number of entries, returns the new number
+def _add_entries(connection, amount):
+	connection.execute('UPDATE size SET entries = entries + ?', (amount,))
+	return connection.execute('SELECT entries FROM size').fetchone()[0]
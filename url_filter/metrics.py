@@ -0,0 +1,152 @@
+# Metrics of the URL filter for the CLEF-2018 Fact Checking Lab
+#
+# Counts the decisions of each task by how they were made, and records the latency of the URL expansions in
+# histograms per host and per outcome, so that the time spent on the network and the slow hosts can be seen.
+# The metrics are collected once set with url_filter.set_metrics, by classify_url (and the functions using it),
+# by batch.filter_urls and by stream.filter_stream. Without metrics the URL filter only checks that none are set.
+# They are exported as a JSON serializable dict or in the Prometheus text format.
+
+import json
+import threading
+
+# How a decision was made:
+#   'table': BAD by the matchers, 'offline': OK without expanding the URL,
+#   'cached': from the expansion cache, 'expanded': from the expanded URL, 'failed': the expansion failed
+DECISION_OUTCOMES = ['table', 'offline', 'cached', 'expanded', 'failed']
+# The outcomes of the expansions
+EXPANSION_OUTCOMES = ['ok', 'error']
+# Upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# The expansions of further hosts are recorded under OTHER_HOSTS, so that the number of histograms is bounded
+DEFAULT_MAX_HOSTS = 1000
+OTHER_HOSTS = 'other'
+
+class Metrics(object):
+	def __init__(self, buckets = None, maxHosts = DEFAULT_MAX_HOSTS):
+		self.buckets = sorted(DEFAULT_BUCKETS if buckets is None else buckets)
+		self.maxHosts = maxHosts
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			# The decisions are counted without a lock, each thread in its own {(task, outcome): count} dict
+			self._local = threading.local()
+			self._threadDecisions = []
+			# {(host, outcome): [count of each bucket (not cumulative) and of +Inf, number, sum of the seconds]}
+			self.latencies = {}
+			self._hosts = set()
+
+	def count_decision(self, task, outcome, amount = 1):
+		try:
+			decisions = self._local.decisions
+		except AttributeError:
+			decisions = self._local.decisions = {}
+			with self._lock:
+				self._threadDecisions.append(decisions)
+		key = (task, outcome)
+		decisions[key] = decisions.get(key, 0) + amount
+
+	# Returns the {(task, outcome): count} dict of the decisions of all threads
+	def decisions(self):
+		with self._lock:
+			threadDecisions = [dict(decisions) for decisions in self._threadDecisions]
+		total = {}
+		for decisions in threadDecisions:
+			for key, count in decisions.items():
+				total[key] = total.get(key, 0) + count
+		return total
+
+	def observe_expansion(self, host, outcome, seconds):
+		with self._lock:
+			if host not in self._hosts:
+				if len(self._hosts) >= self.maxHosts:
+					host = OTHER_HOSTS
+				else:
+					self._hosts.add(host)
+			key = (host, outcome)
+			histogram = self.latencies.get(key)
+			if histogram is None:
+				histogram = self.latencies[key] = [0] * (len(self.buckets) + 3)
+			bucket = 0
+			while bucket < len(self.buckets) and seconds > self.buckets[bucket]:
+				bucket += 1
+			histogram[bucket] += 1
+			histogram[-2] += 1
+			histogram[-1] += seconds
+
+	# Adds the metrics of another instance with the same buckets, e.g. of a worker process
+	def merge(self, other):
+		for (task, outcome), count in other.decisions().items():
+			self.count_decision(task, outcome, count)
+		with self._lock:
+			for key, otherHistogram in other.latencies.items():
+				histogram = self.latencies.setdefault(key, [0] * len(otherHistogram))
+				for idx, value in enumerate(otherHistogram):
+					histogram[idx] += value
+				self._hosts.add(key[0])
+
+	def _summarize(self, histograms):
+		cumulative = [0] * (len(self.buckets) + 1)
+		count = 0
+		total = 0.0
+		for histogram in histograms:
+			running = 0
+			for idx in range(len(cumulative)):
+				running += histogram[idx]
+				cumulative[idx] += running
+			count += histogram[-2]
+			total += histogram[-1]
+		bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+		return {'count': count, 'sum': total, 'buckets': dict(zip(bounds, cumulative))}
+
+	# Returns the metrics as a JSON serializable dict:
+	#   'decisions': {task: {outcome: count}}
+	#   'expansions': {'byHost': {host: histogram}, 'byOutcome': {outcome: histogram}}, where a histogram is
+	#   a dict with the number ('count') and the total seconds ('sum') of the expansions and the cumulative
+	#   counts of the 'buckets', by their upper bounds
+	def to_dict(self):
+		decisions = self.decisions()
+		with self._lock:
+			latencies = dict([(key, list(histogram)) for key, histogram in self.latencies.items()])
+		result = {'decisions': {}, 'expansions': {'byHost': {}, 'byOutcome': {}}}
+		for (task, outcome), count in sorted(decisions.items()):
+			result['decisions'].setdefault(str(task), dict([(name, 0) for name in DECISION_OUTCOMES]))[outcome] = count
+		for field, position in [('byHost', 0), ('byOutcome', 1)]:
+			for name in sorted(set([key[position] for key in latencies])):
+				result['expansions'][field][name] = self._summarize(
+					[histogram for key, histogram in latencies.items() if key[position] == name])
+		return result
+
+	def to_json(self):
+		return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+	# Returns the metrics in the Prometheus text exposition format
+	def to_prometheus(self):
+		decisions = self.decisions()
+		with self._lock:
+			latencies = dict([(key, list(histogram)) for key, histogram in self.latencies.items()])
+		lines = [
+			'# HELP url_filter_decisions_total Decisions of the URL filter by task and by how they were made.',
+			'# TYPE url_filter_decisions_total counter',
+		]
+		for (task, outcome), count in sorted(decisions.items()):
+			lines.append('url_filter_decisions_total' + _labels([('task', task), ('outcome', outcome)]) + ' ' + str(count))
+		lines += [
+			'# HELP url_filter_expansion_seconds Latency of the URL expansions by host and outcome.',
+			'# TYPE url_filter_expansion_seconds histogram',
+		]
+		for (host, outcome), histogram in sorted(latencies.items()):
+			labels = [('host', host), ('outcome', outcome)]
+			cumulative = 0
+			for bound, count in zip([repr(float(bound)) for bound in self.buckets] + ['+Inf'], histogram):
+				cumulative += count
+				lines.append('url_filter_expansion_seconds_bucket' + _labels(labels + [('le', bound)]) + ' ' +
+					str(cumulative))
+			lines.append('url_filter_expansion_seconds_sum' + _labels(labels) + ' ' + repr(float(histogram[-1])))
+			lines.append('url_filter_expansion_seconds_count' + _labels(labels) + ' ' + str(histogram[-2]))
+		return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+	return '{' + ','.join([name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+		for name, value in labels]) + '}'
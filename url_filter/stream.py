@@ -0,0 +1,215 @@
+# Streaming URL filter for the CLEF-2018 Fact Checking Lab, for large inputs such as crawl logs
+#
+# The URLs are read from a text file (one URL per line) or from a JSONL file (one JSON object per line, with the URL
+# in a field), and the decisions of both tasks are written in one pass without the network.
+# The items of MATCHERS_ALL and MATCHERS_SIMPLE are compiled together into a single automaton, so each URL is
+# checked once for both tasks. A URL is split into tokens at the characters, which no item contains (e.g. "/", "?",
+# "&", "="), so that every item is found within a single token: the host, the segments of the path and the query.
+# Each distinct token is scanned with the automaton only once, the index of the tokens holds the items found in it,
+# and the items of a URL, from which the applicable rows follow, are those of its tokens.
+# The decisions equal those of the matchers of url_filter.py.
+# With several workers the input is split into chunks of lines, which are decided in worker processes;
+# the compiled tables are module globals, so forked workers share them with the main process.
+
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import re
+import sys
+
+try:
+	from url_filter import url_filter
+except ImportError:
+	import url_filter
+
+INPUT_FORMATS = ['text', 'jsonl']
+DEFAULT_URL_FIELD = 'url'
+# Lines in a chunk sent to a worker process
+DEFAULT_CHUNK_LINES = 20000
+# The index of the tokens is emptied when it has more tokens
+_MAX_TOKENS = 500000
+
+# The matchers of both tasks are compiled together, as they are checked together
+_ITEM_IDS = url_filter._item_ids(url_filter.MATCHERS_ALL + url_filter.MATCHERS_SIMPLE)
+_TRANSITIONS, _OUTPUTS = url_filter._compile_matchers(url_filter.MATCHERS_ALL + url_filter.MATCHERS_SIMPLE)[:2]
+_MASKS_TASK1 = url_filter._row_masks(url_filter.MATCHERS_ALL, _ITEM_IDS)
+_MASKS_TASK2 = url_filter._row_masks(url_filter.MATCHERS_SIMPLE, _ITEM_IDS)
+
+# Delimiters of the URL parts, without the characters of the items, which must not be split
+_ITEM_CHARS = set(''.join(_ITEM_IDS))
+_SEPARATORS = re.compile('[' + re.escape(''.join([char for char in '/?#&=:;,@!$\'()*~' if char not in _ITEM_CHARS]))
+	+ ']+')
+
+# {token: bitmask of the items found in it}
+_tokens = {}
+
+def _is_bad(found, masks):
+	singleMask, rowMasks = masks
+	if found & singleMask:
+		return True
+	for rowMask in rowMasks:
+		if found & rowMask == rowMask:
+			return True
+	return False
+
+def _index_token(token):
+	transitions = _TRANSITIONS
+	outputs = _OUTPUTS
+	state = 0
+	found = 0
+	for char in token:
+		state = transitions[state].get(char, 0)
+		found |= outputs[state]
+	if len(_tokens) >= _MAX_TOKENS:
+		_tokens.clear()
+	_tokens[token] = found
+	return found
+
+# Returns (BAD for task 1, BAD for task 2) of a URL, without the network
+def check_url(urlString):
+	tokens = _tokens
+	found = 0
+	for token in _SEPARATORS.split(urlString.lower()):
+		tokenFound = tokens.get(token)
+		if tokenFound is None:
+			tokenFound = _index_token(token)
+		found |= tokenFound
+	if not found:
+		return False, False
+	return _is_bad(found, _MASKS_TASK1), _is_bad(found, _MASKS_TASK2)
+
+def _label(bad):
+	return 'BAD' if bad else 'OK'
+
+# Decides the URL of each line, returns the output lines
+# A text line gives "<task 1 label>\t<task 2 label>\t<URL>" (BAD or OK), empty lines are skipped
+# A JSONL line gives the object with the added boolean fields 'badTask1' and 'badTask2'; an object without
+# a string URL in urlField is not BAD, with the added field 'error', and so is a line, which is not valid JSON,
+# given as the object {'line': <the line>}
+# The decisions are counted in the metrics of url_filter, if set, once all lines are decided
+def filter_lines(lines, inputFormat = 'text', urlField = DEFAULT_URL_FIELD):
+	if inputFormat not in INPUT_FORMATS:
+		raise ValueError('Unknown input format "' + inputFormat + '", use one of: ' + ', '.join(INPUT_FORMATS))
+	counts = [0, 0, 0]
+	for line in _filter_lines(lines, inputFormat, urlField, counts):
+		yield line
+	_count_decisions(counts)
+
+# Decides the lines, adding the number of URLs and of the BAD ones for task 1 and task 2 to counts
+def _filter_lines(lines, inputFormat, urlField, counts):
+	numUrls = numBadTask1 = numBadTask2 = 0
+	for line in lines:
+		line = line.strip()
+		if not line:
+			continue
+		if inputFormat == 'text':
+			badTask1, badTask2 = check_url(line)
+			numUrls += 1
+			numBadTask1 += badTask1
+			numBadTask2 += badTask2
+			yield _label(badTask1) + '\t' + _label(badTask2) + '\t' + line + '\n'
+			continue
+
+		try:
+			record = json.loads(line)
+		except ValueError as e:
+			# A malformed line does not stop the stream, it is written back with the error
+			yield json.dumps({'line': line, 'badTask1': False, 'badTask2': False, 'error': 'Invalid JSON: ' + str(e)}) + '\n'
+			continue
+		urlString = record.get(urlField) if isinstance(record, dict) else None
+		if isinstance(urlString, str):
+			badTask1, badTask2 = check_url(urlString)
+			record['badTask1'], record['badTask2'] = badTask1, badTask2
+			numUrls += 1
+			numBadTask1 += badTask1
+			numBadTask2 += badTask2
+		else:
+			if not isinstance(record, dict):
+				record = {'record': record}
+			record['badTask1'] = record['badTask2'] = False
+			record['error'] = 'No URL in the field "' + urlField + '".'
+		yield json.dumps(record) + '\n'
+	counts[0] += numUrls
+	counts[1] += numBadTask1
+	counts[2] += numBadTask2
+
+def _count_decisions(counts):
+	metrics = url_filter._metrics
+	if metrics is not None and counts[0]:
+		numUrls, numBadTask1, numBadTask2 = counts
+		metrics.count_decision(1, 'table', numBadTask1)
+		metrics.count_decision(1, 'offline', numUrls - numBadTask1)
+		metrics.count_decision(2, 'table', numBadTask2)
+		metrics.count_decision(2, 'offline', numUrls - numBadTask2)
+
+def _filter_chunk(args):
+	lines, inputFormat, urlField = args
+	counts = [0, 0, 0]
+	return ''.join(_filter_lines(lines, inputFormat, urlField, counts)), counts
+
+def _chunks(lines, chunkLines):
+	lines = iter(lines)
+	while True:
+		chunk = list(itertools.islice(lines, chunkLines))
+		if not chunk:
+			return
+		yield chunk
+
+# Decides the URLs of the input lines and writes the output lines of filter_lines to outputFile, in the same order
+# With several workers the chunks of chunkLines lines are decided in as many worker processes
+def filter_stream(inputFile, outputFile, inputFormat = 'text', urlField = DEFAULT_URL_FIELD, workers = 1,
+		chunkLines = DEFAULT_CHUNK_LINES):
+	if inputFormat not in INPUT_FORMATS:
+		raise ValueError('Unknown input format "' + inputFormat + '", use one of: ' + ', '.join(INPUT_FORMATS))
+	tasks = ((chunk, inputFormat, urlField) for chunk in _chunks(inputFile, chunkLines))
+	if workers <= 1:
+		for task in tasks:
+			output, counts = _filter_chunk(task)
+			outputFile.write(output)
+			_count_decisions(counts)
+		return
+
+	pool = multiprocessing.Pool(workers)
+	try:
+		# The decisions of the workers are counted in the metrics of this process
+		for output, counts in pool.imap(_filter_chunk, tasks):
+			outputFile.write(output)
+			_count_decisions(counts)
+	finally:
+		pool.terminate()
+		pool.join()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Decides whether the URLs are BAD for task 1 and task 2.')
+	parser.add_argument('input', nargs='?', default='-', help='File with the URLs, stdin by default.')
+	parser.add_argument('--format', choices=INPUT_FORMATS, default='text',
+		help='One URL per line, or one JSON object per line with the URL in the --url-field.')
+	parser.add_argument('--url-field', default=DEFAULT_URL_FIELD, help='Field of the URL in the JSON objects.')
+	parser.add_argument('--output', default='-', help='File for the decisions, stdout by default.')
+	parser.add_argument('--workers', type=int, default=1, help='Number of worker processes.')
+	parser.add_argument('--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES,
+		help='Number of lines sent to a worker process at once.')
+	parser.add_argument('--metrics', help='File for the metrics of the decisions.')
+	parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+		help='Format of the metrics file.')
+	args = parser.parse_args()
+
+	if args.metrics:
+		try:
+			from url_filter.metrics import Metrics
+		except ImportError:
+			from metrics import Metrics
+		url_filter.set_metrics(Metrics())
+
+	inputFile = io.open(sys.stdin.fileno() if args.input == '-' else args.input, encoding='utf-8', errors='replace',
+		closefd=args.input != '-')
+	outputFile = io.open(sys.stdout.fileno() if args.output == '-' else args.output, 'w', encoding='utf-8',
+		closefd=args.output != '-')
+	with inputFile, outputFile:
+		filter_stream(inputFile, outputFile, args.format, args.url_field, args.workers, args.chunk_lines)
+	if args.metrics:
+		with io.open(args.metrics, 'w', encoding='utf-8') as metricsFile:
+			metrics = url_filter.get_metrics()
+			metricsFile.write(metrics.to_json() + '\n' if args.metrics_format == 'json' else metrics.to_prometheus())
@@ -0,0 +1,610 @@
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from url_filter import batch, stream, url_filter
+from url_filter.expansion_cache import ExpansionCache
+from url_filter.metrics import Metrics
+
+
+class _RedirectHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def setup(self):
+		super().setup()
+		with self.server.lock:
+			self.server.connections += 1
+
+	def do_HEAD(self):
+		self._respond(False)
+
+	def do_GET(self):
+		self._respond(True)
+
+	def _respond(self, withBody):
+		server = self.server
+		with server.lock:
+			server.requests.append(self.path)
+			server.inFlight += 1
+			server.maxInFlight = max(server.maxInFlight, server.inFlight)
+		try:
+			self._route(withBody)
+		finally:
+			with server.lock:
+				server.inFlight -= 1
+
+	def _route(self, withBody):
+		path = self.path
+		if path.startswith('/hops/'):
+			# /hops/<n> redirects n times before landing on a fact-checking page
+			hops = int(path.split('/')[2])
+			self._send(301, '/hops/' + str(hops - 1) if hops else '/snopes/story')
+		elif path == '/loop':
+			self._send(302, '/loop')
+		elif path == '/relative':
+			self._send(307, 'hops/0')
+		elif path.startswith('/delay/'):
+			time.sleep(float(path.split('/')[2]))
+			self._send(200)
+		elif path.startswith('/flaky/'):
+			# /flaky/<n>/<key> fails n times with 503
+			_, _, failures, key = path.split('/')
+			with self.server.lock:
+				attempts = self.server.attempts.get(key, 0)
+				self.server.attempts[key] = attempts + 1
+			self._send(503 if attempts < int(failures) else 200)
+		elif path == '/cookie':
+			self._send(302, '/cookie/check', 'session=abc; Path=/')
+		elif path == '/cookie/check':
+			self._send(302 if self.headers.get('Cookie') == 'session=abc' else 403, '/snopes/cookie')
+		elif path == '/get-only':
+			self._send(405 if self.command == 'HEAD' else 302, '/factcheck', withBody=withBody)
+		elif path == '/missing':
+			self._send(404)
+		else:
+			self._send(200, withBody=withBody)
+
+	def _send(self, status, location = None, cookie = None, withBody = False):
+		self.send_response(status)
+		if location is not None:
+			self.send_header('Location', location)
+		if cookie is not None:
+			self.send_header('Set-Cookie', cookie)
+		body = b'ok' if withBody else b''
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		if body:
+			self.wfile.write(body)
+
+
+# The check of the matchers before they were compiled
+def _check_rows(urlString, matchers):
+	urlLower = urlString.lower()
+	return any([all([item in urlLower for item in row]) for row in matchers])
+
+class UrlFilterMatchers(unittest.TestCase):
+	def _random_url(self, rng, items):
+		parts = []
+		for _ in range(rng.randint(0, 6)):
+			kind = rng.random()
+			if kind < 0.4:
+				part = rng.choice(items)
+			elif kind < 0.7:
+				# A prefix or a suffix of an item, which should not match by itself
+				item = rng.choice(items)
+				cut = rng.randint(1, len(item))
+				part = item[:cut] if rng.random() < 0.5 else item[cut:]
+			else:
+				part = ''.join([rng.choice('abcdefhkmnoprstuwy.-/?=&%') for _ in range(rng.randint(1, 8))])
+			if rng.random() < 0.2:
+				part = part.upper()
+			parts.append(part)
+		return rng.choice(['', 'http://', 'https://www.']) + rng.choice(['', '/', '.', '-']).join(parts)
+
+	def test_check_matchers(self):
+		rng = random.Random(0)
+		for matchers, allMatchers in [(url_filter.MATCHERS_ALL, True), (url_filter.MATCHERS_SIMPLE, False)]:
+			items = list(url_filter._item_ids(url_filter.MATCHERS_ALL + url_filter.MATCHERS_SIMPLE))
+			numBad = 0
+			for _ in range(20000):
+				urlString = self._random_url(rng, items)
+				bad = url_filter._check_matchers(urlString, allMatchers)
+				self.assertEqual(bad, _check_rows(urlString, matchers), urlString)
+				numBad += bad
+			# Both outcomes are generated
+			self.assertTrue(1000 < numBad < 19000, numBad)
+		for urlString in url_filter.EXAMPLES:
+			self.assertEqual(url_filter._check_matchers(urlString, True), _check_rows(urlString, url_filter.MATCHERS_ALL))
+			self.assertEqual(url_filter._check_matchers(urlString, False),
+				_check_rows(urlString, url_filter.MATCHERS_SIMPLE))
+
+	def test_overlapping_items(self):
+		# Items, which are contained in or overlap each other, are all found in a single pass
+		matchers = [['abcd'], ['bc', 'xyz'], ['cde', 'yz'], ['d', 'zz'], ['xy', 'abc', 'q']]
+		compiled = url_filter._compile_matchers(matchers)
+		rng = random.Random(1)
+		with mock.patch.object(url_filter, '_COMPILED_ALL', compiled):
+			for _ in range(20000):
+				urlString = ''.join([rng.choice('abcdexyzq') for _ in range(rng.randint(0, 12))])
+				self.assertEqual(url_filter._check_matchers(urlString), _check_rows(urlString, matchers), urlString)
+			self.assertTrue(url_filter._check_matchers('xABCDy'))
+			self.assertTrue(url_filter._check_matchers('cdexyzz'))
+			self.assertFalse(url_filter._check_matchers('abcxbc'))
+
+
+class UrlFilterOffline(unittest.TestCase):
+	def setUp(self):
+		# No test touches the network, the expansions are mocked
+		patcher = mock.patch.object(url_filter, '_expand_url', side_effect=AssertionError('The network was used.'))
+		self.expandUrl = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_is_shortener(self):
+		for urlString in ['http://bit.ly/2IA2znR', 'https://www.bit.ly/x', 'https://a.b.bit.ly/x', 'BIT.LY/2IA2znR',
+				'bit.ly/2IA2znR', 'bit.ly', 'http://user@t.co:80/x', 'https://on.wsj.com/abc']:
+			self.assertTrue(url_filter._is_shortener(urlString), urlString)
+		for urlString in ['https://notbit.ly/x', 'https://bit.ly.example.com/x', 'https://example.com/bit.ly/x',
+				'wsj.com/abc', '', 'http://[::1/']:
+			self.assertFalse(url_filter._is_shortener(urlString), urlString)
+
+		self.assertTrue(url_filter._is_shortener('https://links.example.org/x', ['example.org']))
+		self.assertTrue(url_filter._is_shortener('example.org/x', ['example.org']))
+		self.assertFalse(url_filter._is_shortener('https://bit.ly/x', ['example.org']))
+		self.assertFalse(url_filter._is_shortener('https://bit.ly/x', []))
+
+	def test_offline(self):
+		for classify in [url_filter.classify_url_task1, url_filter.classify_url_task2]:
+			self.assertEqual(classify('https://en.wikipedia.org/wiki/Donald_Trump'),
+				{'bad': False, 'usedNetwork': False, 'expandedUrl': None, 'error': None, 'cached': False})
+			self.assertEqual(classify('https://www.factcheck.org/2018/'),
+				{'bad': True, 'usedNetwork': False, 'expandedUrl': None, 'error': None, 'cached': False})
+			# A shortener, which is not among the custom hosts, is not expanded
+			self.assertFalse(classify('http://bit.ly/2IA2znR', shortenerHosts = ['example.org'])['usedNetwork'])
+		self.assertTrue(url_filter.classify_url_task1('https://twitter.com/snopes')['bad'])
+		self.assertFalse(url_filter.classify_url_task2('https://twitter.com/snopes')['bad'])
+		self.assertEqual(url_filter.classify_url_task1(None)['error'], 'The provided parameter is not a string.')
+		self.assertFalse(url_filter.is_url_bad_task1('https://en.wikipedia.org/wiki/Donald_Trump', offlineFirst = True))
+		self.assertEqual(self.expandUrl.call_count, 0)
+
+	def test_shortener(self):
+		self.expandUrl.side_effect = None
+		self.expandUrl.return_value = 'https://www.factcheck.org/2018/'
+		for urlString in ['http://bit.ly/2IA2znR', 'bit.ly/2IA2znR', 'https://go.example.org/1']:
+			result = url_filter.classify_url_task2(urlString, shortenerHosts = ['bit.ly', 'example.org'])
+			self.assertEqual(result, {'bad': True, 'usedNetwork': True,
+				'expandedUrl': 'https://www.factcheck.org/2018/', 'error': None, 'cached': False})
+		self.assertEqual([call[0][0] for call in self.expandUrl.call_args_list],
+			['http://bit.ly/2IA2znR', 'bit.ly/2IA2znR', 'https://go.example.org/1'])
+
+		self.expandUrl.side_effect = IOError('Timed out')
+		result = url_filter.classify_url_task1('https://t.co/x')
+		self.assertEqual((result['bad'], result['usedNetwork'], result['error']), (False, True, 'Timed out'))
+
+	def test_expand_all(self):
+		# Without offlineFirst every URL, which does not match the matchers, is expanded, as before
+		self.expandUrl.side_effect = None
+		self.expandUrl.return_value = 'https://www.snopes.com/fact-check/'
+		with mock.patch('sys.stdout', new_callable=io.StringIO):
+			self.assertTrue(url_filter.is_url_bad_task1('https://example.org/redirect'))
+			self.assertFalse(url_filter.is_url_bad_task2('https://example.org/redirect'))
+			self.assertTrue(url_filter.is_url_bad_task2('https://www.factcheck.org/'))
+		self.assertEqual(self.expandUrl.call_count, 2)
+		result = url_filter.classify_url('https://example.org/redirect', expandAll = True)
+		self.assertEqual((result['bad'], result['usedNetwork']), (True, True))
+		self.assertFalse(url_filter.is_url_bad_task1('https://example.org/redirect', offlineFirst = True))
+		self.assertEqual(self.expandUrl.call_count, 3)
+
+
+class UrlFilterBatch(unittest.TestCase):
+	def setUp(self):
+		self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RedirectHandler)
+		self.server.daemon_threads = True
+		self.server.lock = threading.Lock()
+		self.server.requests = []
+		self.server.attempts = {}
+		self.server.connections = 0
+		self.server.inFlight = 0
+		self.server.maxInFlight = 0
+		thread = threading.Thread(target=self.server.serve_forever)
+		thread.start()
+		self.addCleanup(thread.join)
+		self.addCleanup(self.server.server_close)
+		self.addCleanup(self.server.shutdown)
+		self.base = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+	def _filter(self, paths, task = 1, **options):
+		options.setdefault('backoff', 0.01)
+		return batch.filter_urls([self.base + path for path in paths], task, **options)
+
+	def test_redirects(self):
+		results = self._filter(['/hops/3', '/relative', '/plain'])
+		self.assertEqual([result['url'] for result in results],
+			[self.base + path for path in ['/hops/3', '/relative', '/plain']])
+		self.assertEqual([result['expandedUrl'] for result in results],
+			[self.base + '/snopes/story', self.base + '/snopes/story', self.base + '/plain'])
+		self.assertEqual([result['bad'] for result in results], [True, True, False])
+		self.assertTrue(all([result['usedNetwork'] and result['error'] is None for result in results]))
+
+	def test_tasks(self):
+		self.assertFalse(self._filter(['/hops/1'], task=2)[0]['bad'])
+		self.assertTrue(self._filter(['/get-only'], task=2)[0]['bad'])
+
+	def test_max_redirects(self):
+		self.assertTrue(self._filter(['/hops/2'], maxRedirects=3)[0]['bad'])
+		result = self._filter(['/hops/5'], maxRedirects=3)[0]
+		self.assertFalse(result['bad'])
+		self.assertIn('Too many redirects', result['error'])
+		self.assertIn('Too many redirects', self._filter(['/loop'])[0]['error'])
+
+	def test_timeout(self):
+		start = time.perf_counter()
+		result = self._filter(['/delay/2'], timeout=0.2, retries=1)[0]
+		self.assertLess(time.perf_counter() - start, 1.5)
+		self.assertIn('Timed out', result['error'])
+		self.assertIsNone(self._filter(['/delay/0.1'], timeout=1)[0]['error'])
+
+	def test_retries(self):
+		result = self._filter(['/flaky/2/a'], retries=2)[0]
+		self.assertIsNone(result['error'])
+		self.assertEqual(result['expandedUrl'], self.base + '/flaky/2/a')
+		self.assertEqual(self.server.attempts['a'], 3)
+
+		result = self._filter(['/flaky/5/b'], retries=1)[0]
+		self.assertEqual(result['error'], 'HTTP Error 503: Service Unavailable')
+		self.assertEqual(self.server.attempts['b'], 2)
+
+	def test_errors(self):
+		results = self._filter(['/missing', '/cookie'])
+		self.assertEqual(results[0]['error'], 'HTTP Error 404: Not Found')
+		self.assertIsNone(results[1]['error'])
+		self.assertTrue(results[1]['bad'])
+		self.assertIsNotNone(batch.filter_urls(['http://127.0.0.1:1/'], retries=0)[0]['error'])
+
+	def test_concurrency(self):
+		paths = ['/delay/0.05/{}'.format(idx) for idx in range(20)]
+		results = self._filter(paths, perHost=3)
+		self.assertTrue(all([result['error'] is None for result in results]))
+		self.assertLessEqual(self.server.maxInFlight, 3)
+		self.assertGreater(self.server.maxInFlight, 1)
+		# The connections are kept alive and reused by the following requests
+		self.assertLessEqual(self.server.connections, 3)
+
+		self.server.maxInFlight = 0
+		self._filter(paths, perHost=10, concurrency=2)
+		self.assertLessEqual(self.server.maxInFlight, 2)
+
+	def test_busy_host(self):
+		# The requests, which wait for a saturated host, leave the global slots to the other hosts
+		paths = ['/delay/0.2/{}'.format(idx) for idx in range(5)]
+		otherUrl = self.base.replace('127.0.0.1', 'localhost') + '/plain'
+		results = batch.filter_urls([self.base + path for path in paths] + [otherUrl], perHost=1, concurrency=2,
+			backoff=0.01)
+		self.assertTrue(all([result['error'] is None for result in results]))
+		self.assertLessEqual(self.server.maxInFlight, 2)
+		self.assertLessEqual(self.server.requests.index('/plain'), 1)
+
+	def test_duplicates(self):
+		results = self._filter(['/hops/1'] * 5)
+		self.assertEqual(len(results), 5)
+		self.assertTrue(all([result['bad'] for result in results]))
+		self.assertEqual(self.server.requests, ['/hops/1', '/hops/0', '/snopes/story'])
+
+	def test_offline_first(self):
+		results = self._filter(['/hops/1', '/snopes'], offlineFirst=True)
+		self.assertEqual([result['bad'] for result in results], [False, True])
+		self.assertFalse(any([result['usedNetwork'] for result in results]))
+		self.assertEqual(self.server.requests, [])
+
+		result = self._filter(['/hops/1'], offlineFirst=True, shortenerHosts=['127.0.0.1'])[0]
+		self.assertTrue(result['usedNetwork'])
+		self.assertTrue(result['bad'])
+
+	def test_lazy_input(self):
+		def urls():
+			for idx in range(50):
+				yield self.base + '/plain?' + str(idx)
+		results = batch.filter_urls(urls(), concurrency=2)
+		self.assertEqual([result['url'] for result in results], list(urls()))
+
+	def test_cache(self):
+		cache = ExpansionCache(os.path.join(tempfile.mkdtemp(), 'cache.sqlite'))
+		self.addCleanup(shutil.rmtree, os.path.dirname(cache.path))
+		self.addCleanup(cache.close)
+		paths = ['/hops/1', '/missing', '/plain']
+		first = self._filter(paths, cache=cache)
+		numRequests = len(self.server.requests)
+
+		second = self._filter(paths, task=2, cache=cache)
+		self.assertEqual(len(self.server.requests), numRequests)
+		self.assertTrue(all([result['cached'] and not result['usedNetwork'] for result in second]))
+		self.assertEqual([result['expandedUrl'] for result in second], [result['expandedUrl'] for result in first])
+		self.assertEqual([result['error'] for result in second], [None, 'HTTP Error 404: Not Found', None])
+		self.assertEqual([result['bad'] for result in first], [True, False, False])
+		self.assertEqual([result['bad'] for result in second], [False, False, False])
+		self.assertEqual(cache.stats()['hits'], 2)
+		self.assertEqual(cache.stats()['negativeHits'], 1)
+
+	def test_metrics(self):
+		metrics = Metrics()
+		url_filter.set_metrics(metrics)
+		self.addCleanup(url_filter.set_metrics, None)
+		cache = ExpansionCache(os.path.join(tempfile.mkdtemp(), 'cache.sqlite'))
+		self.addCleanup(shutil.rmtree, os.path.dirname(cache.path))
+		self.addCleanup(cache.close)
+		paths = ['/hops/1', '/missing', '/plain', '/snopes', '/hops/1']
+		self._filter(paths, cache=cache)
+		self._filter(paths, task=2, cache=cache)
+		self.assertEqual(metrics.to_dict()['decisions'], {
+			'1': {'table': 1, 'offline': 0, 'cached': 0, 'expanded': 3, 'failed': 1},
+			'2': {'table': 0, 'offline': 0, 'cached': 4, 'expanded': 1, 'failed': 0}})
+		expansions = metrics.to_dict()['expansions']
+		self.assertEqual(sorted(expansions['byHost']), ['127.0.0.1'])
+		self.assertEqual(expansions['byHost']['127.0.0.1']['count'], 4)
+		self.assertEqual(expansions['byOutcome']['ok']['count'], 3)
+		self.assertEqual(expansions['byOutcome']['error']['count'], 1)
+		self.assertEqual(expansions['byOutcome']['ok']['buckets']['+Inf'], 3)
+
+
+class UrlFilterMetrics(unittest.TestCase):
+	def test_histograms(self):
+		metrics = Metrics(buckets = [0.1, 1.0], maxHosts = 2)
+		for host, outcome, seconds in [('bit.ly', 'ok', 0.05), ('bit.ly', 'ok', 0.5), ('t.co', 'error', 2.0),
+				('goo.gl', 'ok', 0.1)]:
+			metrics.observe_expansion(host, outcome, seconds)
+		result = metrics.to_dict()['expansions']
+		self.assertEqual(sorted(result['byHost']), ['bit.ly', 'other', 't.co'])
+		self.assertEqual(result['byHost']['bit.ly'], {'count': 2, 'sum': 0.55, 'buckets': {'0.1': 1, '1.0': 2, '+Inf': 2}})
+		self.assertEqual(result['byOutcome']['ok']['buckets'], {'0.1': 2, '1.0': 3, '+Inf': 3})
+		self.assertEqual(result['byOutcome']['error']['buckets'], {'0.1': 0, '1.0': 0, '+Inf': 1})
+
+		other = Metrics(buckets = [0.1, 1.0])
+		other.observe_expansion('bit.ly', 'ok', 0.01)
+		other.count_decision(1, 'expanded')
+		metrics.merge(other)
+		self.assertEqual(metrics.to_dict()['expansions']['byHost']['bit.ly']['count'], 3)
+		self.assertEqual(metrics.to_dict()['decisions']['1']['expanded'], 1)
+		json.loads(metrics.to_json())
+
+	def test_prometheus(self):
+		metrics = Metrics(buckets = [0.5])
+		metrics.count_decision(1, 'table', 3)
+		metrics.observe_expansion('bit.ly', 'ok', 0.25)
+		metrics.observe_expansion('a"b', 'error', 1.0)
+		self.assertEqual(metrics.to_prometheus().splitlines()[2:], [
+			'url_filter_decisions_total{task="1",outcome="table"} 3',
+			'# HELP url_filter_expansion_seconds Latency of the URL expansions by host and outcome.',
+			'# TYPE url_filter_expansion_seconds histogram',
+			'url_filter_expansion_seconds_bucket{host="a\\"b",outcome="error",le="0.5"} 0',
+			'url_filter_expansion_seconds_bucket{host="a\\"b",outcome="error",le="+Inf"} 1',
+			'url_filter_expansion_seconds_sum{host="a\\"b",outcome="error"} 1.0',
+			'url_filter_expansion_seconds_count{host="a\\"b",outcome="error"} 1',
+			'url_filter_expansion_seconds_bucket{host="bit.ly",outcome="ok",le="0.5"} 1',
+			'url_filter_expansion_seconds_bucket{host="bit.ly",outcome="ok",le="+Inf"} 1',
+			'url_filter_expansion_seconds_sum{host="bit.ly",outcome="ok"} 0.25',
+			'url_filter_expansion_seconds_count{host="bit.ly",outcome="ok"} 1',
+		])
+
+	def test_decisions(self):
+		metrics = Metrics()
+		url_filter.set_metrics(metrics)
+		self.addCleanup(url_filter.set_metrics, None)
+		# The shortened examples are decided offline too
+		for urlString in url_filter.EXAMPLES:
+			url_filter.classify_url_task1(urlString, shortenerHosts = [])
+		lines = [urlString + '\n' for urlString in url_filter.EXAMPLES * 3]
+		stream.filter_stream(io.StringIO(''.join(lines)), io.StringIO(), workers=2, chunkLines=4)
+		self.assertEqual(metrics.to_dict(), {
+			'decisions': {'1': {'table': 4 * 5, 'offline': 4 * 5, 'cached': 0, 'expanded': 0, 'failed': 0},
+				'2': {'table': 2 * 3, 'offline': 8 * 3, 'cached': 0, 'expanded': 0, 'failed': 0}},
+			'expansions': {'byHost': {}, 'byOutcome': {}}})
+
+
+def _put_urls(path, start):
+	cache = ExpansionCache(path)
+	for idx in range(start, start + 50):
+		cache.put('http://bit.ly/' + str(idx), 'https://www.snopes.com/' + str(idx))
+		cache.get('http://bit.ly/' + str(idx - 1))
+
+
+class UrlFilterExpansionCache(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.dir)
+		self.path = os.path.join(self.dir, 'cache', 'expansions.sqlite')
+
+	def _cache(self, **options):
+		cache = ExpansionCache(self.path, **options)
+		self.addCleanup(cache.close)
+		return cache
+
+	def test_get_put(self):
+		cache = self._cache()
+		self.assertIsNone(cache.get('http://bit.ly/1'))
+		cache.put('http://bit.ly/1', 'https://www.washingtonpost.com/news/fact-checker/')
+		self.assertEqual(cache.get('http://bit.ly/1'), {'expandedUrl': 'https://www.washingtonpost.com/news/fact-checker/',
+			'error': None})
+		cache.put('http://bit.ly/2', error = 'HTTP Error 404: Not Found')
+		self.assertEqual(cache.get('http://bit.ly/2'), {'expandedUrl': None, 'error': 'HTTP Error 404: Not Found'})
+		# Persisted across instances
+		self.assertEqual(self._cache().get('http://bit.ly/1')['expandedUrl'],
+			'https://www.washingtonpost.com/news/fact-checker/')
+
+	def test_ttl(self):
+		cache = self._cache(ttl = 100, negativeTtl = 10)
+		now = [1000.0]
+		cache._clock = lambda: now[0]
+		cache.put('http://bit.ly/ok', 'https://example.org/')
+		cache.put('http://bit.ly/failed', error = 'Timed out')
+		now[0] += 20
+		self.assertIsNotNone(cache.get('http://bit.ly/ok'))
+		self.assertIsNone(cache.get('http://bit.ly/failed'))
+		now[0] += 100
+		self.assertIsNone(cache.get('http://bit.ly/ok'))
+		self.assertEqual(len(cache), 0)
+		self.assertEqual(cache.counts, {'hits': 1, 'negativeHits': 0, 'misses': 0, 'expired': 2})
+
+	def test_lru(self):
+		cache = self._cache(maxEntries = 3)
+		for idx in range(3):
+			cache.put('http://bit.ly/' + str(idx), 'https://example.org/' + str(idx))
+		cache.get('http://bit.ly/0')
+		cache.put('http://bit.ly/3', 'https://example.org/3')
+		self.assertEqual(len(cache), 3)
+		self.assertIsNone(cache.get('http://bit.ly/1'))
+		self.assertIsNotNone(cache.get('http://bit.ly/0'))
+		self.assertIsNotNone(cache.get('http://bit.ly/3'))
+
+	def test_size_bound(self):
+		cache = self._cache(maxEntries = 50)
+		for idx in range(120):
+			cache.put('http://bit.ly/' + str(idx), 'https://example.org/' + str(idx))
+		# Storing an entry again does not change the size
+		cache.put('http://bit.ly/119', 'https://example.org/119')
+		self.assertEqual(len(cache), 50)
+		self.assertEqual(cache._connect().execute('SELECT COUNT(*) FROM expansions').fetchone()[0], 50)
+		self.assertIsNone(cache.get('http://bit.ly/69'))
+		self.assertIsNotNone(cache.get('http://bit.ly/70'))
+
+		# The work of a put, in steps of the SQLite virtual machine, does not grow with the number of entries
+		def putSteps(cache, urlString):
+			steps = [0]
+			def count():
+				steps[0] += 1
+			cache._connect().set_progress_handler(count, 1)
+			cache.put(urlString, 'https://example.org/')
+			cache._connect().set_progress_handler(None, 1)
+			return steps[0]
+		small = self._cache(maxEntries = 10)
+		large = ExpansionCache(os.path.join(self.dir, 'large.sqlite'), maxEntries = 2000)
+		self.addCleanup(large.close)
+		for filled in [small, large]:
+			for idx in range(filled.maxEntries + 1):
+				filled.put('http://bit.ly/' + str(idx), 'https://example.org/' + str(idx))
+		self.assertLess(putSteps(large, 'http://bit.ly/new'), 2 * putSteps(small, 'http://bit.ly/new'))
+
+	def test_stats(self):
+		cache = self._cache()
+		cache.put('http://bit.ly/1', 'https://example.org/')
+		cache.get('http://bit.ly/1')
+		cache.get('http://bit.ly/2')
+		stats = cache.stats()
+		self.assertEqual((stats['hits'], stats['misses'], stats['lookups'], stats['entries']), (1, 1, 2, 1))
+		self.assertAlmostEqual(stats['hitRate'], 0.5)
+
+		other = self._cache()
+		other.get('http://bit.ly/1')
+		self.assertEqual(other.stats()['lookups'], 1)
+		self.assertEqual(other.stats(allProcesses = True)['lookups'], 3)
+		self.assertAlmostEqual(other.stats(allProcesses = True)['hitRate'], 2.0 / 3)
+
+	def test_processes(self):
+		cache = self._cache()
+		context = multiprocessing.get_context('spawn')
+		processes = [context.Process(target=_put_urls, args=(self.path, start)) for start in range(0, 200, 50)]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join()
+		self.assertEqual([process.exitcode for process in processes], [0] * 4)
+		self.assertEqual(len(cache), 200)
+		self.assertEqual(cache.stats(allProcesses = True)['lookups'], 200)
+		self.assertEqual(cache.get('http://bit.ly/123')['expandedUrl'], 'https://www.snopes.com/123')
+
+	def test_classify_url(self):
+		cache = self._cache()
+		cache.put('http://bit.ly/2IA2znR', 'https://www.factcheck.org/2018/')
+		result = url_filter.classify_url_task2('http://bit.ly/2IA2znR', cache = cache)
+		self.assertEqual(result, {'bad': True, 'usedNetwork': False, 'expandedUrl': 'https://www.factcheck.org/2018/',
+			'error': None, 'cached': True})
+		self.assertTrue(url_filter.is_url_bad_task1('http://bit.ly/2IA2znR', True, cache))
+
+		# The decisions follow the current matchers, not those at the time of the expansion
+		with mock.patch.object(url_filter, '_COMPILED_SIMPLE', url_filter._compile_matchers([['snopes.com']])):
+			self.assertFalse(url_filter.classify_url_task2('http://bit.ly/2IA2znR', cache = cache)['bad'])
+		cache.put('http://bit.ly/failed', error = 'Timed out')
+		self.assertFalse(url_filter.classify_url_task1('http://bit.ly/failed', cache = cache)['bad'])
+
+	def test_schema_version(self):
+		# The entries of an older version of the cache are dropped, not misread
+		os.makedirs(os.path.dirname(self.path))
+		connection = sqlite3.connect(self.path)
+		connection.execute('CREATE TABLE expansions (url TEXT PRIMARY KEY, expanded_url TEXT, error TEXT, '
+			'bad_task1 INTEGER NOT NULL, bad_task2 INTEGER NOT NULL, expires REAL NOT NULL, '
+			'last_used INTEGER NOT NULL)')
+		connection.execute('INSERT INTO expansions VALUES (?, ?, NULL, 1, 1, 1e12, 1)',
+			('http://bit.ly/1', 'https://example.org/'))
+		connection.commit()
+		connection.close()
+		cache = self._cache()
+		self.assertEqual(len(cache), 0)
+		self.assertIsNone(cache.get('http://bit.ly/1'))
+		cache.put('http://bit.ly/1', 'https://example.org/')
+		self.assertEqual(len(self._cache()), 1)
+
+
+class UrlFilterStream(unittest.TestCase):
+	URLS = url_filter.EXAMPLES + [
+		'HTTPS://WWW.SNOPES.COM/', 'https://twitter.com/politifact', 'apnews.com/fact-check/x',
+		'https://apnews.com/?q=not-real-news', 'https://example.org/path/factcheck.org?x=1', 'https://example.org/fact/check',
+		'https://www.nytimes.com/2018/fact-check.html', 'https://www.nytimes.com/2018/fact/check.html', 'bit.ly/2IA2znR',
+		'https://example.org/a&factcheck=1', 'https://example.org/fact%20check', '', '/', 'a:b@c:d?#',
+	]
+
+	def test_check_url(self):
+		for urlString in self.URLS:
+			self.assertEqual(stream.check_url(urlString),
+				(url_filter._check_matchers(urlString, True), url_filter._check_matchers(urlString, False)), urlString)
+
+	def test_filter_lines(self):
+		lines = list(stream.filter_lines(['https://www.factcheck.org/2018/\n', '\n', 'https://twitter.com/snopes\n']))
+		self.assertEqual(lines, ['BAD\tBAD\thttps://www.factcheck.org/2018/\n', 'BAD\tOK\thttps://twitter.com/snopes\n'])
+
+		records = [{'url': 'https://en.wikipedia.org/wiki/Donald_Trump', 'id': 1}, {'link': 'https://www.snopes.com/'}, 2]
+		lines = stream.filter_lines([json.dumps(record) for record in records], 'jsonl', 'link')
+		self.assertEqual([json.loads(line) for line in lines], [
+			{'url': 'https://en.wikipedia.org/wiki/Donald_Trump', 'id': 1, 'badTask1': False, 'badTask2': False,
+				'error': 'No URL in the field "link".'},
+			{'link': 'https://www.snopes.com/', 'badTask1': True, 'badTask2': False},
+			{'record': 2, 'badTask1': False, 'badTask2': False, 'error': 'No URL in the field "link".'}])
+		with self.assertRaises(ValueError):
+			list(stream.filter_lines(['x'], 'csv'))
+
+	def test_malformed_jsonl(self):
+		lines = ['{"url": "https://www.snopes.com/"}\n', '{"url": "https://www.factcheck.org/\n',
+			'{"url": "https://cnn.com/"}\n']
+		output = io.StringIO()
+		stream.filter_stream(io.StringIO(''.join(lines)), output, 'jsonl', workers=2, chunkLines=1)
+		records = [json.loads(line) for line in output.getvalue().splitlines()]
+		self.assertEqual([(record['badTask1'], record['badTask2']) for record in records],
+			[(True, False), (False, False), (False, False)])
+		self.assertEqual(records[1]['line'], '{"url": "https://www.factcheck.org/')
+		self.assertTrue(records[1]['error'].startswith('Invalid JSON: '))
+		self.assertNotIn('error', records[2])
+
+	def test_workers(self):
+		lines = [urlString + '\n' for urlString in self.URLS * 20 if urlString]
+		outputs = []
+		for workers in [1, 3]:
+			output = io.StringIO()
+			stream.filter_stream(io.StringIO(''.join(lines)), output, workers=workers, chunkLines=7)
+			outputs.append(output.getvalue())
+		self.assertEqual(outputs[0], outputs[1])
+		self.assertEqual(outputs[0], ''.join(stream.filter_lines(lines)))
+		self.assertEqual(len(outputs[0].splitlines()), len(lines))
+
+
+if __name__ == '__main__':
+	unittest.main()
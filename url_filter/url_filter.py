@@ -1,12 +1,15 @@
 # URL filter for the CLEF-2018 Fact Checking Lab
 
 import sys
+from timeit import default_timer
 if sys.version_info[0] < 3:
 	import urllib2 as urllib
 	import cookielib as cookielib
+	from urlparse import urlsplit
 else:
 	import urllib.request as urllib
 	import http.cookiejar as cookielib
+	from urllib.parse import urlsplit
 
 # Impersonate some real user agent so less network requests fail (URL expansion)
 _USER_AGENT = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
@@ -95,6 +98,80 @@ MATCHERS_SIMPLE = [
 	['factcheck'],
 ]
 
+# Hosts of URL shorteners and redirectors, whose URLs are expanded in the offline-first mode
+# Subdomains of the hosts are expanded too
+SHORTENER_HOSTS = [
+	# General shorteners
+	'bit.ly', 'bitly.com', 'j.mp', 'goo.gl', 't.co', 'tinyurl.com', 'ow.ly', 'buff.ly', 'is.gd', 'v.gd',
+	'tiny.cc', 'cutt.ly', 'rebrand.ly', 'shorturl.at', 'rb.gy', 'bl.ink', 'soo.gd', 'qr.ae', 'po.st',
+	'dlvr.it', 'ift.tt', 'fb.me', 'lnkd.in', 'wp.me', 'trib.al', 'amzn.to', 'flip.it', 'mol.im',
+	# News sites
+	'wapo.st', 'nyti.ms', 'cnn.it', 'politi.co', 'reut.rs', 'apne.ws', 'bbc.in', 'gu.com', 'usat.ly',
+	'abcn.ws', 'cbsn.ws', 'nbcnews.to', 'fxn.ws', 'hill.cm', 'on.wsj.com', 'econ.st', 'bloom.bg', 'aje.io',
+]
+
+# Compiles the rows of a matchers array into an Aho-Corasick automaton over all of their items,
+# so that a single pass over the URL finds every contained item.
+# Returns (transitions, outputs, singleMask, rowMasks): the transitions of each state as a {char: state} dict,
+# the bitmask of the items found on reaching each state, the bitmask of the items making up a row by themselves
+# and the bitmasks of the rows with multiple items (a row matches when all of its bits are found).
+def _compile_matchers(matchers):
+	itemIds = _item_ids(matchers)
+
+	# Trie of the items
+	transitions = [{}]
+	outputs = [0]
+	for item, itemId in itemIds.items():
+		state = 0
+		for char in item:
+			if char not in transitions[state]:
+				transitions.append({})
+				outputs.append(0)
+				transitions[state][char] = len(transitions) - 1
+			state = transitions[state][char]
+		outputs[state] |= 1 << itemId
+
+	# Breadth-first, each state inherits the transitions and the outputs of its failure state,
+	# which turns the trie into a deterministic automaton
+	queue = list(transitions[0].values())
+	failures = [0] * len(transitions)
+	for state in queue:
+		failure = failures[state]
+		outputs[state] |= outputs[failure]
+		children = transitions[state]
+		for char, child in children.items():
+			failures[child] = transitions[failure].get(char, 0)
+			queue.append(child)
+		inherited = dict(transitions[failure])
+		inherited.update(children)
+		transitions[state] = inherited
+
+	singleMask, rowMasks = _row_masks(matchers, itemIds)
+	return transitions, outputs, singleMask, rowMasks
+
+# Numbers the distinct items of the rows in the order of their first occurrence, the bits of the items in the masks
+def _item_ids(matchers):
+	itemIds = {}
+	for row in matchers:
+		for item in row:
+			if item not in itemIds:
+				itemIds[item] = len(itemIds)
+	return itemIds
+
+# Returns (singleMask, rowMasks) of the rows, as _compile_matchers
+def _row_masks(matchers, itemIds):
+	singleMask = 0
+	rowMasks = []
+	for row in matchers:
+		rowMask = 0
+		for item in row:
+			rowMask |= 1 << itemIds[item]
+		if len(row) == 1:
+			singleMask |= rowMask
+		else:
+			rowMasks.append(rowMask)
+	return singleMask, rowMasks
+
 # Makes an HTTP HEAD request to the provied url and then returns the possibly expanded URL from the response
 def _expand_url(url):
 	request = urllib.Request(url)
@@ -105,31 +182,146 @@ def _expand_url(url):
 	response = opener.open(request)
 	return response.geturl()
 
-def _check_matchers(urlString, allMatchers = True):
-	urlLower = urlString.lower()
-	matchers = MATCHERS_ALL if allMatchers else MATCHERS_SIMPLE
-	return any([all([item in urlLower for item in row]) for row in matchers])
+# The matchers are compiled once, call _compile_matchers again after changing them
+_COMPILED_ALL = _compile_matchers(MATCHERS_ALL)
+_COMPILED_SIMPLE = _compile_matchers(MATCHERS_SIMPLE)
 
-def _is_url_bad(urlString, allMatchers = True):
-	if not isinstance(urlString, str):
-		print('Error, the provided parameter is not a string. Cannot determine if it is BAD.')
+def _check_matchers(urlString, allMatchers = True):
+	transitions, outputs, singleMask, rowMasks = _COMPILED_ALL if allMatchers else _COMPILED_SIMPLE
+	state = 0
+	found = 0
+	for char in urlString.lower():
+		state = transitions[state].get(char, 0)
+		found |= outputs[state]
+	if not found:
 		return False
-
-	if _check_matchers(urlString, allMatchers):
+	if found & singleMask:
 		return True
+	for rowMask in rowMasks:
+		if found & rowMask == rowMask:
+			return True
+	return False
+
+# Returns the lower cased host of a URL, also for URLs without a scheme such as "bit.ly/2IA2znR"
+def _get_host(urlString):
+	if '//' not in urlString:
+		urlString = '//' + urlString
+	try:
+		host = urlsplit(urlString.strip()).hostname
+	except ValueError:
+		return ''
+	return host or ''
+
+def _is_shortener(urlString, shortenerHosts = None):
+	host = _get_host(urlString)
+	for shortenerHost in (SHORTENER_HOSTS if shortenerHosts is None else shortenerHosts):
+		if host == shortenerHost or host.endswith('.' + shortenerHost):
+			return True
+	return False
+
+# Metrics of the decisions and of the expansions, a metrics.Metrics, None if they are not collected
+_metrics = None
+
+# Sets the metrics, which are collected from then on; None stops the collection
+def set_metrics(metrics):
+	global _metrics
+	_metrics = metrics
+
+def get_metrics():
+	return _metrics
+
+# Decides whether a URL is BAD and how the decision was made
+# With expandAll the URLs not matching the matchers are always expanded, otherwise only the URLs of shortenerHosts
+# Returns a dict with the keys:
+#   'bad': whether the URL is BAD
+#   'usedNetwork': whether the URL was expanded over the network for the decision
+#   'expandedUrl': the expanded URL, None if not expanded
+#   'error': the error of the expansion (or of the parameter), None if the decision is certain
+#   'cached': whether the expansion (or its error) was taken from the cache
+# The expansions are looked up in and stored to the cache, an expansion_cache.ExpansionCache, if given
+def classify_url(urlString, allMatchers = True, expandAll = False, shortenerHosts = None, cache = None):
+	result, needsExpansion = _classify_offline(urlString, allMatchers, expandAll, shortenerHosts)
+	if not needsExpansion:
+		if _metrics is not None:
+			_metrics.count_decision(1 if allMatchers else 2, 'table' if result['bad'] else 'offline')
+		return result
+	if cache is not None:
+		entry = cache.get(urlString)
+		if entry is not None:
+			_set_cached_expansion(result, entry, allMatchers)
+			if _metrics is not None:
+				_metrics.count_decision(1 if allMatchers else 2, 'cached')
+			return result
+
+	start = default_timer()
 	try:
-		urlExpanded = _expand_url(urlString)
+		expandedUrl = _expand_url(urlString)
 	except:
-		print('Error while expanding URL "' + urlString + '":', str(sys.exc_info()[1]))
+		result['error'] = str(sys.exc_info()[1])
+		if cache is not None:
+			cache.put(urlString, error = result['error'])
+		if _metrics is not None:
+			_metrics.observe_expansion(_get_host(urlString), 'error', default_timer() - start)
+			_metrics.count_decision(1 if allMatchers else 2, 'failed')
+		return result
+	if cache is not None:
+		cache.put(urlString, expandedUrl)
+	if _metrics is not None:
+		_metrics.observe_expansion(_get_host(urlString), 'ok', default_timer() - start)
+		_metrics.count_decision(1 if allMatchers else 2, 'expanded')
+	_set_expanded_url(result, expandedUrl, allMatchers)
+	return result
+
+# The part of classify_url without the network
+# Returns the result dict and whether the URL should be expanded to decide, in which case it is marked as 'usedNetwork'
+def _classify_offline(urlString, allMatchers = True, expandAll = False, shortenerHosts = None):
+	result = {'bad': False, 'usedNetwork': False, 'expandedUrl': None, 'error': None, 'cached': False}
+	if not isinstance(urlString, str):
+		result['error'] = 'The provided parameter is not a string.'
+		return result, False
+
+	if _check_matchers(urlString, allMatchers):
+		result['bad'] = True
+		return result, False
+	if not expandAll and not _is_shortener(urlString, shortenerHosts):
+		return result, False
+	result['usedNetwork'] = True
+	return result, True
+
+def _set_expanded_url(result, expandedUrl, allMatchers = True):
+	result['expandedUrl'] = expandedUrl
+	result['bad'] = _check_matchers(expandedUrl, allMatchers)
+
+def _set_cached_expansion(result, entry, allMatchers = True):
+	result['usedNetwork'] = False
+	result['cached'] = True
+	result['expandedUrl'] = entry['expandedUrl']
+	result['error'] = entry['error']
+	# The matchers are run on the cached expansion, so that the decision follows the current matchers
+	result['bad'] = entry['error'] is None and _check_matchers(entry['expandedUrl'], allMatchers)
+
+def _is_url_bad(urlString, allMatchers = True, expandAll = True, cache = None):
+	result = classify_url(urlString, allMatchers, expandAll, cache = cache)
+	if not isinstance(urlString, str):
+		print('Error, the provided parameter is not a string. Cannot determine if it is BAD.')
+	elif result['error'] is not None:
+		print('Error while expanding URL "' + urlString + '":', result['error'])
 		print('Cannot currently determine if the URL is BAD, examine manually.')
-		return False
-	return _check_matchers(urlExpanded, allMatchers)
+	return result['bad']
+
+# With offlineFirst only the URLs of SHORTENER_HOSTS are expanded, all other URLs are decided without the network
+def is_url_bad_task1(urlString, offlineFirst = False, cache = None):
+	return _is_url_bad(urlString, True, not offlineFirst, cache)
+
+def is_url_bad_task2(urlString, offlineFirst = False, cache = None):
+	return _is_url_bad(urlString, False, not offlineFirst, cache)
 
-def is_url_bad_task1(urlString):
-	return _is_url_bad(urlString)
+# The offline-first decisions, with the details of classify_url
+def classify_url_task1(urlString, shortenerHosts = None, cache = None):
+	return classify_url(urlString, True, False, shortenerHosts, cache)
 
-def is_url_bad_task2(urlString):
-	return _is_url_bad(urlString, False)
+def classify_url_task2(urlString, shortenerHosts = None, cache = None):
+	return classify_url(urlString, False, False, shortenerHosts, cache)
 
 EXAMPLES = [
 	# BAD for both tasks:
@@ -148,7 +340,17 @@ EXAMPLES = [
 ]
 
 if __name__ == '__main__':
+	offlineFirst = '--offline-first' in sys.argv[1:]
+	cache = None
+	if '--cache' in sys.argv[1:]:
+		from expansion_cache import ExpansionCache
+		cache = ExpansionCache()
+	if '--metrics' in sys.argv[1:]:
+		from metrics import Metrics
+		set_metrics(Metrics())
 	for site in EXAMPLES:
-		labelTask1 = 'BAD' if is_url_bad_task1(site) else 'OK '
-		labelTask2 = 'BAD' if is_url_bad_task2(site) else 'OK '
+		labelTask1 = 'BAD' if is_url_bad_task1(site, offlineFirst, cache) else 'OK '
+		labelTask2 = 'BAD' if is_url_bad_task2(site, offlineFirst, cache) else 'OK '
 		print('task1: ' + labelTask1, 'task2: ' + labelTask2, site)
+	if _metrics is not None:
+		print(_metrics.to_json())